@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Pipeline benchmark for Good-GYM Home Assistant Addon
+Runs the service frame path offline over recorded clips
+
+Every combination of clip, inference backend and rtmpose_mode runs in a fresh
+process (so peak RSS and model caches do not leak between runs) through
+GoodGymService.process_frame, with the MQTT broker replaced by an in-process
+stub. Frames are read as fast as the pipeline accepts them; their capture time
+follows the clip timeline, so rep timing rules behave as on a live stream.
+That timeline is not a real read time, so capture-relative numbers (capture
+queueing, glass-to-MQTT latency) are left out of the report. --realtime paces
+the reads at the clip frame rate instead, stamps each frame with its actual
+read time and reports them, like a camera would:
+
+    python benchmark.py clips/squat.mp4 --modes lightweight balanced --output bench.json
+    python benchmark.py clips/squat.mp4 --modes lightweight --realtime
+
+Soak mode replays the clip in a loop for hours (faster than real time, each
+pass reconnecting through RTSPHandler.connect() like a dropped stream) and
+fails when RSS keeps growing after the warm-up:
+
+    python benchmark.py clips/squat.mp4 --modes lightweight --soak 4 --max-growth 16
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+
+import cv2
+
+from memory_monitor import growth_rate
+from metrics import process_stats
+from mqtt_publisher import MQTTPublisher
+
+
+MODES = ('lightweight', 'balanced', 'performance')
+
+
+class StubPublisher(MQTTPublisher):
+    """MQTTPublisher delivering to an in-memory broker
+
+    Payload construction, scheduling and the send queue run unchanged, only
+    the network hand-off is replaced.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.messages: Counter = Counter()
+
+    def connect(self) -> bool:
+        self.is_connected = True
+        self.start_sender()
+        return True
+
+    def disconnect(self, flush_timeout: float = 2.0):
+        deadline = time.time() + flush_timeout
+        while self.queue_depth() > 0 and time.time() < deadline:
+            self.wakeup.set()
+            time.sleep(0.01)
+        self.stop_sender()
+
+    def _publish_now(self, topic: str, payload: str, qos: int, retain: bool) -> bool:
+        self.messages[topic.rsplit('/', 1)[-1]] += 1
+        self.stats['sent'] += 1
+        return True
+
+
+def available_backends() -> List[str]:
+    """Inference backends supported by rtmlib that can be used here"""
+    backends = []
+    for backend, module in (('onnxruntime', 'onnxruntime'), ('openvino', 'openvino')):
+        try:
+            __import__(module)
+            backends.append(backend)
+        except ImportError:
+            pass
+    if hasattr(cv2, 'dnn'):
+        backends.append('opencv')
+    return backends
+
+
+def run_clip(video: str, backend: str, mode: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Benchmark one clip with one backend and mode (runs in a worker process)
+
+    Returns:
+        Result dict: fps, stage latencies, CPU utilization, peak RSS, rep counts
+    """
+    from main import GoodGymService
+
+    class BenchmarkService(GoodGymService):
+        publisher_class = StubPublisher
+
+    # The service reads its configuration from an options.json like the add-on
+    with tempfile.TemporaryDirectory() as temp_dir:
+        config_file = os.path.join(temp_dir, 'options.json')
+        with open(config_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'rtsp_url': video,
+                'mqtt_host': 'benchmark',
+                'mqtt_port': 1883,
+                'mqtt_topic_prefix': 'benchmark/good_gym',
+                'exercise_type': options['exercise_type'],
+                'rtmpose_mode': mode,
+                'frame_skip': options['frame_skip'],
+                'keypoint_prediction': True,
+                'max_persons': options['max_persons'],
+                'max_resolution': options['max_resolution'],
+                'enable_debug': False,
+                'enable_mqtt_discovery': False,
+            }, f)
+
+        load_start = time.time()
+        service = BenchmarkService(config_file=config_file)
+        service.backend = backend
+        service.metrics_log_interval = float('inf')
+        if not service.initialize(connect_stream=False):
+            return {'video': os.path.basename(video), 'backend': backend, 'mode': mode,
+                    'error': 'initialization failed'}
+        service.mqtt_publisher.spool_file = os.path.join(temp_dir, 'spool.jsonl')
+        load_time = time.time() - load_start
+
+        soak_seconds = options.get('soak_seconds', 0)
+        handler = service.rtsp_handler
+        memory = []  # (seconds since start, RSS bytes)
+        next_sample = 0.0
+        frames = passes = 0
+        clip_fps = 25.0
+        realtime = options.get('realtime', False)
+        cpu_start = process_stats()['cpu_seconds']
+        start = time.time()
+        while True:
+            if soak_seconds:
+                # Reopen through the service's own connect() path, like a reconnect
+                if not handler.connect():
+                    break
+                cap = handler.cap
+            else:
+                cap = cv2.VideoCapture(video)
+            clip_fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+            passes += 1
+            pass_frames = 0
+            while options['max_frames'] <= 0 or pass_frames < options['max_frames']:
+                clip_time = start + frames / clip_fps
+                if realtime:
+                    # A camera delivers the frame at its place on the timeline, not earlier
+                    delay = clip_time - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                read_start = time.perf_counter_ns()
+                ret, frame = cap.read()
+                if not ret or frame is None:
+                    break
+                handler.last_decode_ns = time.perf_counter_ns() - read_start
+                service.process_frame(frame, frames + 1, capture_time=time.time() if realtime else clip_time)
+                frames += 1
+                pass_frames += 1
+                if soak_seconds:
+                    now = time.time() - start
+                    if now >= next_sample:
+                        memory.append((now, process_stats()['rss_bytes']))
+                        next_sample += options['soak_sample_interval']
+                        if len(memory) % 20 == 0:
+                            print(f"🧪 Soak {now / 3600:.2f}/{soak_seconds / 3600:g}h: "
+                                  f"RSS {memory[-1][1] / 1024 / 1024:.1f} MB, {passes} passes")
+                    if now >= soak_seconds:
+                        break
+            if not soak_seconds:
+                cap.release()
+                break
+            if time.time() - start >= soak_seconds or pass_frames == 0:
+                break
+        elapsed = time.time() - start
+        cpu_time = process_stats()['cpu_seconds'] - cpu_start
+        if soak_seconds:
+            handler.disconnect()
+        service.mqtt_publisher.disconnect()
+
+        counters = service.exercise_counters or {service.exercise_type: service.exercise_counter}
+        counts = {exercise: counter.counter for exercise, counter in counters.items()}
+        if service.pose_tracker is not None:
+            counts['total_people'] = service.pose_tracker.total_reps()
+        stages = service.metrics.snapshot()['latency']
+        # Capture-relative latency only means something for real read times
+        latency = {
+            'queue': stages.get('queue', {}),
+            **{f'end_to_end_{kind}': histogram.total.snapshot()
+               for kind, histogram in service.mqtt_publisher.end_to_end_latency.items()},
+        } if realtime else None
+
+    return {
+        'video': os.path.basename(video),
+        'backend': backend,
+        'mode': mode,
+        'frames': frames,
+        'processed': service.frame_count,
+        'clip_fps': round(clip_fps, 2),
+        'fps': round(service.frame_count / elapsed, 2) if elapsed > 0 else 0.0,
+        'realtime_factor': round(frames / clip_fps / elapsed, 2) if elapsed > 0 else 0.0,
+        'load_seconds': round(load_time, 2),
+        'cpu_percent': round(100 * cpu_time / elapsed, 1) if elapsed > 0 else 0.0,
+        # ru_maxrss is in KiB on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'stages': {stage: {'p50_ms': h['p50_ms'], 'p99_ms': h['p99_ms']} for stage, h in stages.items()
+                   if stage != 'queue'},
+        'counts': counts,
+        'mqtt_messages': dict(service.mqtt_publisher.messages),
+        **({'latency': latency} if latency else {}),
+        **({'soak': soak_summary(memory, options, passes, frames / clip_fps, handler.get_stats())}
+           if soak_seconds else {}),
+    }
+
+
+def soak_summary(memory: List[tuple], options: Dict[str, Any], passes: int, footage_seconds: float,
+                 rtsp_stats: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Decide whether memory stayed flat during a soak run
+
+    Growth is the median RSS of the last tenth of the samples minus the median of
+    the first tenth after the warm-up, so single spikes do not count.
+
+    Returns:
+        Soak result dict with 'flat' False when growth exceeds max_growth_mb or
+        capture objects were left open
+    """
+    mb = 1024 * 1024
+    settled = [sample for sample in memory if sample[0] >= options['soak_warmup']] or memory
+    window = max(len(settled) // 10, 1)
+    growth = (statistics.median(v for _, v in settled[-window:]) -
+              statistics.median(v for _, v in settled[:window])) / mb if settled else 0.0
+    return {
+        'hours': round(memory[-1][0] / 3600, 2) if memory else 0.0,
+        'footage_hours': round(footage_seconds / 3600, 2),
+        'passes': passes,
+        'rss_start_mb': round(settled[0][1] / mb, 1) if settled else 0.0,
+        'rss_end_mb': round(settled[-1][1] / mb, 1) if settled else 0.0,
+        'growth_mb': round(growth, 1),
+        'growth_mb_per_hour': round(growth_rate(settled) / mb, 2),
+        'captures_created': rtsp_stats['captures_created'],
+        'captures_open': rtsp_stats['captures_open'],
+        'flat': growth <= options['max_growth_mb'] and rtsp_stats['captures_open'] == 0,
+        'samples': [[round(t, 1), round(v / mb, 1)] for t, v in memory],
+    }
+
+
+def print_report(results: List[Dict[str, Any]]):
+    """Print one row per run"""
+    print("\n" + "="*100)
+    print(f"  {'Clip':<20}{'Backend':<13}{'Mode':<13}{'FPS':>7}{'xRT':>6}{'CPU%':>7}{'RSS MB':>8}"
+          f"{'Det p50':>9}{'Pose p50':>10}{'Tot p99':>9}  Counts")
+    print("="*100)
+    for result in results:
+        if 'error' in result:
+            print(f"  {result['video']:<20.20}{result['backend']:<13}{result['mode']:<13}✗ {result['error']}")
+            continue
+        stages = result['stages']
+        counts = ' '.join(f"{k}={v}" for k, v in result['counts'].items())
+        print(f"  {result['video']:<20.20}{result['backend']:<13}{result['mode']:<13}"
+              f"{result['fps']:>7.1f}{result['realtime_factor']:>6.1f}{result['cpu_percent']:>7.0f}"
+              f"{result['peak_rss_mb']:>8.0f}"
+              f"{stages.get('detect', {}).get('p50_ms', 0):>9.1f}{stages.get('pose', {}).get('p50_ms', 0):>10.1f}"
+              f"{stages.get('total', {}).get('p99_ms', 0):>9.1f}  {counts}")
+        latency = result.get('latency')
+        if latency:
+            print(f"    ⏲️  Queue p50/p99 {latency['queue'].get('p50_ms', 0):.1f}/{latency['queue'].get('p99_ms', 0):.1f} ms, "
+                  f"glass-to-MQTT state {latency['end_to_end_state']['p50_ms']:.1f}/"
+                  f"{latency['end_to_end_state']['p99_ms']:.1f} ms")
+        soak = result.get('soak')
+        if soak:
+            print(f"    {'✓' if soak['flat'] else '✗'} Soak {soak['hours']:g}h ({soak['footage_hours']:g}h of footage, "
+                  f"{soak['passes']} passes): RSS {soak['rss_start_mb']:.0f} → {soak['rss_end_mb']:.0f} MB, "
+                  f"growth {soak['growth_mb']:+.1f} MB ({soak['growth_mb_per_hour']:+.2f} MB/h), "
+                  f"captures open {soak['captures_open']}/{soak['captures_created']}")
+    print("="*100 + "\n")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Good-GYM pipeline on recorded clips")
+    parser.add_argument('videos', nargs='+', help="Video files")
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--backends', nargs='+', default=None,
+                        help="Inference backends (default: every available one)")
+    parser.add_argument('--exercise-type', default='squat')
+    parser.add_argument('--frame-skip', type=int, default=1)
+    parser.add_argument('--max-persons', type=int, default=1)
+    parser.add_argument('--max-resolution', type=int, default=640)
+    parser.add_argument('--max-frames', type=int, default=0, help="Frames per clip (0 = whole clip)")
+    parser.add_argument('--output', default=None, help="Optional JSON results file")
+    parser.add_argument('--realtime', action='store_true',
+                        help="Read frames at the clip frame rate and report capture queueing and glass-to-MQTT latency")
+    parser.add_argument('--soak', type=float, default=0.0, help="Replay each clip in a loop for this many hours")
+    parser.add_argument('--soak-warmup', type=float, default=10.0,
+                        help="Minutes excluded from the memory growth check (model and allocator warm-up)")
+    parser.add_argument('--soak-sample-interval', type=float, default=30.0, help="Seconds between RSS samples")
+    parser.add_argument('--max-growth', type=float, default=16.0,
+                        help="Fail the soak when RSS grows by more than this many MB after the warm-up")
+    args = parser.parse_args(argv)
+
+    videos = [video for video in args.videos if os.path.exists(video)]
+    for video in sorted(set(args.videos) - set(videos)):
+        print(f"⚠ Skipping {video}: file not found")
+    if not videos:
+        print("✗ No video files to benchmark")
+        return 1
+    backends = args.backends or available_backends()
+    if not backends:
+        print("✗ No inference backend available (install onnxruntime, openvino or opencv with dnn)")
+        return 1
+    options = {
+        'exercise_type': args.exercise_type,
+        'frame_skip': args.frame_skip,
+        'max_persons': args.max_persons,
+        'max_resolution': args.max_resolution,
+        'max_frames': args.max_frames,
+        'realtime': args.realtime,
+        'soak_seconds': args.soak * 3600,
+        'soak_warmup': args.soak_warmup * 60,
+        'soak_sample_interval': args.soak_sample_interval,
+        'max_growth_mb': args.max_growth,
+    }
+
+    print(f"🏁 Benchmarking {len(videos)} clip(s) x backends {', '.join(backends)} x modes {', '.join(args.modes)}")
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for video in videos:
+        for backend in backends:
+            for mode in args.modes:
+                print(f"▶️  {os.path.basename(video)} / {backend} / {mode}")
+                # A fresh process per run keeps peak RSS and CPU time per combination
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    try:
+                        results.append(executor.submit(run_clip, video, backend, mode, options).result())
+                    except Exception as e:
+                        results.append({'video': os.path.basename(video), 'backend': backend,
+                                        'mode': mode, 'error': str(e)})
+
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'cpu_count': os.cpu_count(),
+                       'options': options, 'results': results}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+
+    failed = [result for result in results if 'error' in result or not result.get('soak', {}).get('flat', True)]
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""
+Startup calibration for Good-GYM Home Assistant Addon
+Picks the most accurate rtmpose_mode and max_resolution that keep up with a target frame rate
+
+Candidates are tried from most to least accurate (performance, balanced,
+lightweight; larger frames first). Each is timed for a short window on a
+frame from the stream, or a synthetic one: resize from the source size,
+person detection and pose estimation on a full-frame box, i.e. the cost of
+a frame with one person in view. A mode is timed at the smallest size
+first and skipped when even that misses the target. The first candidate
+reaching target_fps within max_cpu_share of the usable CPUs is chosen.
+
+Process CPU time also counts threads already running (the capture thread
+decoding the stream). Their rate is sampled once, with no model running,
+before the first candidate is timed and subtracted from every measurement.
+
+Measurements are cached in /data/calibration.json per hardware fingerprint
+(CPU model, usable cores, memory, backend, model files), so calibration runs
+once per device. Changed targets are re-evaluated from the cached
+measurements and only candidates not measured before are timed.
+"""
+import hashlib
+import json
+import logging
+import os
+import platform
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_FILE = '/data/calibration.json'
+
+# Most accurate first
+MODES_BY_ACCURACY = ('performance', 'balanced', 'lightweight')
+RESOLUTIONS = (1280, 960, 640, 480, 320)
+
+# Synthetic frame when no camera frame is available yet (1080p, the most common camera stream)
+SYNTHETIC_SIZE = (1080, 1920)
+
+
+def usable_cpus() -> float:
+    """CPUs this process may use: affinity mask, capped by a cgroup v2 CPU quota (containers)"""
+    try:
+        cpus = float(len(os.sched_getaffinity(0)))
+    except AttributeError:
+        cpus = float(os.cpu_count() or 1)
+    try:
+        with open('/sys/fs/cgroup/cpu.max', 'r') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            cpus = min(cpus, int(quota) / int(period))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def cpu_model() -> str:
+    """CPU model name (x86 'model name', Raspberry Pi 'Model', ...), platform fallback"""
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        for key in ('model name', 'Model', 'Hardware', 'cpu model'):
+            for name, value in fields.items():
+                if name.strip() == key and value.strip():
+                    return value.strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def hardware_fingerprint(backend: str, device: str, models: Sequence[str] = ()) -> Dict[str, Any]:
+    """
+    Properties that change inference speed
+
+    Args:
+        backend: Inference backend (onnxruntime, openvino...)
+        device: Inference device
+        models: Model file names, a new model version needs a new calibration
+    """
+    try:
+        memory_gb = round(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024 ** 3)
+    except (ValueError, OSError, AttributeError):
+        memory_gb = 0
+    return {
+        'machine': platform.machine(),
+        'cpu': cpu_model(),
+        'cpus': usable_cpus(),
+        'memory_gb': memory_gb,
+        'backend': backend,
+        'device': device,
+        'models': sorted(models),
+    }
+
+
+class Calibrator:
+    """Times model mode / frame size candidates and picks one for a target frame rate"""
+
+    def __init__(self, build_model: Callable[[str], Any], fingerprint: Dict[str, Any],
+                 target_fps: float = 10.0, max_cpu_share: float = 0.5, max_resolution: int = 640,
+                 cache_file: str = DEFAULT_CACHE_FILE, seconds: float = 1.5):
+        """
+        Initialize calibrator
+
+        Args:
+            build_model: Creates the inference model of a mode (with det_model and pose_model)
+            fingerprint: Hardware fingerprint (see hardware_fingerprint), the cache key
+            target_fps: Processed frames per second the pipeline must sustain
+            max_cpu_share: Share of the usable CPUs the pipeline may use at target_fps (0-1)
+            max_resolution: Largest frame width considered (the configured max_resolution)
+            cache_file: Measurements per fingerprint
+            seconds: Timing window per candidate
+        """
+        self.build_model = build_model
+        self.fingerprint = fingerprint
+        self.key = hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()[:16]
+        self.target_fps = target_fps
+        self.max_cpu_share = max_cpu_share
+        self.resolutions = [max_resolution] + [r for r in RESOLUTIONS if r < max_resolution]
+        self.cache_file = cache_file
+        self.seconds = seconds
+        self.measurements: Dict[str, Dict[str, float]] = {}
+        self.measured = 0
+        self.get_frame: Optional[Callable[[], Optional[np.ndarray]]] = None
+        self.frame: Optional[np.ndarray] = None
+        self.frame_source = 'synthetic'
+        # Process CPU seconds per second used by other threads (capture decoding), sampled before timing
+        self.background_cpu: Optional[float] = None
+
+    def calibrate(self, get_frame: Optional[Callable[[], Optional[np.ndarray]]] = None) -> Dict[str, Any]:
+        """
+        Pick mode and resolution, timing only candidates without a cached measurement
+
+        Args:
+            get_frame: Returns the latest camera frame, or None (a synthetic frame is used)
+
+        Returns:
+            Dict with mode, max_resolution, fps, cpu_share, meets_target, measured
+            (candidates timed now) and frame (camera or synthetic)
+        """
+        start = time.monotonic()
+        self.measurements = self._load_cache()
+        self.measured = 0
+        self.get_frame = get_frame
+        self.background_cpu = None
+
+        choice = None
+        for mode in MODES_BY_ACCURACY:
+            model = None
+            try:
+                # Smallest frame first: if the mode cannot keep up there, it cannot anywhere
+                smallest = self.resolutions[-1]
+                result, model = self._measurement(mode, smallest, model)
+                if not self.meets(result):
+                    continue
+                for resolution in self.resolutions[:-1]:
+                    result, model = self._measurement(mode, resolution, model)
+                    if self.meets(result):
+                        choice = (mode, resolution)
+                        break
+                else:
+                    choice = (mode, smallest)
+                break
+            finally:
+                del model
+
+        meets_target = choice is not None
+        if choice is None:
+            # Nothing keeps up: the fastest candidate measured
+            candidates = [self._name(mode, resolution) for mode in MODES_BY_ACCURACY for resolution in self.resolutions]
+            name = max((n for n in candidates if n in self.measurements), key=lambda n: self.measurements[n]['fps'])
+            mode, resolution = name.split('@')
+            choice = (mode, int(resolution))
+            logger.warning("⚠ No configuration reaches %.1f fps within %.0f%% CPU, using the fastest (%s)",
+                           self.target_fps, self.max_cpu_share * 100, name)
+
+        if self.measured:
+            self._save_cache()
+        result = self.measurements[self._name(*choice)]
+        return {
+            'mode': choice[0],
+            'max_resolution': choice[1],
+            'fps': round(result['fps'], 1),
+            'cpu_share': round(self.cpu_share(result), 3),
+            'meets_target': meets_target,
+            'measured': self.measured,
+            'frame': self.frame_source if self.measured else 'cached',
+            'seconds': round(time.monotonic() - start, 2),
+        }
+
+    def meets(self, result: Dict[str, float]) -> bool:
+        """Whether a measurement reaches the target frame rate within the CPU share"""
+        return result['fps'] >= self.target_fps and self.cpu_share(result) <= self.max_cpu_share
+
+    def cpu_share(self, result: Dict[str, float]) -> float:
+        """Share of the usable CPUs needed at the target frame rate"""
+        return result['cpu_per_frame'] * self.target_fps / max(self.fingerprint.get('cpus', 1), 0.1)
+
+    @staticmethod
+    def _name(mode: str, resolution: int) -> str:
+        return f"{mode}@{resolution}"
+
+    def _measurement(self, mode: str, resolution: int, model) -> Tuple[Dict[str, float], Any]:
+        """Cached or new measurement of a candidate (builds the mode's model on first need)"""
+        name = self._name(mode, resolution)
+        if name not in self.measurements:
+            if model is None:
+                model = self.build_model(mode)
+            self.measurements[name] = self.measure(model, resolution)
+            self.measured += 1
+            result = self.measurements[name]
+            logger.info("📐 Calibration %s: %.1f fps, %.0f%% CPU at %.1f fps%s", name, result['fps'],
+                        self.cpu_share(result) * 100, self.target_fps, "" if self.meets(result) else " (too slow)")
+        return self.measurements[name], model
+
+    def measure(self, model, resolution: int) -> Dict[str, float]:
+        """
+        Time one candidate
+
+        Returns:
+            Dict with fps (sustained, one frame at a time), cpu_per_frame (process
+            CPU seconds of all inference threads, background CPU subtracted) and
+            frames timed
+        """
+        frame = self._source_frame()
+        if self.background_cpu is None:
+            self.background_cpu = self._background_cpu_rate()
+        # Two untimed frames: first-run allocations and session setup
+        for _ in range(2):
+            self._run(model, frame, resolution)
+
+        frames = 0
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        while True:
+            self._run(model, frame, resolution)
+            frames += 1
+            elapsed = time.perf_counter() - wall_start
+            if elapsed >= self.seconds and frames >= 3:
+                break
+            # Clearly too slow: no need to wait for the full window
+            if elapsed / frames > 2.0 / self.target_fps and elapsed >= self.seconds / 3:
+                break
+        cpu = time.process_time() - cpu_start - self.background_cpu * elapsed
+        return {
+            'fps': frames / elapsed,
+            'cpu_per_frame': max(cpu, 0.0) / frames,
+            'frames': frames,
+        }
+
+    def _background_cpu_rate(self) -> float:
+        """Process CPU seconds per second while no model runs (a third of the timing window)"""
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        time.sleep(self.seconds / 3)
+        rate = (time.process_time() - cpu_start) / (time.perf_counter() - wall_start)
+        if rate >= 0.05:
+            logger.info("📐 Calibration: %.0f%% of a CPU used by other threads, subtracted", rate * 100)
+        return rate
+
+    @staticmethod
+    def _run(model, frame: np.ndarray, resolution: int):
+        """One frame as process_frame would do it, with one person in view"""
+        h, w = frame.shape[:2]
+        if w > resolution:
+            frame = cv2.resize(frame, (resolution, int(h * resolution / w)))
+        det_model = getattr(model, 'det_model', None)
+        pose_model = getattr(model, 'pose_model', None)
+        if det_model is None or pose_model is None:
+            model(frame)
+            return
+        h, w = frame.shape[:2]
+        det_model(frame)
+        pose_model(frame, bboxes=[[0, 0, w, h]])
+
+    def _source_frame(self) -> np.ndarray:
+        """Camera frame if one arrived, else a synthetic 1080p frame (fixed for the whole run)"""
+        if self.frame is None:
+            frame = self.get_frame() if self.get_frame is not None else None
+            if frame is not None:
+                self.frame, self.frame_source = frame, 'camera'
+            else:
+                self.frame = np.random.default_rng(0).integers(0, 256, (*SYNTHETIC_SIZE, 3), dtype=np.uint8)
+        return self.frame
+
+    def _load_cache(self) -> Dict[str, Dict[str, float]]:
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                entry = json.load(f).get('devices', {}).get(self.key)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("⚠ Ignoring unreadable %s (%s)", self.cache_file, e)
+            return {}
+        return dict(entry['measurements']) if entry else {}
+
+    def _save_cache(self):
+        """Store this device's measurements, keeping other devices' entries (atomic rewrite)"""
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        devices = cache.setdefault('devices', {})
+        devices[self.key] = {
+            'fingerprint': self.fingerprint,
+            'updated': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'measurements': self.measurements,
+        }
+        cache['version'] = 1
+        temporary = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, indent=2, sort_keys=True)
+            os.replace(temporary, self.cache_file)
+        except OSError as e:
+            logger.warning("⚠ Could not write %s: %s", self.cache_file, e)
+
+    def summary(self) -> List[str]:
+        """Measured candidates in accuracy order (formatted lines)"""
+        lines = []
+        for mode in MODES_BY_ACCURACY:
+            for resolution in self.resolutions:
+                result = self.measurements.get(self._name(mode, resolution))
+                if result is not None:
+                    lines.append(f"   {self._name(mode, resolution):<18} {result['fps']:>6.1f} fps "
+                                 f"{self.cpu_share(result) * 100:>5.0f}% CPU{'' if self.meets(result) else '  ✗'}")
+        return lines
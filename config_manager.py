@@ -5,7 +5,9 @@ Handles reading and validating addon configuration
 import json
 import os
 import sys
-from typing import Dict, Any
+from typing import Dict, Any, List
+
+from exercise_registry import get_registry
 
 
 class ConfigManager:
@@ -50,6 +52,22 @@ class ConfigManager:
             'rtmpose_mode': os.getenv('RTMPOSE_MODE', 'lightweight'),  # lightweight, balanced, or performance
             'reconnect_interval': int(os.getenv('RECONNECT_INTERVAL', '5')),
             'frame_skip': int(os.getenv('FRAME_SKIP', '1')),  # Process every N frames
+            'max_resolution': int(os.getenv('MAX_RESOLUTION', '640')),  # Frame width processed
+            'auto_calibrate': os.getenv('AUTO_CALIBRATE', 'false').lower() == 'true',  # Pick mode/resolution at startup
+            'target_fps': float(os.getenv('TARGET_FPS', '10')),  # Processed frames per second to sustain
+            'max_cpu_share': float(os.getenv('MAX_CPU_SHARE', '0.5')),  # Share of the CPUs at target_fps
+            'keypoint_prediction': os.getenv('KEYPOINT_PREDICTION', 'true').lower() == 'true',
+            'auto_exercises': os.getenv('AUTO_EXERCISES', ''),  # Comma separated, used with exercise_type 'auto'
+            'max_persons': int(os.getenv('MAX_PERSONS', '1')),  # People counted at once
+            'publish_heartbeat': int(os.getenv('PUBLISH_HEARTBEAT', '30')),  # Seconds between unchanged states
+            'keypoint_topic_rate': float(os.getenv('KEYPOINT_TOPIC_RATE', '0')),  # Hz, 0 = off
+            'publish_latency': os.getenv('PUBLISH_LATENCY', 'false').lower() == 'true',  # latency_ms in state payloads
+            'pose_server_port': int(os.getenv('POSE_SERVER_PORT', '0')),  # Localhost pose endpoint, 0 = off
+            'metrics_port': int(os.getenv('METRICS_PORT', '0')),  # Prometheus /metrics endpoint, 0 = off
+            'memory_log_interval': int(os.getenv('MEMORY_LOG_INTERVAL', '300')),  # Seconds between memory reports, 0 = off
+            'memory_tracing': os.getenv('MEMORY_TRACING', 'false').lower() == 'true',  # tracemalloc growth diffs
+            'log_level': os.getenv('LOG_LEVEL', 'info'),  # debug, info, warning or error
+            'log_format': os.getenv('LOG_FORMAT', 'text'),  # text or json (one object per line)
         }
         return config
     
@@ -61,17 +79,26 @@ class ConfigManager:
             if not self.config.get(param):
                 raise ValueError(f"Missing required configuration parameter: {param}")
         
-        # Validate exercise type
-        valid_exercises = [
-            'squat', 'pushup', 'situp', 'bicep_curl', 'lateral_raise',
-            'overhead_press', 'leg_raise', 'knee_raise', 'knee_press', 'crunch'
-        ]
-        if self.config['exercise_type'] not in valid_exercises:
+        # Validate exercise type against the exercises defined in exercises.json
+        valid_exercises = get_registry().names()
+        if self.config['exercise_type'] not in valid_exercises + ['auto']:
             raise ValueError(
                 f"Invalid exercise_type: {self.config['exercise_type']}. "
-                f"Valid options: {', '.join(valid_exercises)}"
+                f"Valid options: {', '.join(valid_exercises + ['auto'])}"
             )
         
+        # Validate auto detection candidates
+        for exercise in self._parse_list(self.config.get('auto_exercises', '')):
+            if exercise not in valid_exercises:
+                raise ValueError(
+                    f"Invalid exercise in auto_exercises: {exercise}. "
+                    f"Valid options: {', '.join(valid_exercises)}"
+                )
+        
+        # Multi-person tracking counts one fixed exercise per person
+        if self.config.get('max_persons', 1) > 1 and self.config['exercise_type'] == 'auto':
+            raise ValueError("max_persons > 1 is not supported with exercise_type 'auto'")
+        
         # Validate RTMPose mode
         valid_modes = ['lightweight', 'balanced', 'performance']
         if self.config.get('rtmpose_mode', 'lightweight') not in valid_modes:
@@ -81,6 +108,13 @@ class ConfigManager:
         
         print("✓ Configuration validated successfully")
     
+    @staticmethod
+    def _parse_list(value: Any) -> List[str]:
+        """Parse a comma separated string (or list) into a list of names"""
+        if isinstance(value, list):
+            return [str(v).strip() for v in value if str(v).strip()]
+        return [v.strip() for v in str(value or '').split(',') if v.strip()]
+    
     def get(self, key: str, default: Any = None) -> Any:
         """Get configuration value by key"""
         return self.config.get(key, default)
@@ -93,6 +127,9 @@ class ConfigManager:
             'username': self.config.get('mqtt_user', ''),
             'password': self.config.get('mqtt_password', ''),
             'topic_prefix': self.config.get('mqtt_topic_prefix', 'homeassistant/sensor/good_gym'),
+            'heartbeat': self.config.get('publish_heartbeat', 30),
+            'keypoint_rate': self.config.get('keypoint_topic_rate', 0),
+            'publish_latency': self.config.get('publish_latency', False),
         }
     
     def get_rtsp_config(self) -> Dict[str, Any]:
@@ -109,6 +146,13 @@ class ConfigManager:
             'detection_interval': self.config.get('detection_interval', 0.1),
             'rtmpose_mode': self.config.get('rtmpose_mode', 'lightweight'),
             'frame_skip': self.config.get('frame_skip', 1),
+            'max_resolution': self.config.get('max_resolution', 640),
+            'auto_calibrate': self.config.get('auto_calibrate', False),
+            'target_fps': self.config.get('target_fps', 10),
+            'max_cpu_share': self.config.get('max_cpu_share', 0.5),
+            'keypoint_prediction': self.config.get('keypoint_prediction', True),
+            'auto_exercises': self._parse_list(self.config.get('auto_exercises', '')),
+            'max_persons': self.config.get('max_persons', 1),
             'enable_debug': self.config.get('enable_debug', False),
         }
     
@@ -0,0 +1,203 @@
+import logging
+import numpy as np
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class ExerciseClassifier:
+    """Lightweight exercise classifier over a sliding window of keypoints
+
+    Uses the same signals the counter computes (one per distinct counting
+    strategy in the exercise registry) plus the torso orientation, so it adds
+    no model inference. Every candidate exercise is scored on how well the observed range
+    of motion matches its down/up thresholds, whether the body posture matches
+    and whether left/right move together (bilateral) or alternate (leg exercises).
+    A switch requires the same winner on several consecutive evaluations.
+    """
+
+    def __init__(self, registry, candidates, window_seconds=3.0, eval_interval=0.5,
+                 switch_votes=3, min_score=0.6, switch_margin=0.15):
+        """
+        Args:
+            registry: ExerciseRegistry with the exercise configurations and strategies
+            candidates: Exercise types to choose from
+            window_seconds: Length of the sliding window
+            eval_interval: Seconds between two classifications
+            switch_votes: Consecutive wins required before switching exercise
+            min_score: Minimum score for an exercise to be considered active
+            switch_margin: Score margin the challenger needs over the current exercise
+        """
+        exercise_configs = registry.configs
+        self.candidates = [c for c in candidates if c in exercise_configs]
+        self.window_seconds = window_seconds
+        self.eval_interval = eval_interval
+        self.switch_votes = switch_votes
+        self.min_score = min_score
+        self.switch_margin = switch_margin
+
+        # Distinct signals: exercises sharing keypoints (squat/knee_raise...) share one
+        self.features = []
+        self.feature_index = {}
+        signatures = []
+        for exercise_type in self.candidates:
+            strategy = registry.strategy(exercise_type)
+            if strategy.signature not in signatures:
+                signatures.append(strategy.signature)
+                self.features.append(strategy)
+            self.feature_index[exercise_type] = signatures.index(strategy.signature)
+
+        self.profiles = {}
+        for exercise_type in self.candidates:
+            config = exercise_configs[exercise_type]
+            low, high = sorted((config['down_angle'], config['up_angle']))
+            self.profiles[exercise_type] = {
+                'low': low,
+                'high': high,
+                'posture': config.get('posture'),
+                'is_leg_exercise': config.get('is_leg_exercise', False),
+            }
+
+        self.history = deque()
+        self.current = None
+        self.challenger = None
+        self.challenger_votes = 0
+        self.last_eval_time = None
+        self.last_scores = {}
+
+    def reset(self):
+        """Forget the window and the current exercise"""
+        self.history.clear()
+        self.current = None
+        self.challenger = None
+        self.challenger_votes = 0
+        self.last_eval_time = None
+        self.last_scores = {}
+
+    def compute_features(self, keypoints):
+        """
+        Compute per-frame features
+
+        Returns:
+            Tuple (left signals, right signals, torso tilt in degrees from vertical);
+            NaN where keypoints are missing
+        """
+        points = np.asarray(keypoints, dtype=np.float64)
+        missing_points = ~np.any(points, axis=1)
+        left = np.full(len(self.features), np.nan)
+        right = np.full(len(self.features), np.nan)
+        for i, strategy in enumerate(self.features):
+            if missing_points[strategy.keypoint_indices].any():
+                continue
+            l_value, r_value = strategy.compute_batch(points[None])
+            left[i], right[i] = l_value[0], r_value[0]
+
+        # Torso: shoulder midpoint to hip midpoint
+        torso = np.nan
+        if np.all(np.any(points[[5, 6, 11, 12]], axis=1)):
+            dx, dy = (points[5] + points[6]) / 2 - (points[11] + points[12]) / 2
+            torso = np.degrees(np.arctan2(abs(dx), abs(dy)))
+
+        return left, right, torso
+
+    def update(self, keypoints, timestamp):
+        """
+        Add a frame and return the exercise currently being performed
+
+        Returns:
+            Exercise type, or None until an exercise has been recognised
+        """
+        if not self.candidates:
+            return None
+        if len(self.candidates) == 1:
+            return self.candidates[0]
+
+        self.history.append((timestamp,) + self.compute_features(keypoints))
+        while self.history and timestamp - self.history[0][0] > self.window_seconds:
+            self.history.popleft()
+
+        if self.last_eval_time is not None and timestamp - self.last_eval_time < self.eval_interval:
+            return self.current
+        self.last_eval_time = timestamp
+
+        # Need most of a window before deciding
+        if timestamp - self.history[0][0] < self.window_seconds * 0.6:
+            return self.current
+
+        scores = self.score_window()
+        self.last_scores = scores
+        best = max(scores, key=scores.get)
+        best_score = scores[best]
+        current_score = scores.get(self.current, 0.0)
+
+        if (best == self.current or best_score < self.min_score
+                or best_score < current_score + self.switch_margin):
+            self.challenger = None
+            self.challenger_votes = 0
+            return self.current
+
+        if best == self.challenger:
+            self.challenger_votes += 1
+        else:
+            self.challenger = best
+            self.challenger_votes = 1
+
+        if self.current is None or self.challenger_votes >= self.switch_votes:
+            logger.info("🔀 Exercise detected: %s (score %.2f)", best, best_score)
+            self.current = best
+            self.challenger = None
+            self.challenger_votes = 0
+
+        return self.current
+
+    def score_window(self):
+        """Score every candidate exercise over the current window"""
+        left = np.array([h[1] for h in self.history])
+        right = np.array([h[2] for h in self.history])
+        torso = np.array([h[3] for h in self.history])
+
+        tilt = np.nanmedian(torso) if np.any(~np.isnan(torso)) else np.nan
+        scores = {}
+        for exercise_type in self.candidates:
+            profile = self.profiles[exercise_type]
+            index = self.feature_index[exercise_type]
+            l_series, r_series = left[:, index], right[:, index]
+            valid = ~(np.isnan(l_series) | np.isnan(r_series))
+            if valid.sum() < 5:
+                scores[exercise_type] = 0.0
+                continue
+            l_series, r_series = l_series[valid], r_series[valid]
+
+            # Leg exercises move one side at a time, so look at either side
+            if profile['is_leg_exercise']:
+                series = np.concatenate([l_series, r_series])
+            else:
+                series = (l_series + r_series) / 2
+
+            # How much of the threshold band the motion sweeps, penalising motions
+            # far wider than the band (lateral raise vs overhead press)
+            observed_low, observed_high = np.percentile(series, [5, 95])
+            band = profile['high'] - profile['low']
+            observed = observed_high - observed_low
+            covered = max(0.0, min(observed_high, profile['high']) - max(observed_low, profile['low']))
+            score = covered / band if band > 0 else 0.0
+            if observed > 2 * band:
+                score *= 2 * band / observed
+
+            # Bilateral exercises: sides correlate; leg exercises: sides alternate
+            if np.std(l_series) > 1e-6 and np.std(r_series) > 1e-6:
+                correlation = float(np.corrcoef(l_series, r_series)[0, 1])
+                if profile['is_leg_exercise']:
+                    score *= 1.0 - 0.5 * max(correlation, 0.0)
+                else:
+                    score *= 0.5 + 0.5 * max(correlation, 0.0)
+
+            # Posture: upright (torso near vertical) or lying (near horizontal)
+            if profile['posture'] and not np.isnan(tilt):
+                upright = tilt < 45
+                if (profile['posture'] == 'upright') != upright:
+                    score *= 0.3
+
+            scores[exercise_type] = float(score)
+
+        return scores
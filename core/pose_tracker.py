@@ -0,0 +1,222 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def linear_assignment(cost):
+    """Minimum-cost assignment for a (rows, cols) cost matrix (Hungarian algorithm)
+
+    Small dependency-free O(n^3) implementation, plenty fast for the handful of
+    people in front of one camera.
+
+    Returns:
+        Tuple (row indices, column indices) of the assigned pairs
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    rows, cols = cost.shape
+    if rows == 0 or cols == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    transposed = rows > cols
+    if transposed:
+        cost = cost.T
+        rows, cols = cols, rows
+
+    # Potentials and matching, 1-based with a virtual column 0
+    u = np.zeros(rows + 1)
+    v = np.zeros(cols + 1)
+    match = np.zeros(cols + 1, dtype=int)  # match[col] = row
+    way = np.zeros(cols + 1, dtype=int)
+
+    for row in range(1, rows + 1):
+        match[0] = row
+        col0 = 0
+        min_value = np.full(cols + 1, np.inf)
+        used = np.zeros(cols + 1, dtype=bool)
+        while True:
+            used[col0] = True
+            row0 = match[col0]
+            free = ~used[1:]
+            reduced = cost[row0 - 1] - u[row0] - v[1:]
+            improve = free & (reduced < min_value[1:])
+            min_value[1:][improve] = reduced[improve]
+            way[1:][improve] = col0
+            candidates = np.where(free, min_value[1:], np.inf)
+            col1 = int(np.argmin(candidates)) + 1
+            delta = candidates[col1 - 1]
+            u[match[used]] += delta
+            v[used] -= delta
+            min_value[1:][free] -= delta
+            col0 = col1
+            if match[col0] == 0:
+                break
+        while col0:
+            col1 = way[col0]
+            match[col0] = match[col1]
+            col0 = col1
+
+    assigned_cols = np.flatnonzero(match[1:]) + 1
+    row_ind = match[assigned_cols] - 1
+    col_ind = assigned_cols - 1
+    if transposed:
+        row_ind, col_ind = col_ind, row_ind
+    order = np.argsort(row_ind)
+    return row_ind[order], col_ind[order]
+
+
+class Track:
+    """One tracked person with its own counter state"""
+
+    __slots__ = ('track_id', 'slot', 'keypoints', 'bbox', 'last_seen', 'hits', 'counter', 'angle', 'detection')
+
+    def __init__(self, track_id, slot, keypoints, bbox, timestamp, counter):
+        self.track_id = track_id
+        self.slot = slot  # Stable person number (1..max_tracks) used for MQTT sensors
+        self.keypoints = keypoints
+        self.bbox = bbox
+        self.last_seen = timestamp
+        self.hits = 1
+        self.counter = counter
+        self.angle = None
+        self.detection = None  # Index of the matched detection in the last update
+
+
+class PoseTracker:
+    """Associates pose detections across frames and keeps one counter per person
+
+    The cost between every track and detection combines bounding-box IoU and the
+    normalised distance between jointly visible keypoints, computed as vectorized
+    (tracks x detections) matrices and solved with linear_assignment. Tracks not
+    seen for max_age seconds are evicted and their reps added to the session total.
+    """
+
+    def __init__(self, counter_factory, max_tracks=6, max_age=2.0, iou_weight=0.5, max_cost=0.75):
+        """
+        Args:
+            counter_factory: Callable returning a new ExerciseCounter for a track
+            max_tracks: Maximum number of people tracked at once
+            max_age: Seconds without a matching detection before a track is evicted
+            iou_weight: Weight of (1 - IoU) in the cost, the rest is keypoint distance
+            max_cost: Assignments above this cost start a new track instead
+        """
+        self.counter_factory = counter_factory
+        self.max_tracks = max_tracks
+        self.max_age = max_age
+        self.iou_weight = iou_weight
+        self.max_cost = max_cost
+        self.tracks = []
+        self.next_id = 1
+        self.departed_reps = 0
+
+    @staticmethod
+    def bounding_boxes(keypoints):
+        """Bounding boxes (n, 4) as x1, y1, x2, y2 over the visible keypoints of (n, 17, 2)"""
+        visible = np.any(keypoints != 0, axis=2)
+        masked_min = np.where(visible[..., None], keypoints, np.inf).min(axis=1)
+        masked_max = np.where(visible[..., None], keypoints, -np.inf).max(axis=1)
+        boxes = np.concatenate([masked_min, masked_max], axis=1)
+        boxes[~visible.any(axis=1)] = 0
+        return boxes
+
+    def cost_matrix(self, keypoints, boxes):
+        """Combined IoU / keypoint-distance cost, shape (tracks, detections)"""
+        track_boxes = np.array([t.bbox for t in self.tracks])
+        track_points = np.array([t.keypoints for t in self.tracks])
+
+        # IoU
+        x1 = np.maximum(track_boxes[:, None, 0], boxes[None, :, 0])
+        y1 = np.maximum(track_boxes[:, None, 1], boxes[None, :, 1])
+        x2 = np.minimum(track_boxes[:, None, 2], boxes[None, :, 2])
+        y2 = np.minimum(track_boxes[:, None, 3], boxes[None, :, 3])
+        intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        track_area = (track_boxes[:, 2] - track_boxes[:, 0]) * (track_boxes[:, 3] - track_boxes[:, 1])
+        det_area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        union = track_area[:, None] + det_area[None, :] - intersection
+        iou = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+        # Mean keypoint distance over jointly visible keypoints, relative to track size
+        both_visible = (np.any(track_points != 0, axis=2)[:, None, :]
+                        & np.any(keypoints != 0, axis=2)[None, :, :])
+        distances = np.linalg.norm(track_points[:, None] - keypoints[None], axis=3)
+        shared = both_visible.sum(axis=2)
+        mean_distance = np.divide((distances * both_visible).sum(axis=2), shared,
+                                  out=np.full(shared.shape, np.inf), where=shared > 0)
+        scale = np.hypot(track_boxes[:, 2] - track_boxes[:, 0], track_boxes[:, 3] - track_boxes[:, 1])
+        keypoint_cost = np.minimum(mean_distance / np.maximum(scale, 1.0)[:, None], 1.0)
+
+        return self.iou_weight * (1.0 - iou) + (1.0 - self.iou_weight) * keypoint_cost
+
+    def update(self, keypoints, timestamp):
+        """
+        Match detections to tracks, start new tracks and evict stale ones
+
+        Args:
+            keypoints: Detected keypoints (n, 17, 2), (0, 0) for low-confidence points
+            timestamp: Frame time in seconds
+
+        Returns:
+            List of (track, detection keypoints) for the tracks matched this frame;
+            track.detection is the index of the detection in the keypoints argument
+        """
+        keypoints = np.asarray(keypoints, dtype=np.float64).reshape(-1, 17, 2)
+        boxes = self.bounding_boxes(keypoints)
+        detections = np.flatnonzero(np.any(boxes != 0, axis=1))
+        keypoints, boxes = keypoints[detections], boxes[detections]
+
+        matched = []
+        unmatched = set(range(len(keypoints)))
+        if self.tracks and len(keypoints):
+            cost = self.cost_matrix(keypoints, boxes)
+            for row, col in zip(*linear_assignment(cost)):
+                if cost[row, col] > self.max_cost:
+                    continue
+                track = self.tracks[row]
+                track.keypoints = keypoints[col]
+                track.bbox = boxes[col]
+                track.last_seen = timestamp
+                track.hits += 1
+                track.detection = int(detections[col])
+                matched.append((track, keypoints[col]))
+                unmatched.discard(col)
+
+        self.evict(timestamp)
+
+        # Largest unmatched detections first, while there are free slots
+        for col in sorted(unmatched, key=lambda c: -self._area(boxes[c])):
+            if len(self.tracks) >= self.max_tracks:
+                break
+            used_slots = {t.slot for t in self.tracks}
+            slot = next(s for s in range(1, self.max_tracks + 1) if s not in used_slots)
+            track = Track(self.next_id, slot, keypoints[col], boxes[col], timestamp, self.counter_factory())
+            track.detection = int(detections[col])
+            self.next_id += 1
+            self.tracks.append(track)
+            matched.append((track, keypoints[col]))
+
+        matched.sort(key=lambda item: item[0].slot)
+        return matched
+
+    def evict(self, timestamp):
+        """Drop tracks not seen for max_age seconds"""
+        kept = []
+        for track in self.tracks:
+            if timestamp - track.last_seen > self.max_age:
+                self.departed_reps += track.counter.counter
+                logger.info("👋 Person %s left (%s reps)", track.slot, track.counter.counter)
+            else:
+                kept.append(track)
+        self.tracks = kept
+
+    def total_reps(self):
+        """Reps of all people in this session, including people who left"""
+        return self.departed_reps + sum(t.counter.counter for t in self.tracks)
+
+    def reset(self):
+        """Drop all tracks and the session total"""
+        self.tracks = []
+        self.departed_reps = 0
+
+    @staticmethod
+    def _area(box):
+        return (box[2] - box[0]) * (box[3] - box[1])
@@ -1,30 +1,90 @@
 import os
 import cv2
 import sys
+import logging
 import numpy as np
-import json
-from rtmlib import Wholebody, draw_skeleton
+import time
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def create_model(model_store, mode='balanced', backend='onnxruntime', device='cpu'):
+    """
+    Create the rtmlib inference sessions of a mode from verified local model files
+    
+    Args:
+        model_store: model_store.ModelStore providing the files (downloads missing ones)
+        mode: RTMPose mode
+        backend: Inference backend
+        device: Inference device
+    
+    Returns:
+        rtmlib Wholebody (det_model + pose_model)
+    """
+    # Imported here: rtmlib pulls in onnxruntime, which dominates import time
+    from rtmlib import Wholebody
+    # Local files only: rtmlib never fetches its own copies
+    files = model_store.resolve(mode)
+    return Wholebody(
+        det=files['det'],
+        det_input_size=files['det_input_size'],
+        pose=files['pose'],
+        pose_input_size=files['pose_input_size'],
+        backend=backend,
+        device=device
+    )
+
 
 class RTMPoseProcessor:
     """RTMPose pose detection processor"""
     
-    def __init__(self, exercise_counter, mode='balanced', backend='onnxruntime', device='cpu'):
+    def __init__(self, exercise_counter, mode='balanced', backend='onnxruntime', device='cpu', model_store=None):
         self.exercise_counter = exercise_counter
+        # Verified model files (model_store.ModelStore), created on first use if not given
+        self.model_store = model_store
         self.show_skeleton = True
         self.conf_threshold = 0.5
         self.device = device
         self.backend = backend
         
+        # Optional predictor that reconstructs frames skipped by frame_skip
+        self.keypoint_predictor = None
+        self.interpolated_reps = 0
+        
+        # Optional automatic exercise detection, routing frames to one counter per exercise
+        self.exercise_classifier = None
+        self.exercise_counters = {}
+        self.active_exercise = None
+        
+        # Optional multi-person tracking, one counter per tracked person
+        self.pose_tracker = None
+        
+        # Pose of the last frame for raw keypoint streaming: list of
+        # (person slot, keypoints (17, 2), scores (17,) or None) and the frame size
+        self.last_pose = []
+        self.last_pose_size = (0, 0)
+        
+        # Stage durations of the last frame in ns (preprocess, detect, pose)
+        self.last_timings = {}
+        
+        # Model hot-swap: each frame takes a local reference to the active model,
+        # so a replaced model is freed once the last frame using it returns
+        self.model_lock = threading.Lock()
+        self.swap_thread = None
+        self.last_frame_shape = (480, 640, 3)
+        
         # Initialize RTMPose model
         self.init_rtmpose(mode)
+        self.mode = mode
         
         self.keypoint_mapping = self.get_keypoint_mapping()
         
-        # Load exercise configurations for angle points
-        self.exercise_configs = self.load_exercise_configs()
+        # Exercise configurations (angle points), shared with the counter
+        self.exercise_configs = exercise_counter.registry.configs
     
     def get_models_dir(self):
-        """Get model file directory, compatible with development and packaged environments"""
+        """Get bundled model file directory, compatible with development and packaged environments"""
         if getattr(sys, 'frozen', False):
             # Packaged environment, model files are in temp directory
             base_path = sys._MEIPASS
@@ -37,52 +97,26 @@ class RTMPoseProcessor:
     
     def init_rtmpose(self, mode='balanced'):
         """Initialize RTMPose model"""
+        self.wholebody = self.build_model(mode)
+    
+    def build_model(self, mode='balanced'):
+        """Create the RTMPose inference sessions for a mode (does not touch the active model)"""
         try:
-            print(f"Initializing RTMPose model (mode: {mode}, backend: {self.backend}, device: {self.device})")
-            
-            # Check if local model files exist
-            models_dir = self.get_models_dir()
-            if os.path.exists(models_dir):
-                # Try to use local models
-                det_model = os.path.join(models_dir, 'yolox_nano_8xb8-300e_humanart-40f6f0d0.onnx')
-                
-                # Select different pose detection models based on mode
-                if mode == 'lightweight':
-                    pose_model = os.path.join(models_dir, 'rtmpose-t_simcc-body7_pt-body7_420e-256x192-026a1439_20230504.onnx')
-                    pose_input_size = (192, 256)
-                elif mode == 'performance':
-                    pose_model = os.path.join(models_dir, 'rtmpose-m_simcc-body7_pt-body7_420e-256x192-e48f03d0_20230504.onnx')
-                    pose_input_size = (192, 256)
-                else:  # balanced
-                    pose_model = os.path.join(models_dir, 'rtmpose-s_simcc-body7_pt-body7_420e-256x192-acd4a1ef_20230504.onnx')
-                    pose_input_size = (192, 256)
-                
-                if os.path.exists(det_model) and os.path.exists(pose_model):
-                    print(f"Using local model files ({mode} mode)")
-                    self.wholebody = Wholebody(
-                        det=det_model,
-                        det_input_size=(416, 416),
-                        pose=pose_model,
-                        pose_input_size=pose_input_size,
-                        backend=self.backend,
-                        device=self.device
-                    )
-                    print("RTMPose local model initialization successful")
-                    return
-            
-            # If we reach here, local models don't exist or are incomplete
-            # Use online download
-            print("Local model files incomplete, using online download")
-            self.wholebody = Wholebody(
-                mode=mode,
-                backend=self.backend,
-                device=self.device
-            )
-            print("RTMPose online model initialization successful")
+            logger.info("Initializing RTMPose model (mode: %s, backend: %s, device: %s)", mode, self.backend, self.device)
+            model = create_model(self.get_model_store(), mode, self.backend, self.device)
+            logger.info("RTMPose model initialization successful")
+            return model
             
         except Exception as e:
-            print(f"RTMPose initialization failed: {e}")
+            logger.error("RTMPose initialization failed: %s", e)
             raise  # Re-raise to prevent continuing with uninitialized model
+    
+    def get_model_store(self):
+        """Model store used by build_model (default: /data/models, bundled models as fallback)"""
+        if self.model_store is None:
+            from model_store import ModelStore
+            self.model_store = ModelStore(search_dirs=[self.get_models_dir()])
+        return self.model_store
 
     def get_keypoint_mapping(self):
         """Get keypoint mapping (COCO 17 keypoint format)"""
@@ -93,52 +127,132 @@ class RTMPoseProcessor:
         # 13: left_knee, 14: right_knee, 15: left_ankle, 16: right_ankle
         return list(range(17))  # 1:1 mapping
     
-    def get_exercises_file_path(self):
-        """Get exercises.json file path, compatible with development and packaged environments"""
-        if getattr(sys, 'frozen', False):
-            # Packaged environment, data files are in temp directory
-            base_path = sys._MEIPASS
-            exercises_file = os.path.join(base_path, 'data', 'exercises.json')
-        else:
-            # Development environment, data files are in project directory
-            exercises_file = os.path.join('data', 'exercises.json')
+    def update_model(self, mode='balanced', background=True, on_complete=None):
+        """
+        Switch to another model mode without interrupting frame processing
         
-        return exercises_file
-    
-    def load_exercise_configs(self):
-        """Load exercise configurations from JSON file"""
-        exercises_file = self.get_exercises_file_path()
+        The new sessions are built and warmed up on a background thread while
+        process_frame keeps using the current model, then swapped in atomically.
+        
+        Args:
+            mode: RTMPose mode to load
+            background: Run on a background thread (False blocks until swapped)
+            on_complete: Optional callback(mode, error) once done, error is None on success
         
+        Returns:
+            The background thread, or None when run inline
+        """
+        if not background:
+            self._swap_model(mode, on_complete)
+            return None
+        self.swap_thread = threading.Thread(
+            target=self._swap_model, args=(mode, on_complete), name='model-swap', daemon=True
+        )
+        self.swap_thread.start()
+        return self.swap_thread
+    
+    def _swap_model(self, mode, on_complete=None):
+        """Build, warm up and swap in a model for mode"""
+        logger.info("Updating RTMPose model to mode: %s", mode)
+        error = None
         try:
-            if os.path.exists(exercises_file):
-                with open(exercises_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    exercises = data.get('exercises', {})
-                    
-                    # Extract angle_point for each exercise
-                    configs = {}
-                    for exercise_type, config in exercises.items():
-                        configs[exercise_type] = {
-                            'angle_point': config.get('angle_point', [])
-                        }
-                    
-                    return configs
-            else:
-                print(f"ERROR: Exercises file not found at {exercises_file}")
-                print("Please ensure data/exercises.json exists")
-                return {}
+            model = self.build_model(mode)
+            self.warm_up(model)
+            with self.model_lock:
+                old_model = self.wholebody
+                self.wholebody = model
+                self.mode = mode
+            # A frame still running on the old model keeps it alive until it returns
+            del old_model
+            logger.info("RTMPose processor updated to mode: %s", mode)
         except Exception as e:
-            print(f"ERROR loading exercises from JSON: {e}")
-            return {}
+            error = e
+            logger.error("RTMPose model switch to %s failed, keeping %s: %s", mode, self.mode, e)
+        if on_complete is not None:
+            on_complete(mode, error)
     
-    def update_model(self, mode='balanced'):
-        """Update model"""
-        print(f"Updating RTMPose model to mode: {mode}")
-        self.init_rtmpose(mode)
-        print(f"RTMPose processor updated to mode: {mode}")
+    def warm_up(self, model):
+        """Run a dummy frame through a new model so the first real frame is not slow"""
+        h, w = self.last_frame_shape[:2]
+        dummy = np.zeros((h, w, 3), dtype=np.uint8)
+        model(dummy)
+        # A blank frame has no person, so also run the pose model on a full-frame box
+        pose_model = getattr(model, 'pose_model', None)
+        if pose_model is not None:
+            pose_model(dummy, bboxes=[[0, 0, w, h]])
     
-    def process_frame(self, frame, exercise_type):
-        """Process single frame for pose detection and exercise counting"""
+    def run_model(self, model, frame):
+        """
+        Run person detection and pose estimation, timing the two stages separately
+        
+        Returns:
+            (keypoints, scores) as returned by the Wholebody model
+        """
+        clock = time.perf_counter_ns
+        start = clock()
+        det_model = getattr(model, 'det_model', None)
+        pose_model = getattr(model, 'pose_model', None)
+        if det_model is None or pose_model is None:
+            result = model(frame)
+            self.last_timings['detect'] = clock() - start
+            return result
+        
+        # Same steps as Wholebody.__call__
+        bboxes = det_model(frame)
+        detected = clock()
+        keypoints, scores = pose_model(frame, bboxes=bboxes)
+        self.last_timings['detect'] = detected - start
+        self.last_timings['pose'] = clock() - detected
+        return keypoints, scores
+    
+    def set_keypoint_predictor(self, predictor):
+        """Set keypoint predictor used to interpolate skipped frames (None to disable)"""
+        self.keypoint_predictor = predictor
+    
+    def set_exercise_router(self, classifier, counters):
+        """
+        Enable automatic exercise detection (exercise_type 'auto')
+        
+        Args:
+            classifier: ExerciseClassifier deciding the current exercise
+            counters: Dict of exercise type -> ExerciseCounter
+        """
+        self.exercise_classifier = classifier
+        self.exercise_counters = counters
+    
+    def set_pose_tracker(self, tracker):
+        """Count every detected person with a PoseTracker (None for the single-person mode)"""
+        self.pose_tracker = tracker
+    
+    def route_exercise(self, keypoints, timestamp):
+        """Pick the exercise and counter for this frame, None while undecided"""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        detected = self.exercise_classifier.update(keypoints, timestamp)
+        if detected is None:
+            return None
+        if detected != self.active_exercise:
+            self.active_exercise = detected
+            self.exercise_counter = self.exercise_counters[detected]
+            # Interpolating across an exercise switch would mix two counters
+            if self.keypoint_predictor is not None:
+                self.keypoint_predictor.mark_lost()
+        return detected
+    
+    def process_frame(self, frame, exercise_type, timestamp=None, capture_time=None):
+        """
+        Process single frame for pose detection and exercise counting
+        
+        Args:
+            frame: Video frame
+            exercise_type: Exercise to count ('auto' with an exercise router)
+            timestamp: Monotonic frame time, used by the predictor and classifier
+            capture_time: Wall-clock capture time of the frame, stamped on rep events
+        """
+        clock = time.perf_counter_ns
+        preprocess_start = clock()
+        self.last_timings = {'preprocess': 0, 'detect': 0, 'pose': 0}
+        
         # Size check, resize if frame is too large
         h, w = frame.shape[:2]
         original_size = (w, h)
@@ -150,15 +264,25 @@ class RTMPoseProcessor:
             scale_factor = scale
         else:
             scale_factor = 1.0
+        self.last_timings['preprocess'] = clock() - preprocess_start
         
         # Initialize results
         current_angle = None
         angle_point = None
         keypoints = None
+        self.last_pose = []
+        self.last_pose_size = original_size
         
         try:
-            # Use RTMPose for pose detection
-            detected_keypoints, scores = self.wholebody(frame)
+            # Use RTMPose for pose detection, on the model active when the frame started
+            self.last_frame_shape = frame.shape
+            model = self.wholebody
+            detected_keypoints, scores = self.run_model(model, frame)
+            del model
+            
+            if self.pose_tracker is not None:
+                return self.count_people(detected_keypoints, scores, scale_factor, exercise_type,
+                                         timestamp, capture_time)
             
             # Process results
             if detected_keypoints is not None and len(detected_keypoints) > 0:
@@ -174,56 +298,102 @@ class RTMPoseProcessor:
                 # If need to scale back to original size
                 if scale_factor != 1.0:
                     keypoints = keypoints / scale_factor
+                self.last_pose = [(1, keypoints, confidence_scores)]
+                
+                # In auto mode the classifier decides which counter gets the frame
+                if exercise_type == 'auto' and self.exercise_classifier is not None:
+                    exercise_type = self.route_exercise(keypoints, timestamp)
+                    if exercise_type is None:
+                        return None, None, None, keypoints
+                
+                # Count the frames skipped since the last inference first, so a
+                # threshold crossing between two samples is not missed
+                if self.keypoint_predictor is not None and timestamp is not None:
+                    self.count_interpolated_frames(keypoints, exercise_type, timestamp, capture_time)
                 
                 # Get corresponding angle and joint points based on exercise type
-                current_angle, angle_point = self.get_exercise_angle(keypoints, exercise_type)
+                current_angle, angle_point = self.get_exercise_angle(
+                    keypoints, exercise_type, capture_time=capture_time
+                )
+            elif self.keypoint_predictor is not None:
+                self.keypoint_predictor.mark_lost()
             
         except Exception as e:
-            print(f"RTMPose processing failed: {e}")
+            logger.warning("RTMPose processing failed: %s", e)
         
         # Return None for processed frame, current_angle, angle_point, and keypoints
         return None, current_angle, angle_point, keypoints
     
-    def get_exercise_angle(self, keypoints, exercise_type):
-        """Get angle based on exercise type"""
+    def count_people(self, detected_keypoints, scores, scale_factor, exercise_type, timestamp,
+                     capture_time=None):
+        """
+        Track all detected people and count each one with the counter of its track
+        
+        Returns:
+            Same tuple as process_frame, for the person in the lowest slot
+        """
+        if detected_keypoints is None or len(detected_keypoints) == 0:
+            people = np.zeros((0, 17, 2))
+        else:
+            people = np.array(detected_keypoints, dtype=np.float64)[:, :17]
+            if scores is not None:
+                scores = np.asarray(scores)[:, :17]
+                people[scores <= self.conf_threshold] = 0
+            if scale_factor != 1.0:
+                people /= scale_factor
+        
+        if timestamp is None:
+            timestamp = time.monotonic()
+        
+        current_angle = None
+        angle_point = None
+        keypoints = None
+        for track, person in self.pose_tracker.update(people, timestamp):
+            track.angle, point = self.get_exercise_angle(person, exercise_type, track.counter, capture_time)
+            self.last_pose.append((track.slot, person, scores[track.detection] if scores is not None else None))
+            if keypoints is None:
+                current_angle, angle_point, keypoints = track.angle, point, person
+        
+        return None, current_angle, angle_point, keypoints
+    
+    def count_interpolated_frames(self, keypoints, exercise_type, timestamp, capture_time=None):
+        """Feed predictor-reconstructed skipped frames to the counter"""
+        count_before = self.exercise_counter.counter
+        for frame_time, interpolated in self.keypoint_predictor.update(keypoints, timestamp):
+            # Capture time of the skipped frame, from its offset to the current frame
+            frame_capture_time = None if capture_time is None else capture_time - (timestamp - frame_time)
+            self.get_exercise_angle(interpolated, exercise_type, capture_time=frame_capture_time)
+        
+        # A rep completed on an interpolated frame was implied between two samples
+        implied = self.exercise_counter.counter - count_before
+        if implied > 0:
+            self.interpolated_reps += implied
+    
+    def get_exercise_angle(self, keypoints, exercise_type, counter=None, capture_time=None):
+        """Get angle based on exercise type (counted by counter, default the active counter)"""
         current_angle = None
         angle_point = None
+        counter = counter or self.exercise_counter
         
         try:
-            # Get the counting method based on exercise type
-            count_method_map = {
-                "squat": self.exercise_counter.count_squat,
-                "pushup": self.exercise_counter.count_pushup,
-                "situp": self.exercise_counter.count_situp,
-                "bicep_curl": self.exercise_counter.count_bicep_curl,
-                "lateral_raise": self.exercise_counter.count_lateral_raise,
-                "overhead_press": self.exercise_counter.count_overhead_press,
-                "leg_raise": self.exercise_counter.count_leg_raise,
-                "knee_raise": self.exercise_counter.count_knee_raise,
-                "knee_press": self.exercise_counter.count_knee_press,
-                "crunch": self.exercise_counter.count_crunch
-            }
+            # The counter resolves the exercise's strategy from the registry
+            current_angle = counter.count_exercise(keypoints, exercise_type, timestamp=capture_time)
             
-            # Get counting method
-            count_method = count_method_map.get(exercise_type)
-            if count_method:
-                current_angle = count_method(keypoints)
-                
-                # Get angle_point from config
-                if current_angle is not None and exercise_type in self.exercise_configs:
-                    angle_point_indices = self.exercise_configs[exercise_type].get('angle_point', [])
-                    if len(angle_point_indices) == 3:
-                        angle_point = [
-                            keypoints[angle_point_indices[0]],
-                            keypoints[angle_point_indices[1]],
-                            keypoints[angle_point_indices[2]]
-                        ]
+            # Get angle_point from config
+            if current_angle is not None and exercise_type in self.exercise_configs:
+                angle_point_indices = self.exercise_configs[exercise_type].get('angle_point', [])
+                if len(angle_point_indices) == 3:
+                    angle_point = [
+                        keypoints[angle_point_indices[0]],
+                        keypoints[angle_point_indices[1]],
+                        keypoints[angle_point_indices[2]]
+                    ]
         except Exception as e:
-            print(f"Error calculating exercise angle: {e}")
+            logger.warning("Error calculating exercise angle: %s", e)
             
         return current_angle, angle_point
     
     def set_skeleton_visibility(self, show):
         """Set skeleton display state"""
         self.show_skeleton = show
-        print(f"RTMPose skeleton display: {'On' if show else 'Off'}") 
\ No newline at end of file
+        logger.info("RTMPose skeleton display: %s", 'On' if show else 'Off') 
\ No newline at end of file
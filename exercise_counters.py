@@ -1,14 +1,88 @@
+import logging
 import numpy as np
 from collections import deque
 import time
-import json
-import os
-import sys
+
+from exercise_registry import get_registry
+
+logger = logging.getLogger(__name__)
+
+
+class ExtremaRepDetector:
+    """Streaming rep detector based on peaks and valleys of the angle signal
+    
+    Tracks the running extreme with a prominence hysteresis (zig-zag), so it only
+    keeps a constant amount of state. A rep is counted when a valley is confirmed
+    after a peak, i.e. the signal has risen again by min_prominence. Unlike the
+    threshold state machine it does not need samples on both sides of fixed
+    thresholds, so it keeps working at low inference rates.
+    """
+    
+    def __init__(self, min_prominence, min_rep_time=0.5, max_rep_time=8.0):
+        self.min_prominence = min_prominence
+        self.min_rep_time = min_rep_time
+        self.max_rep_time = max_rep_time
+        self.reset()
+    
+    def reset(self):
+        """Reset detector state"""
+        self.direction = None  # 'rising' (looking for a peak) or 'falling' (looking for a valley)
+        self.candidate_max = None
+        self.candidate_min = None
+        self.last_peak_time = None
+        self.last_rep_time = None
+        self.last_rep = None  # (peak_time, valley_time, peak_angle, valley_angle) of the last rep
+    
+    def update(self, angle, timestamp):
+        """
+        Feed one sample
+        
+        Returns:
+            'peak' or 'valley' when an extremum is confirmed, 'rep' when the
+            valley completes a rep, otherwise None
+        """
+        if self.candidate_max is None:
+            self.candidate_max = (angle, timestamp)
+            self.candidate_min = (angle, timestamp)
+            return None
+        
+        if angle > self.candidate_max[0]:
+            self.candidate_max = (angle, timestamp)
+        if angle < self.candidate_min[0]:
+            self.candidate_min = (angle, timestamp)
+        
+        if self.direction != 'rising' and angle >= self.candidate_min[0] + self.min_prominence:
+            # Valley confirmed at candidate_min
+            valley_angle, valley_time = self.candidate_min
+            peak = self.candidate_max if self.direction == 'falling' else None
+            self.direction = 'rising'
+            self.candidate_max = (angle, timestamp)
+            
+            if peak is None or self.last_peak_time is None:
+                return 'valley'
+            if valley_time - self.last_peak_time > self.max_rep_time:
+                return 'valley'  # Too slow to be a rep (drift, posture change)
+            if self.last_rep_time is not None and valley_time - self.last_rep_time < self.min_rep_time:
+                return 'valley'
+            
+            self.last_rep_time = valley_time
+            self.last_rep = (self.last_peak_time, valley_time, peak[0], valley_angle)
+            return 'rep'
+        
+        if self.direction != 'falling' and angle <= self.candidate_max[0] - self.min_prominence:
+            # Peak confirmed at candidate_max
+            self.last_peak_time = self.candidate_max[1]
+            self.direction = 'falling'
+            self.candidate_min = (angle, timestamp)
+            return 'peak'
+        
+        return None
+
 
 class ExerciseCounter:
     """Basic exercise counter with angle-based detection"""
     
-    def __init__(self, smoothing_window=5):
+    def __init__(self, smoothing_window=5, registry=None):
         # Core counting variables
         self.counter = 0
         self.stage = None
@@ -19,8 +93,9 @@ class ExerciseCounter:
         self.last_count_time = 0
         self.min_rep_time = 0.5  # Minimum time between reps (seconds)
         
-        # Exercise configurations
-        self.exercise_configs = self.get_exercise_configs()
+        # Exercise configurations and counting strategies, loaded once per process
+        self.registry = registry or get_registry()
+        self.exercise_configs = self.registry.configs
         
         # Independent counting for leg exercises - load from config
         self.leg_exercises = [
@@ -28,48 +103,16 @@ class ExerciseCounter:
             if config.get('is_leg_exercise', False)
         ]
         self.leg_stages = {'left': None, 'right': None}  # Track each leg's stage
-    
-    def get_exercises_file_path(self):
-        """Get exercises.json file path, compatible with development and packaged environments"""
-        if getattr(sys, 'frozen', False):
-            # Packaged environment, data files are in temp directory
-            base_path = sys._MEIPASS
-            exercises_file = os.path.join(base_path, 'data', 'exercises.json')
-        else:
-            # Development environment, data files are in project directory
-            exercises_file = os.path.join('data', 'exercises.json')
         
-        return exercises_file
-    
-    def get_exercise_configs(self):
-        """Load exercise-specific angle thresholds from JSON file"""
-        exercises_file = self.get_exercises_file_path()
+        # Extrema detectors for exercises using counting_method 'extrema', per side
+        self.extrema_detectors = {}
         
-        try:
-            if os.path.exists(exercises_file):
-                with open(exercises_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    exercises = data.get('exercises', {})
-                    
-                    # Convert to the format expected by the rest of the code
-                    configs = {}
-                    for exercise_type, config in exercises.items():
-                        configs[exercise_type] = {
-                            'down_angle': config.get('down_angle'),
-                            'up_angle': config.get('up_angle'),
-                            'keypoints': config.get('keypoints', {}),
-                            'is_leg_exercise': config.get('is_leg_exercise', False)
-                        }
-                    
-                    print(f"Loaded {len(configs)} exercises from {exercises_file}")
-                    return configs
-            else:
-                print(f"ERROR: Exercises file not found at {exercises_file}")
-                print("Please ensure data/exercises.json exists")
-                return {}
-        except Exception as e:
-            print(f"ERROR loading exercises from JSON: {e}")
-            return {}
+        # Time of the frame being counted (capture time if known, else wall clock)
+        self.current_time = None
+        # Per-side [start time, min angle, max angle] of the rep in progress
+        self.rep_windows = {}
+        # Completed reps not yet consumed (see pop_rep_events)
+        self.rep_events = deque(maxlen=100)
     
     def reset_counter(self):
         """Reset counter to initial state"""
@@ -77,6 +120,9 @@ class ExerciseCounter:
         self.stage = None
         self.angle_history.clear()
         self.leg_stages = {'left': None, 'right': None}
+        self.extrema_detectors = {}
+        self.rep_windows = {}
+        self.rep_events.clear()
     
     def calculate_angle(self, a, b, c):
         """Calculate angle between three points"""
@@ -108,7 +154,7 @@ class ExerciseCounter:
             return np.degrees(angle)
             
         except Exception as e:
-            print(f"Angle calculation error: {e}")
+            logger.warning("Angle calculation error: %s", e)
             return None
     
     def smooth_angle(self, angle):
@@ -131,50 +177,109 @@ class ExerciseCounter:
         
         return np.mean(filtered_angles) if len(filtered_angles) > 0 else angle
     
-    def check_rep_timing(self):
+    def check_rep_timing(self, min_rep_time=None):
         """Prevent counting reps too quickly"""
-        current_time = time.time()
-        if current_time - self.last_count_time < self.min_rep_time:
+        if min_rep_time is None:
+            min_rep_time = self.min_rep_time
+        current_time = self.current_time or time.time()
+        if current_time - self.last_count_time < min_rep_time:
             return False
         return True
     
-    def count_exercise(self, keypoints, exercise_type):
-        """Generic exercise counting function"""
+    def apply_smoothing_window(self, window):
+        """Resize the smoothing history if an exercise overrides the window"""
+        window = window or self.smoothing_window
+        if self.angle_history.maxlen != window:
+            self.angle_history = deque(self.angle_history, maxlen=window)
+    
+    def observe_rep_angle(self, side, angle, max_rep_time):
+        """Track the duration and angle range of the rep in progress"""
+        window = self.rep_windows.get(side)
+        angle = float(angle)
+        if window is None or self.current_time - window[0] > max_rep_time:
+            # First sample, or a pause longer than a rep
+            self.rep_windows[side] = [self.current_time, angle, angle]
+        elif window[1] is None:
+            window[1] = window[2] = angle
+        else:
+            window[1] = min(window[1], angle)
+            window[2] = max(window[2], angle)
+    
+    def complete_rep(self, side):
+        """Count a rep and record its event"""
+        self.counter += 1
+        self.last_count_time = self.current_time
+        start_time, min_angle, max_angle = self.rep_windows.get(side) or (self.current_time, None, None)
+        # The next rep starts where this one ended
+        self.rep_windows[side] = [self.current_time, None, None]
+        self.rep_events.append({
+            'count': self.counter,
+            'timestamp': self.current_time,
+            'duration': self.current_time - start_time,
+            'min_angle': min_angle,
+            'max_angle': max_angle,
+        })
+    
+    def pop_rep_events(self):
+        """Return and clear the reps completed since the last call"""
+        events = list(self.rep_events)
+        self.rep_events.clear()
+        return events
+    
+    def count_exercise(self, keypoints, exercise_type, timestamp=None):
+        """
+        Generic exercise counting function
+        
+        Args:
+            keypoints: Keypoints (17, 2)
+            exercise_type: Exercise to count
+            timestamp: Capture time of the frame (epoch seconds), defaults to now
+        """
+        self.current_time = time.time() if timestamp is None else timestamp
         try:
-            if exercise_type not in self.exercise_configs:
-                print(f"Unknown exercise type: {exercise_type}")
+            strategy = self.registry.strategy(exercise_type)
+            if strategy is None:
+                logger.warning("Unknown exercise type: %s", exercise_type)
                 return None
                 
             config = self.exercise_configs[exercise_type]
-            kp = config['keypoints']
-            
-            # Calculate angles for both sides
-            left_angle = self.calculate_angle(
-                keypoints[kp['left'][0]],  # first point
-                keypoints[kp['left'][1]],  # middle point
-                keypoints[kp['left'][2]]   # last point
-            )
-            
-            right_angle = self.calculate_angle(
-                keypoints[kp['right'][0]],  # first point
-                keypoints[kp['right'][1]],  # middle point
-                keypoints[kp['right'][2]]   # last point
-            )
             
-            if left_angle is None or right_angle is None:
+            # Compute the signal for both sides (joint angle, distance ratio...),
+            # reading only the keypoints the strategy needs
+            sides = strategy.compute(keypoints)
+            if sides is None:
                 return None
+            left_angle, right_angle = sides
             
             # Handle leg exercises differently
             if exercise_type in self.leg_exercises:
+                self.observe_rep_angle('left', left_angle, config['max_rep_time'])
+                self.observe_rep_angle('right', right_angle, config['max_rep_time'])
+                if config['counting_method'] == 'extrema':
+                    self.count_extrema(left_angle, config, 'left')
+                    self.count_extrema(right_angle, config, 'right')
+                    return (left_angle + right_angle) / 2
                 return self.count_leg_exercise(left_angle, right_angle, config)
             
             # For other exercises, use average angle
             avg_angle = (left_angle + right_angle) / 2
+            window = config.get('smoothing_window')
+            if window is None and config['counting_method'] == 'extrema':
+                # Prominence hysteresis already rejects jitter; a long window
+                # would average a whole rep away at low sample rates
+                window = 2
+            self.apply_smoothing_window(window)
             smoothed_angle = self.smooth_angle(avg_angle)
             
             if smoothed_angle is None:
                 return None
             
+            self.observe_rep_angle('both', smoothed_angle, config['max_rep_time'])
+            
+            if config['counting_method'] == 'extrema':
+                self.count_extrema(smoothed_angle, config, 'both')
+                return smoothed_angle
+            
             # Get thresholds
             up_threshold = config['up_angle']
             down_threshold = config['down_angle']
@@ -184,16 +289,15 @@ class ExerciseCounter:
                 self.stage = "up"
             elif (smoothed_angle < down_threshold and 
                   self.stage == "up" and 
-                  self.check_rep_timing()):
+                  self.check_rep_timing(config.get('min_rep_time'))):
                 
                 self.stage = "down"
-                self.counter += 1
-                self.last_count_time = time.time()
+                self.complete_rep('both')
                 
             return smoothed_angle
             
         except Exception as e:
-            print(f"Exercise counting error: {e}")
+            logger.warning("Exercise counting error: %s", e)
             return None
     
     def count_leg_exercise(self, left_angle, right_angle, config):
@@ -202,14 +306,13 @@ class ExerciseCounter:
         down_threshold = config['down_angle']
         
         # Check if either leg meets the criteria
-        if self.check_rep_timing():
+        if self.check_rep_timing(config.get('min_rep_time')):
             # Left leg
             if left_angle > up_threshold:
                 self.leg_stages['left'] = "up"
             elif (left_angle < down_threshold and 
                   self.leg_stages['left'] == "up"):
-                self.counter += 1
-                self.last_count_time = time.time()
+                self.complete_rep('left')
                 self.leg_stages['left'] = "down"
             
             # Right leg
@@ -217,50 +320,33 @@ class ExerciseCounter:
                 self.leg_stages['right'] = "up"
             elif (right_angle < down_threshold and 
                   self.leg_stages['right'] == "up"):
-                self.counter += 1
-                self.last_count_time = time.time()
+                self.complete_rep('right')
                 self.leg_stages['right'] = "down"
         
         # Return average angle for display purposes
         return (left_angle + right_angle) / 2
     
-    # Wrapper functions for different exercises
-    def count_squat(self, keypoints):
-        """Count squat repetitions"""
-        return self.count_exercise(keypoints, 'squat')
-    
-    def count_pushup(self, keypoints):
-        """Count pushup repetitions"""
-        return self.count_exercise(keypoints, 'pushup')
-    
-    def count_situp(self, keypoints):
-        """Count situp repetitions"""
-        return self.count_exercise(keypoints, 'situp')
-    
-    def count_bicep_curl(self, keypoints):
-        """Count bicep curl repetitions"""
-        return self.count_exercise(keypoints, 'bicep_curl')
-    
-    def count_lateral_raise(self, keypoints):
-        """Count lateral raise repetitions"""
-        return self.count_exercise(keypoints, 'lateral_raise')
-    
-    def count_overhead_press(self, keypoints):
-        """Count overhead press repetitions"""
-        return self.count_exercise(keypoints, 'overhead_press')
-    
-    def count_leg_raise(self, keypoints):
-        """Count leg raise repetitions"""
-        return self.count_exercise(keypoints, 'leg_raise')
-    
-    def count_knee_raise(self, keypoints):
-        """Count knee raise repetitions"""
-        return self.count_exercise(keypoints, 'knee_raise')
-    
-    def count_knee_press(self, keypoints):
-        """Count knee press repetitions"""
-        return self.count_exercise(keypoints, 'knee_press')
-    
-    def count_crunch(self, keypoints):
-        """Count crunch repetitions"""
-        return self.count_exercise(keypoints, 'crunch')
+    def count_extrema(self, angle, config, side):
+        """Count reps from peaks and valleys of the angle signal"""
+        detector = self.extrema_detectors.get(side)
+        if detector is None:
+            min_prominence = config.get('min_prominence')
+            if min_prominence is None:
+                # Default to 60% of the configured range of motion
+                min_prominence = 0.6 * abs(config['up_angle'] - config['down_angle'])
+            min_rep_time = config.get('min_rep_time')
+            detector = ExtremaRepDetector(
+                min_prominence=min_prominence,
+                min_rep_time=self.min_rep_time if min_rep_time is None else min_rep_time,
+                max_rep_time=config.get('max_rep_time', 8.0)
+            )
+            self.extrema_detectors[side] = detector
+        
+        event = detector.update(angle, self.current_time)
+        if event == 'peak':
+            self.stage = "up"
+        elif event in ('valley', 'rep'):
+            self.stage = "down"
+        
+        if event == 'rep':
+            self.complete_rep(side)
@@ -0,0 +1,223 @@
+"""
+Exercise registry for Good-GYM Home Assistant Addon
+Builds counting strategies once from data/exercises.json
+"""
+import json
+import os
+import sys
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+
+# Feature name -> strategy class, filled by @register_strategy
+COUNTING_STRATEGIES: Dict[str, type] = {}
+
+
+def register_strategy(feature: str):
+    """Register a counting strategy for an exercises.json 'feature' value"""
+    def decorator(cls):
+        cls.feature = feature
+        COUNTING_STRATEGIES[feature] = cls
+        return cls
+    return decorator
+
+
+class CountingStrategy:
+    """Computes the left/right signal an exercise is counted on
+
+    Strategies declare the keypoint indices they read, so the per-frame path
+    only gathers those points. compute_batch works on (frames, 17, 2) arrays and
+    is shared by the live counter (one frame) and offline tools (whole traces).
+    """
+
+    feature = None
+
+    def __init__(self, exercise_type: str, config: Dict[str, Any]):
+        self.exercise_type = exercise_type
+        self.config = config
+        self.keypoint_indices: List[int] = []
+
+    @property
+    def signature(self) -> tuple:
+        """Identity of the computed signal, used to share work between exercises"""
+        return (self.feature, tuple(self.keypoint_indices))
+
+    def compute_batch(self, points: np.ndarray):
+        """
+        Compute the signal for many frames
+
+        Args:
+            points: Keypoints array (frames, 17, 2)
+
+        Returns:
+            Tuple (left, right) of arrays (frames,), NaN where unavailable
+        """
+        raise NotImplementedError
+
+    def compute(self, keypoints):
+        """
+        Compute the signal for a single frame
+
+        Returns:
+            Tuple (left, right) of floats, or None if either side is unavailable
+        """
+        left, right = self.compute_batch(np.asarray(keypoints, dtype=np.float64)[None])
+        if np.isnan(left[0]) or np.isnan(right[0]):
+            return None
+        return float(left[0]), float(right[0])
+
+
+@register_strategy('angle')
+class AngleStrategy(CountingStrategy):
+    """Joint angle at the middle of a keypoint triplet, per side (degrees)"""
+
+    def __init__(self, exercise_type: str, config: Dict[str, Any]):
+        super().__init__(exercise_type, config)
+        kp = config['keypoints']
+        # (side, point) index array: row 0 = left triplet, row 1 = right triplet
+        self.triplets = np.array([kp['left'], kp['right']], dtype=np.intp)
+        self.keypoint_indices = self.triplets.ravel().tolist()
+
+    def compute_batch(self, points):
+        selected = points[:, self.triplets]  # (frames, 2, 3, 2)
+        ba = selected[:, :, 0] - selected[:, :, 1]
+        bc = selected[:, :, 2] - selected[:, :, 1]
+        ba_norm = np.sqrt(np.einsum('fsk,fsk->fs', ba, ba))
+        bc_norm = np.sqrt(np.einsum('fsk,fsk->fs', bc, bc))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cosine = np.einsum('fsk,fsk->fs', ba, bc) / (ba_norm * bc_norm)
+        angles = np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+        angles[(ba_norm == 0) | (bc_norm == 0)] = np.nan
+        return angles[:, 0], angles[:, 1]
+
+
+@register_strategy('distance')
+class DistanceStrategy(CountingStrategy):
+    """Distance between keypoint pairs, in percent of a reference distance
+
+    keypoints.pairs holds one or two [a, b] pairs (left/right signal; a single
+    pair is used for both sides) and keypoints.reference the pair used for
+    scale normalisation, shoulder width by default.
+    """
+
+    def __init__(self, exercise_type: str, config: Dict[str, Any]):
+        super().__init__(exercise_type, config)
+        kp = config['keypoints']
+        pairs = kp['pairs']
+        if len(pairs) == 1:
+            pairs = [pairs[0], pairs[0]]
+        self.pairs = np.array(pairs[:2], dtype=np.intp)
+        self.reference = np.array(kp.get('reference', [5, 6]), dtype=np.intp)
+        self.keypoint_indices = self.pairs.ravel().tolist() + self.reference.tolist()
+
+    def compute_batch(self, points):
+        selected = points[:, self.pairs]  # (frames, 2, 2, 2)
+        distances = np.linalg.norm(selected[:, :, 0] - selected[:, :, 1], axis=-1)
+        reference = np.linalg.norm(points[:, self.reference[0]] - points[:, self.reference[1]], axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratios = 100.0 * distances / reference[:, None]
+        ratios[reference == 0] = np.nan
+        return ratios[:, 0], ratios[:, 1]
+
+
+class ExerciseRegistry:
+    """Exercise definitions and their counting strategies, loaded once"""
+
+    def __init__(self, exercises_file: Optional[str] = None):
+        """
+        Initialize registry
+
+        Args:
+            exercises_file: Path to exercises.json (defaults to data/exercises.json)
+        """
+        self.exercises_file = exercises_file or self.get_exercises_file_path()
+        self.configs: Dict[str, Dict[str, Any]] = {}
+        self.strategies: Dict[str, CountingStrategy] = {}
+        self.load()
+
+    @staticmethod
+    def get_exercises_file_path() -> str:
+        """Get exercises.json file path, compatible with development and packaged environments"""
+        if getattr(sys, 'frozen', False):
+            # Packaged environment, data files are in temp directory
+            return os.path.join(sys._MEIPASS, 'data', 'exercises.json')
+        # Development environment, data files are in project directory
+        return os.path.join('data', 'exercises.json')
+
+    def load(self):
+        """Load exercises.json and resolve a strategy for every exercise"""
+        if not os.path.exists(self.exercises_file):
+            print(f"ERROR: Exercises file not found at {self.exercises_file}")
+            print("Please ensure data/exercises.json exists")
+            return
+
+        try:
+            with open(self.exercises_file, 'r', encoding='utf-8') as f:
+                exercises = json.load(f).get('exercises', {})
+        except Exception as e:
+            print(f"ERROR loading exercises from JSON: {e}")
+            return
+
+        for exercise_type, config in exercises.items():
+            feature = config.get('feature', 'angle')
+            strategy_cls = COUNTING_STRATEGIES.get(feature)
+            if strategy_cls is None:
+                print(f"ERROR: Unknown feature '{feature}' for exercise {exercise_type}, skipping")
+                continue
+
+            normalized = {
+                'name_en': config.get('name_en', exercise_type.replace('_', ' ').title()),
+                'name_zh': config.get('name_zh'),
+                'feature': feature,
+                # Thresholds are in the unit of the feature (degrees, percent...)
+                'down_angle': config.get('down_threshold', config.get('down_angle')),
+                'up_angle': config.get('up_threshold', config.get('up_angle')),
+                'keypoints': config.get('keypoints', {}),
+                'is_leg_exercise': config.get('is_leg_exercise', False),
+                'posture': config.get('posture'),
+                'angle_point': config.get('angle_point', []),
+                # Optional per-exercise tuning (see threshold_tuner.py)
+                'smoothing_window': config.get('smoothing_window'),
+                'min_rep_time': config.get('min_rep_time'),
+                # 'threshold' (up/down state machine) or 'extrema' (peaks/valleys)
+                'counting_method': config.get('counting_method', 'threshold'),
+                'min_prominence': config.get('min_prominence'),
+                'max_rep_time': config.get('max_rep_time', 8.0),
+            }
+
+            try:
+                strategy = strategy_cls(exercise_type, normalized)
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                print(f"ERROR: Invalid keypoints for exercise {exercise_type}: {e}")
+                continue
+
+            normalized['required_keypoints'] = sorted(set(strategy.keypoint_indices))
+            self.configs[exercise_type] = normalized
+            self.strategies[exercise_type] = strategy
+
+        print(f"Loaded {len(self.configs)} exercises from {self.exercises_file}")
+
+    def names(self) -> List[str]:
+        """All exercise types, in file order"""
+        return list(self.configs)
+
+    def display_name(self, exercise_type: str) -> str:
+        """English display name of an exercise"""
+        config = self.configs.get(exercise_type)
+        return config['name_en'] if config else exercise_type.replace('_', ' ').title()
+
+    def strategy(self, exercise_type: str) -> Optional[CountingStrategy]:
+        """Counting strategy of an exercise"""
+        return self.strategies.get(exercise_type)
+
+
+_registry: Optional[ExerciseRegistry] = None
+
+
+def get_registry() -> ExerciseRegistry:
+    """Get the process-wide registry, loading exercises.json on first use"""
+    global _registry
+    if _registry is None:
+        _registry = ExerciseRegistry()
+    return _registry
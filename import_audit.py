@@ -0,0 +1,118 @@
+"""
+Import-time audit for Good-GYM Home Assistant Addon
+Built-in equivalent of `python -X importtime`, enabled with GOODGYM_IMPORT_AUDIT=1
+
+Every module executed after install() is timed (inclusive and self time, per
+thread, so imports done by the parallel initialization phases are attributed
+correctly). The service logs the report once initialization is done; run
+directly to audit `import main` alone:
+
+    python import_audit.py            # top modules by self time
+    python import_audit.py 30         # top 30
+"""
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+ENV_VAR = 'GOODGYM_IMPORT_AUDIT'
+
+
+class ImportAudit:
+    """Meta path hook timing the execution of every newly imported module"""
+
+    def __init__(self):
+        # module name -> (inclusive seconds, self seconds, thread name)
+        self.records: Dict[str, Tuple[float, float, str]] = {}
+        self.local = threading.local()
+
+    # importlib.abc.MetaPathFinder protocol
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        # Source and extension loaders are created per module, so the wrapper can be
+        # set on the instance; shared loaders (builtin, frozen) are cheap and skipped
+        if loader is not None and not isinstance(loader, type) and hasattr(loader, 'exec_module'):
+            loader.exec_module = self._timed(name, loader.exec_module)
+        return spec
+
+    def invalidate_caches(self):
+        pass
+
+    def _timed(self, name: str, exec_module):
+        def timed_exec_module(module):
+            stack = getattr(self.local, 'stack', None)
+            if stack is None:
+                stack = self.local.stack = []
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = stack.pop()
+                self.records[name] = (elapsed, elapsed - children, threading.current_thread().name)
+                if stack:
+                    stack[-1] += elapsed
+        return timed_exec_module
+
+    def packages(self) -> Dict[str, float]:
+        """Self time summed per top-level package (seconds)"""
+        totals: Dict[str, float] = {}
+        for name, (_, self_time, _) in self.records.items():
+            package = name.split('.', 1)[0]
+            totals[package] = totals.get(package, 0.0) + self_time
+        return totals
+
+    def report(self, top: int = 15) -> List[str]:
+        """Formatted report: total, heaviest packages and heaviest modules"""
+        total = sum(self_time for _, self_time, _ in self.records.values())
+        lines = [f"📦 Import audit: {len(self.records)} modules, {total * 1000:.0f} ms of import time"]
+        lines.append("   Packages (self time):")
+        for package, seconds in sorted(self.packages().items(), key=lambda item: -item[1])[:top]:
+            lines.append(f"   {seconds * 1000:>9.1f} ms  {package}")
+        lines.append("   Modules (self / inclusive, importing thread):")
+        for name, (inclusive, self_time, thread) in sorted(self.records.items(), key=lambda item: -item[1][1])[:top]:
+            lines.append(f"   {self_time * 1000:>9.1f} / {inclusive * 1000:>7.1f} ms  {name}  [{thread}]")
+        return lines
+
+
+_audit: Optional[ImportAudit] = None
+
+
+def install() -> ImportAudit:
+    """Start timing imports (idempotent)"""
+    global _audit
+    if _audit is None:
+        _audit = ImportAudit()
+        sys.meta_path.insert(0, _audit)
+    return _audit
+
+
+def uninstall():
+    """Stop timing imports, keeping the records"""
+    if _audit is not None and _audit in sys.meta_path:
+        sys.meta_path.remove(_audit)
+
+
+def report(top: int = 15) -> List[str]:
+    """Report of the installed audit (empty when not installed)"""
+    return _audit.report(top) if _audit is not None else []
+
+
+if __name__ == "__main__":
+    install()
+    start = time.perf_counter()
+    import main  # noqa: F401
+    elapsed = time.perf_counter() - start
+    uninstall()
+    for line in report(int(sys.argv[1]) if len(sys.argv) > 1 else 15):
+        print(line)
+    print(f"⏱️  import main: {elapsed * 1000:.0f} ms")
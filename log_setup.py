@@ -0,0 +1,216 @@
+"""
+Logging setup for Good-GYM Home Assistant Addon
+Levels, per-message rate limiting and a non-blocking queue handler
+
+Runtime messages go through the standard logging module:
+
+    logger = logging.getLogger(__name__)
+    logger.warning("⚠ Failed to read frame (error count: %d)", count)
+
+Records are rate limited per message key (the unformatted message, or
+extra={'key': ...}): a flapping camera logs the first few failures, then one
+"repeated N times" line per period instead of hundreds of writes per second.
+Formatting and the write to stdout happen on a listener thread, the frame
+path only appends to a bounded queue (records are dropped, and counted,
+when it is full).
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+LEVELS = {'debug': logging.DEBUG, 'info': logging.INFO, 'warning': logging.WARNING, 'error': logging.ERROR}
+
+
+class RateLimitFilter(logging.Filter):
+    """Let burst records per key through every period seconds, count the rest"""
+
+    def __init__(self, burst: int = 5, period: float = 60.0, min_level: int = logging.WARNING):
+        """
+        Initialize filter
+
+        Args:
+            burst: Records per key and period passed through
+            period: Window length (seconds)
+            min_level: Records below this level are never limited (e.g. rep counts)
+        """
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.min_level = min_level
+        self.lock = threading.Lock()
+        # key -> [window start, records in window, suppressed in window, last suppressed record]
+        self.windows: Dict[object, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.min_level:
+            return True
+        key = getattr(record, 'key', None) or (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.period:
+                suppressed = window[2] if window is not None else 0
+                self.windows[key] = [now, 1, 0, None]
+                if suppressed:
+                    record.msg = f"{record.getMessage()} (repeated {suppressed} times in the last {self.period:g}s)"
+                    record.args = None
+                    record.repeated = suppressed
+                return True
+            window[1] += 1
+            if window[1] <= self.burst:
+                return True
+            window[2] += 1
+            # Kept for the summary line; a traceback would keep the failing frame's locals alive
+            record.exc_info = None
+            window[3] = record
+            return False
+
+    def flush(self):
+        """Report keys whose suppressed records were not followed by a new window"""
+        now = time.monotonic()
+        with self.lock:
+            expired = [(key, window) for key, window in self.windows.items() if now - window[0] >= self.period]
+            for key, _ in expired:
+                del self.windows[key]
+        for _, (_, _, suppressed, last) in expired:
+            if suppressed:
+                logging.getLogger(last.name).log(
+                    last.levelno, "%s (repeated %d times, then stopped)", last.getMessage(),
+                    suppressed, extra={'repeated': suppressed})
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: records are dropped when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.exception_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Enqueue the record unformatted, the listener's formatter does the work
+
+        The base class formats here, on the logging thread, and flattens the
+        traceback into the message (so JsonFormatter lost its 'exception' field).
+        Only the traceback is rendered now: the text is cached in exc_text and
+        exc_info dropped, so the queue does not keep the failing frame alive.
+        """
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, thread, message (+ repeated, exception)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'repeated', None):
+            entry['repeated'] = record.repeated
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[DroppingQueueHandler] = None
+_rate_limit: Optional[RateLimitFilter] = None
+
+
+def setup_logging(level: str = 'info', fmt: str = 'text', burst: int = 5, period: float = 60.0,
+                  queue_size: int = 10000) -> logging.handlers.QueueListener:
+    """
+    Route all logging through a rate limit and a background writer (idempotent)
+
+    Args:
+        level: debug, info, warning or error
+        fmt: 'text' (time, level, message) or 'json' (one object per line)
+        burst: Records per message key and period before suppression
+        period: Rate limit window (seconds)
+        queue_size: Records buffered for the writer thread
+
+    Returns:
+        The running QueueListener
+    """
+    global _listener, _handler, _rate_limit
+    shutdown_logging()
+
+    # Fields the records never need, each costs time on the calling thread
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    output = logging.StreamHandler(sys.stdout)
+    if fmt == 'json':
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)-7s %(message)s', '%Y-%m-%d %H:%M:%S'))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    _rate_limit = RateLimitFilter(burst=burst, period=period)
+    _handler = DroppingQueueHandler(log_queue)
+    _handler.addFilter(_rate_limit)
+
+    root = logging.getLogger()
+    root.setLevel(LEVELS.get(level, logging.INFO))
+    root.addHandler(_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def flush_suppressed():
+    """Log pending "repeated N times" summaries (call periodically)"""
+    if _rate_limit is not None:
+        _rate_limit.flush()
+
+
+def logging_stats() -> Dict[str, int]:
+    """Records dropped because the queue was full"""
+    return {'dropped': _handler.dropped if _handler is not None else 0}
+
+
+def shutdown_logging():
+    """Write out queued records and detach the handler"""
+    global _listener, _handler, _rate_limit
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+    _rate_limit = None
+
+
+if __name__ == "__main__":
+    # A burst of identical failures collapses into a few lines
+    setup_logging(fmt=sys.argv[1] if len(sys.argv) > 1 else 'text', period=1.0)
+    logger = logging.getLogger('demo')
+    for i in range(1000):
+        logger.warning("⚠ Failed to read frame (error count: %d)", i)
+    logger.info("✓ Count updated: %d squat reps", 3)
+    time.sleep(1.1)
+    flush_suppressed()
+    shutdown_logging()
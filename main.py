@@ -4,22 +4,20 @@ Headless exercise tracking service with RTSP input and MQTT output
 """
 import sys
 import os
+
+# Import-time audit mode (GOODGYM_IMPORT_AUDIT=1): time every module imported from here on
+if os.getenv('GOODGYM_IMPORT_AUDIT'):
+    import import_audit
+    import_audit.install()
+
 import time
+import logging
+import queue
 import signal
+import threading
 import cv2
-from typing import Optional
-
-# Configure RTMLib cache to use persistent storage BEFORE importing rtmlib
-# This prevents re-downloading models on every restart
-CACHE_DIR = "/data/.cache/rtmlib"
-os.makedirs(CACHE_DIR, exist_ok=True)
-os.makedirs(os.path.join(CACHE_DIR, "hub", "checkpoints"), exist_ok=True)
-
-# Set environment variables for model caching
-os.environ['TORCH_HOME'] = CACHE_DIR
-os.environ['HF_HOME'] = CACHE_DIR
-# RTMLib uses this directory pattern
-os.environ['XDG_CACHE_HOME'] = "/data/.cache"
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Tuple, TYPE_CHECKING
 
 # Add parent directory to path to import core modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -27,13 +25,34 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config_manager import ConfigManager
 from rtsp_handler import RTSPHandler
 from mqtt_publisher import MQTTPublisher
-from core.rtmpose_processor import RTMPoseProcessor
+from profiler import SamplingProfiler
+from log_setup import flush_suppressed, logging_stats, setup_logging, shutdown_logging
+from metrics import PipelineMetrics, PrometheusText, process_stats
+from memory_monitor import MemoryMonitor, heap_stats
+from model_store import ModelStore
+from core.rtmpose_processor import RTMPoseProcessor, create_model
 from exercise_counters import ExerciseCounter
 
+if TYPE_CHECKING:
+    # Only needed with some options, imported where they are used
+    from pose_server import PoseServer
+    from metrics_server import MetricsServer
+    from core.keypoint_predictor import KeypointPredictor
+    from core.exercise_classifier import ExerciseClassifier
+    from core.pose_tracker import PoseTracker
+
+logger = logging.getLogger('main')
+
 
 class GoodGymService:
     """Main service class for Good-GYM Home Assistant Addon"""
     
+    # Commands accepted on the MQTT control channel ({prefix}_command/<command>)
+    COMMANDS = ('reset', 'set_exercise', 'set_mode', 'pause', 'resume', 'set_fps', 'profile')
+    
+    # Publisher implementation (benchmark.py swaps in an in-process broker)
+    publisher_class = MQTTPublisher
+    
     def __init__(self, config_file: str = "/data/options.json"):
         """
         Initialize Good-GYM service
@@ -50,18 +69,55 @@ class GoodGymService:
         self.config = ConfigManager(config_file)
         self.config.print_config()
         
+        # Runtime messages go through a rate-limited, non-blocking logging queue
+        setup_logging(
+            level='debug' if self.config.get('enable_debug', False) else self.config.get('log_level', 'info'),
+            fmt=self.config.get('log_format', 'text'),
+        )
+        
         # Initialize components
         self.exercise_counter: Optional[ExerciseCounter] = None
+        self.exercise_counters: Dict[str, ExerciseCounter] = {}
+        self.exercise_classifier: Optional['ExerciseClassifier'] = None
         self.rtmpose_processor: Optional[RTMPoseProcessor] = None
+        self.keypoint_predictor: Optional['KeypointPredictor'] = None
+        self.pose_tracker: Optional['PoseTracker'] = None
         self.rtsp_handler: Optional[RTSPHandler] = None
         self.mqtt_publisher: Optional[MQTTPublisher] = None
+        self.pose_server: Optional['PoseServer'] = None
+        self.metrics_server: Optional['MetricsServer'] = None
         
         # State
         self.is_running = False
         self.frame_count = 0
-        self.last_count = 0
-        self.last_publish_time = 0
-        self.publish_interval = 0.5  # Publish every 0.5 seconds
+        self.dropped_frames = 0  # Received but not processed (frame_skip, set_fps, pause)
+        self.fps = 0.0  # Processed frames per second, updated every status tick
+        self.status_interval = 60.0
+        self.last_counts: Dict[str, int] = {}
+        self.paused = False
+        self.max_fps = 0.0  # Processing rate limit from the set_fps command (0 = unlimited)
+        self.last_processed_time = 0.0
+        
+        # Startup: phase durations (seconds), frames are dropped until the model is ready
+        self.startup_time = time.monotonic()
+        self.startup_timings: Dict[str, float] = {}
+        self.model_ready = False
+        
+        # Per-stage latency histograms, summarized in the log every metrics_log_interval seconds
+        self.metrics = PipelineMetrics()
+        self.metrics_log_interval = 60.0
+        self.last_metrics_log = time.monotonic()
+        
+        # Commands received from MQTT, applied between frames on the capture thread, or by
+        # the main loop when no frame arrives (stream down); frame_lock keeps them off a frame
+        self.commands: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+        self.frame_lock = threading.Lock()
+        self.last_command_check = time.monotonic()
+        self.model_switch_thread: Optional[threading.Thread] = None
+        
+        # On-demand profiler (SIGUSR1 or the 'profile' command), idle until started
+        self.profiler = SamplingProfiler(output_dir='/data/profiles')
+        self.profile_seconds = 30.0
         
         # Get configuration
         detection_config = self.config.get_detection_config()
@@ -69,46 +125,86 @@ class GoodGymService:
         self.frame_skip = detection_config['frame_skip']
         self.enable_debug = detection_config['enable_debug']
         self.max_resolution = detection_config.get('max_resolution', 640)
+        self.keypoint_prediction = detection_config.get('keypoint_prediction', True)
+        self.auto_exercises = detection_config.get('auto_exercises', [])
+        self.max_persons = detection_config.get('max_persons', 1)
+        self.rtmpose_mode = detection_config['rtmpose_mode']
+        # Startup calibration: rtmpose_mode and max_resolution chosen for target_fps (max_resolution as the cap)
+        self.auto_calibrate = detection_config.get('auto_calibrate', False)
+        self.target_fps = detection_config.get('target_fps', 10)
+        self.max_cpu_share = detection_config.get('max_cpu_share', 0.5)
+        self.calibration: Dict = {}
+        self.calibration_frame = None
+        self.backend = 'onnxruntime'
+        self.device = 'cpu'
+        # Model files live in /data/models (downloaded once, verified by hash), bundled ./models as fallback
+        self.model_store = ModelStore(search_dirs=['models'])
+        self.pose_server_port = self.config.get('pose_server_port', 0)
+        self.metrics_port = self.config.get('metrics_port', 0)
+        
+        # Memory reports every memory_log_interval seconds, baseline taken once the models are loaded
+        self.memory_monitor = MemoryMonitor(
+            interval=self.config.get('memory_log_interval', 300),
+            tracing=self.config.get('memory_tracing', False),
+        )
     
-    def initialize(self) -> bool:
+    def initialize(self, connect_stream: bool = True) -> bool:
         """
         Initialize all components
         
+        Model load and warm-up, the initial RTSP connect (including the first
+        decoded frame) and the MQTT connection run concurrently; each phase is
+        timed. Frames that arrive before the model is ready are dropped.
+        
+        Args:
+            connect_stream: Connect RTSP and start capturing during initialization
+                            (benchmark.py feeds frames itself)
+        
         Returns:
             True if all components initialized successfully
         """
         try:
+            init_start = time.monotonic()
+            self.startup_time = init_start
+            
             # 1. Initialize exercise counter
             print("📊 Initializing exercise counter...")
             self.exercise_counter = ExerciseCounter(smoothing_window=5)
-            print(f"✓ Exercise counter ready (type: {self.exercise_type})")
-            
-            # 2. Initialize RTMPose processor
-            print("\n🧠 Initializing RTMPose processor...")
-            detection_config = self.config.get_detection_config()
-            self.rtmpose_processor = RTMPoseProcessor(
-                exercise_counter=self.exercise_counter,
-                mode=detection_config['rtmpose_mode'],
-                backend='onnxruntime',
-                device='cpu'
-            )
-            # Disable skeleton drawing to save CPU
-            self.rtmpose_processor.set_skeleton_visibility(False)
-            print("✓ RTMPose processor ready")
+            if self.exercise_type == 'auto':
+                # One counter per candidate so a mixed workout is counted in one session
+                candidates = self.auto_exercises or list(self.exercise_counter.exercise_configs)
+                self.exercise_counters = {
+                    exercise: ExerciseCounter(smoothing_window=5) for exercise in candidates
+                }
+                from core.exercise_classifier import ExerciseClassifier
+                self.exercise_classifier = ExerciseClassifier(
+                    self.exercise_counter.registry, candidates
+                )
+                print(f"✓ Exercise counters ready (auto detection: {', '.join(candidates)})")
+            else:
+                print(f"✓ Exercise counter ready (type: {self.exercise_type})")
+            self.startup_timings['counter'] = time.monotonic() - init_start
             
-            # 3. Initialize MQTT publisher
+            # 2. Initialize MQTT publisher
             print("\n📡 Initializing MQTT publisher...")
             mqtt_config = self.config.get_mqtt_config()
-            self.mqtt_publisher = MQTTPublisher(mqtt_config, self.exercise_type)
+            self.mqtt_publisher = self.publisher_class(
+                mqtt_config,
+                self.exercise_type,
+                exercise_types=list(self.exercise_counters) or None,
+                max_persons=self.max_persons
+            )
             
+            # Connects in the background, messages are queued until the broker is up
+            self.mqtt_publisher.set_command_handler(self.handle_command)
             if not self.mqtt_publisher.connect():
-                print("✗ Failed to connect to MQTT broker")
+                print("✗ Invalid MQTT broker settings")
                 return False
             
             self.mqtt_publisher.publish_status('online', f'Tracking {self.exercise_type}')
             print("✓ MQTT publisher ready")
             
-            # 4. Initialize RTSP handler
+            # 3. Initialize RTSP handler
             print("\n🎥 Initializing RTSP handler...")
             rtsp_config = self.config.get_rtsp_config()
             self.rtsp_handler = RTSPHandler(
@@ -117,6 +213,42 @@ class GoodGymService:
             )
             print("✓ RTSP handler ready")
             
+            # 4. Model, stream and broker connection in parallel
+            phases = {'model': self.init_model, 'mqtt': self.wait_for_mqtt}
+            if connect_stream:
+                phases['rtsp'] = self.init_stream
+            pool = ThreadPoolExecutor(max_workers=len(phases), thread_name_prefix='init')
+            futures = {name: pool.submit(self.timed_phase, name, phase) for name, phase in phases.items()}
+            # The model is required; the stream and broker keep retrying on their own
+            try:
+                futures['model'].result()
+                if connect_stream:
+                    futures['rtsp'].result()
+            except Exception:
+                # Let the other phases finish, so stop() releases everything they started
+                pool.shutdown(wait=True)
+                raise
+            pool.shutdown(wait=False)
+            
+            # 5. Optional local pose server for co-located consumers
+            if self.pose_server_port:
+                from pose_server import PoseServer
+                self.pose_server = PoseServer(port=self.pose_server_port)
+                self.pose_server.start()
+            
+            # 6. Optional Prometheus endpoint
+            if self.metrics_port:
+                from metrics_server import MetricsServer
+                self.metrics_server = MetricsServer(self.metrics_port, self.render_metrics)
+                self.metrics_server.start()
+            
+            self.memory_monitor.start()
+            
+            self.startup_timings['total'] = time.monotonic() - init_start
+            print(f"\n⏱️  Startup: {self.startup_summary()}")
+            if os.getenv('GOODGYM_IMPORT_AUDIT'):
+                # Includes the imports deferred to the initialization phases
+                print("\n".join(import_audit.report()))
             print("\n✅ All components initialized successfully\n")
             return True
             
@@ -126,26 +258,171 @@ class GoodGymService:
             traceback.print_exc()
             return False
     
-    def process_frame(self, frame, frame_number: int):
+    def timed_phase(self, name: str, phase):
+        """Run an initialization phase and record its duration"""
+        phase_start = time.monotonic()
+        try:
+            return phase()
+        finally:
+            self.startup_timings[name] = time.monotonic() - phase_start
+    
+    def init_model(self):
+        """Load and warm up RTMPose, then let frames through (initialization phase)"""
+        if self.auto_calibrate:
+            calibration_start = time.monotonic()
+            self.calibrate()
+            self.startup_timings['calibration'] = time.monotonic() - calibration_start
+        
+        print("\n🧠 Initializing RTMPose processor...")
+        processor = RTMPoseProcessor(
+            exercise_counter=self.exercise_counter,
+            mode=self.rtmpose_mode,
+            backend=self.backend,
+            device=self.device,
+            model_store=self.model_store
+        )
+        # Disable skeleton drawing to save CPU
+        processor.set_skeleton_visibility(False)
+        
+        if self.exercise_classifier is not None:
+            processor.set_exercise_router(
+                self.exercise_classifier, self.exercise_counters
+            )
+        
+        # Count every person in view, each with its own counter
+        if self.max_persons > 1:
+            from core.pose_tracker import PoseTracker
+            self.pose_tracker = PoseTracker(
+                counter_factory=lambda: ExerciseCounter(smoothing_window=5),
+                max_tracks=self.max_persons
+            )
+            processor.set_pose_tracker(self.pose_tracker)
+            print(f"✓ Multi-person tracking enabled (up to {self.max_persons} people)")
+        
+        # Reconstruct skipped frames so fast reps are not missed
+        # (single-person only, the predictor follows one skeleton)
+        if self.frame_skip > 1 and self.keypoint_prediction and self.pose_tracker is None:
+            from core.keypoint_predictor import KeypointPredictor
+            self.keypoint_predictor = KeypointPredictor()
+            processor.set_keypoint_predictor(self.keypoint_predictor)
+            print(f"✓ Keypoint prediction enabled for skipped frames (frame_skip={self.frame_skip})")
+        
+        # The first real frame should not pay for lazy session setup
+        processor.warm_up(processor.wholebody)
+        self.rtmpose_processor = processor
+        self.model_ready = True
+        print("✓ RTMPose processor ready")
+    
+    def calibrate(self):
+        """Pick rtmpose_mode and max_resolution for target_fps (cached per device in /data)"""
+        from calibration import Calibrator, hardware_fingerprint
+        models = [self.model_store.models[name]['file']
+                  for names in self.model_store.modes.values() for name in names.values()]
+        calibrator = Calibrator(
+            build_model=lambda mode: create_model(self.model_store, mode, self.backend, self.device),
+            fingerprint=hardware_fingerprint(self.backend, self.device, set(models)),
+            target_fps=self.target_fps,
+            max_cpu_share=self.max_cpu_share,
+            max_resolution=self.max_resolution,
+        )
+        print(f"\n📐 Calibrating for {self.target_fps:g} fps within {self.max_cpu_share:.0%} CPU...")
+        try:
+            # Uses a camera frame if the stream connected in the meantime
+            self.calibration = calibrator.calibrate(get_frame=lambda: self.calibration_frame)
+        except Exception as e:
+            print(f"⚠ Calibration failed, keeping {self.rtmpose_mode} at {self.max_resolution}px: {e}")
+            return
+        finally:
+            self.calibration_frame = None
+        
+        self.rtmpose_mode = self.calibration['mode']
+        self.max_resolution = self.calibration['max_resolution']
+        source = ("cached" if not self.calibration['measured']
+                  else f"{self.calibration['measured']} candidate(s) timed on a {self.calibration['frame']} frame")
+        print("\n".join(calibrator.summary()))
+        print(f"✓ Calibration: {self.rtmpose_mode} at {self.max_resolution}px, "
+              f"{self.calibration['fps']:.1f} fps, {self.calibration['cpu_share']:.0%} CPU ({source})")
+    
+    def init_stream(self):
+        """Connect RTSP, decode the first frame and start capturing (initialization phase)"""
+        if self.rtsp_handler.connect():
+            self.rtsp_handler.start_capture(on_frame=self.process_frame)
+        else:
+            print("⚠ RTSP stream not reachable yet, the capture loop keeps retrying")
+    
+    def wait_for_mqtt(self, timeout: float = 10.0):
+        """Wait for the broker connection, only to time it (initialization phase, never blocks startup)"""
+        deadline = time.monotonic() + timeout
+        while not self.mqtt_publisher.is_connected and time.monotonic() < deadline:
+            time.sleep(0.02)
+    
+    def startup_summary(self) -> str:
+        """One-line summary of the initialization phase durations"""
+        timings = self.startup_timings
+        phases = [f"{name} {timings[name]:.2f}s" for name in ('model', 'rtsp') if name in timings]
+        if not self.mqtt_publisher.is_connected:
+            phases.append('mqtt pending')
+        elif 'mqtt' in timings:
+            phases.append(f"mqtt {timings['mqtt']:.2f}s")
+        return f"{', '.join(phases)} (in parallel), total {timings.get('total', 0.0):.2f}s"
+    
+    def process_frame(self, frame, frame_number: int, capture_time: Optional[float] = None):
         """
         Process a single frame from RTSP stream
         
         Args:
             frame: Video frame from RTSP
             frame_number: Frame number
+            capture_time: Wall-clock time the frame was read (defaults to now)
         """
+        if not self.model_ready:
+            # Stream connected before the model finished loading; calibration may use the frame
+            if self.auto_calibrate and not self.calibration:
+                self.calibration_frame = frame
+            self.dropped_frames += 1
+            return
+        self.frame_lock.acquire()
         try:
-            import time as perf_time
-            frame_start = perf_time.time()
+            clock = time.perf_counter_ns
+            start_ns = clock()
+            frame_start = time.time()
+            if capture_time is None:
+                capture_time = frame_start
+            # Capture time on the monotonic clock: prediction, classification and the
+            # rate limit follow the stream's timeline, not when the callback ran
+            frame_time = time.monotonic() - (frame_start - capture_time)
+            
+            # cProfile is per thread, the profiler switches it on/off from here
+            # (also after the window, to disable a cProfile left running by a stalled frame)
+            if self.profiler.cprofile_state != 'idle':
+                self.profiler.on_frame()
+            
+            # Commands from the MQTT control channel are applied between frames
+            self.last_command_check = time.monotonic()
+            if not self.commands.empty():
+                self.apply_commands()
+            if self.paused:
+                self.dropped_frames += 1
+                return
             
-            # Skip frames if configured
-            if self.frame_skip > 1 and frame_number % self.frame_skip != 0:
+            # Skip frames if configured (frame_skip, and the set_fps rate limit)
+            skip = self.frame_skip > 1 and frame_number % self.frame_skip != 0
+            if not skip and self.max_fps > 0:
+                skip = frame_time - self.last_processed_time < 1.0 / self.max_fps
+            if skip:
+                self.dropped_frames += 1
+                if self.keypoint_predictor is not None:
+                    self.keypoint_predictor.mark_skipped(frame_time)
                 return
             
+            self.last_processed_time = frame_time
             self.frame_count += 1
+            if self.frame_count == 1:
+                self.startup_timings['first_frame'] = time.monotonic() - self.startup_time
+                logger.info("⏱️  First frame processed %.2fs after startup", self.startup_timings['first_frame'])
             
             # Resize frame if needed to reduce CPU usage
-            resize_start = perf_time.time()
+            resize_start = clock()
             h, w = frame.shape[:2]
             if w > self.max_resolution:
                 scale = self.max_resolution / w
@@ -155,73 +432,382 @@ class GoodGymService:
                 
                 # Log resize for first 3 frames to confirm it's working
                 if self.frame_count <= 3:
-                    print(f"📏 Resized frame from {w}x{h} to {new_width}x{new_height} (max_resolution={self.max_resolution})")
+                    logger.info("📏 Resized frame from %dx%d to %dx%d (max_resolution=%d)",
+                                w, h, new_width, new_height, self.max_resolution)
             else:
                 # Warn if resolution is already small enough
                 if self.frame_count == 1:
-                    print(f"ℹ️  Frame resolution {w}x{h} is already below max_resolution={self.max_resolution}, no resize needed")
+                    logger.info("ℹ️  Frame resolution %dx%d is already below max_resolution=%d, no resize needed",
+                                w, h, self.max_resolution)
             
-            resize_time = (perf_time.time() - resize_start) * 1000  # ms
+            resize_ns = clock() - resize_start
             
             # Process frame with RTMPose
-            inference_start = perf_time.time()
+            inference_start = clock()
             processed_frame = self.rtmpose_processor.process_frame(
                 frame,
-                self.exercise_type
+                self.exercise_type,
+                timestamp=frame_time,
+                capture_time=capture_time
             )
-            inference_time = (perf_time.time() - inference_start) * 1000  # ms
+            inference_ns = clock() - inference_start
+            publish_start = clock()
+            
+            # One event per completed rep, stamped with its capture time
+            self.publish_rep_events()
+            
+            # Raw pose for other consumers (rate limited by the publisher)
+            if self.mqtt_publisher.keypoint_rate > 0:
+                self.mqtt_publisher.publish_keypoints(
+                    self.rtmpose_processor.last_pose,
+                    self.rtmpose_processor.last_pose_size,
+                    capture_time
+                )
             
             # Get current count and stage
-            current_count = self.exercise_counter.counter
-            current_stage = self.exercise_counter.stage
+            active_exercise, counter = self.get_active_exercise()
+            if counter is None:
+                # Auto detection has not recognised an exercise yet
+                self.record_metrics(start_ns, frame_start - capture_time, resize_ns, inference_ns, publish_start)
+                return
+            current_count = counter.counter
+            current_stage = counter.stage
+            if self.pose_tracker is not None:
+                # Main sensor reports the session total of everyone tracked
+                current_count = self.pose_tracker.total_reps()
+                current_stage = None
             
-            # Get current angle (for display/logging)
-            # Note: This is a simplified approach, actual angle depends on exercise type
-            angle = None  # RTMPose processor would need to expose this
+            # Current angle of the counted person (rate limited by the publisher)
+            angle = processed_frame[1] if self.pose_tracker is None else None
             
-            # Publish to MQTT if count changed or enough time has passed
-            current_time = time.time()
-            count_changed = current_count != self.last_count
-            time_to_publish = (current_time - self.last_publish_time) >= self.publish_interval
+            # Latest result for local consumers, serialized only when read
+            if self.pose_server is not None:
+                self.pose_server.update({
+                    'capture_time': capture_time,
+                    'frame': self.frame_count,
+                    'exercise_type': active_exercise,
+                    'count': current_count,
+                    'stage': current_stage,
+                    'angle': angle,
+                    'width': self.rtmpose_processor.last_pose_size[0],
+                    'height': self.rtmpose_processor.last_pose_size[1],
+                    'persons': [
+                        {'slot': slot, 'keypoints': keypoints, 'scores': scores}
+                        for slot, keypoints, scores in self.rtmpose_processor.last_pose
+                    ],
+                })
             
-            if count_changed or time_to_publish:
-                self.mqtt_publisher.publish_state(
-                    count=current_count,
-                    stage=current_stage,
-                    angle=angle,
-                    frame_count=self.frame_count
-                )
-                
-                self.last_publish_time = current_time
-                
-                # Log count changes
-                if count_changed:
-                    print(f"✓ Count updated: {current_count} reps (stage: {current_stage})")
-                    self.last_count = current_count
+            # The publisher only sends significant changes and a periodic heartbeat
+            self.mqtt_publisher.publish_state(
+                count=current_count,
+                stage=current_stage,
+                angle=angle,
+                exercise_type=active_exercise,
+                capture_time=capture_time,
+                frame_count=self.frame_count
+            )
+            self.publish_person_states(active_exercise, capture_time=capture_time)
             
-            # Performance logging every 25 frames
-            total_time = (perf_time.time() - frame_start) * 1000  # ms
-            if self.frame_count % 25 == 0:
-                print(f"⏱️  Performance [Frame #{self.frame_count}]:")
-                print(f"   - Resize: {resize_time:.1f}ms")
-                print(f"   - AI Inference: {inference_time:.1f}ms") 
-                print(f"   - Total: {total_time:.1f}ms")
-                print(f"   - Count: {current_count} | Stage: {current_stage}")
+            # Log count changes
+            if current_count != self.last_counts.get(active_exercise, 0):
+                logger.info("✓ Count updated: %d %s reps (stage: %s)", current_count, active_exercise, current_stage)
+                self.last_counts[active_exercise] = current_count
+            
+            self.record_metrics(start_ns, frame_start - capture_time, resize_ns, inference_ns, publish_start)
             
             # Debug output every 100 frames
-            if self.enable_debug and self.frame_count % 100 == 0:
-                print(f"📸 Processed {self.frame_count} frames | Count: {current_count} | Stage: {current_stage}")
+            if self.frame_count % 100 == 0:
+                logger.debug("📸 Processed %d frames | Count: %d | Stage: %s", self.frame_count, current_count, current_stage)
         
         except Exception as e:
-            print(f"✗ Error processing frame: {e}")
-            if self.enable_debug:
-                import traceback
-                traceback.print_exc()
+            logger.error("✗ Error processing frame: %s", e, exc_info=self.enable_debug)
+        finally:
+            self.frame_lock.release()
+    
+    def record_metrics(self, start_ns: int, capture_age: float, resize_ns: int, inference_ns: int,
+                       publish_start: int):
+        """
+        Record the stage durations of a processed frame and log a periodic summary
+        
+        Args:
+            start_ns: perf_counter_ns() when the frame callback started
+            capture_age: Seconds between capture and the start of the callback
+            resize_ns: Duration of the service-side resize
+            inference_ns: Duration of RTMPoseProcessor.process_frame
+            publish_start: perf_counter_ns() when publishing started
+        """
+        now = time.perf_counter_ns()
+        timings = self.rtmpose_processor.last_timings
+        detect_ns = timings.get('detect', 0)
+        pose_ns = timings.get('pose', 0)
+        processor_preprocess_ns = timings.get('preprocess', 0)
+        capture_age_ns = max(int(capture_age * 1e9), 0)
+        
+        self.metrics.record('decode', self.rtsp_handler.last_decode_ns)
+        self.metrics.record('queue', capture_age_ns, capture_age_ns)
+        self.metrics.record_frame({
+            'preprocess': resize_ns + processor_preprocess_ns,
+            'detect': detect_ns,
+            'pose': pose_ns,
+            # Everything else the processor does: keypoint filtering, prediction, classification, counting
+            'count': max(inference_ns - processor_preprocess_ns - detect_ns - pose_ns, 0),
+            'publish': now - publish_start,
+        }, capture_age_ns)
+        self.metrics.record('total', now - start_ns, capture_age_ns + now - start_ns)
+        
+        if time.monotonic() - self.last_metrics_log >= self.metrics_log_interval:
+            self.last_metrics_log = time.monotonic()
+            logger.info("⏱️  Latency [%d frames]: %s", self.frame_count, self.metrics.summary_line())
+            end_to_end = self.mqtt_publisher.end_to_end_latency['state'].recent()
+            if end_to_end.count:
+                logger.info("⏱️  Glass-to-MQTT: %.0f/%.0f ms (p50/p99, capture clock: %s)",
+                            end_to_end.percentile(0.5) / 1e6, end_to_end.percentile(0.99) / 1e6,
+                            self.rtsp_handler.timestamp_source)
+            overhead = self.metrics.overhead_fraction()
+            if overhead > 0.01:
+                logger.warning("⚠ Metrics overhead %.1f%% of the median frame time", 100 * overhead)
+    
+    def get_stats(self) -> Dict:
+        """
+        Get service statistics (latency histograms, capture and MQTT counters)
+        
+        Returns:
+            Dict with 'frames', 'metrics', 'latency', 'rtsp', 'mqtt', 'memory', 'startup',
+            'model_store' and 'calibration' sections;
+            'latency' splits glass-to-MQTT time into capture queueing, processing
+            and the MQTT send queue (rolling, last one to two minutes)
+        """
+        return {
+            'frames': self.frame_count,
+            'dropped_frames': self.dropped_frames,
+            'fps': round(self.fps, 2),
+            'metrics': self.metrics.snapshot(),
+            'latency': {
+                'queue': self.metrics.latency['queue'].snapshot(),
+                'processing': self.metrics.latency['total'].snapshot(),
+                **(self.mqtt_publisher.get_latency() if self.mqtt_publisher else {}),
+            },
+            'rtsp': self.rtsp_handler.get_stats() if self.rtsp_handler else {},
+            'mqtt': self.mqtt_publisher.get_stats() if self.mqtt_publisher else {},
+            'memory': self.memory_monitor.get_stats(),
+            'logging': logging_stats(),
+            'startup': {name: round(seconds, 3) for name, seconds in self.startup_timings.items()},
+            'model_store': self.model_store.get_stats(),
+            'calibration': self.calibration,
+        }
+    
+    def render_metrics(self) -> bytes:
+        """Render service metrics in Prometheus text format (called on each scrape)"""
+        text = PrometheusText()
+        processor = self.rtmpose_processor
+        text.metric('info', 'gauge', 'Add-on build and model information', [({
+            'backend': processor.backend if processor else '',
+            'device': processor.device if processor else '',
+            'mode': self.rtmpose_mode,
+            'exercise_type': self.exercise_type,
+        }, 1)])
+        text.metric('up', 'gauge', 'Whether frames are being processed (0 while paused)',
+                    [(None, 0 if self.paused else 1)])
+        text.metric('fps', 'gauge', 'Processed frames per second', [(None, round(self.fps, 3))])
+        text.metric('frames_processed_total', 'counter', 'Frames run through pose estimation',
+                    [(None, self.frame_count)])
+        text.metric('frames_dropped_total', 'counter', 'Frames received but not processed (frame_skip, set_fps, pause)',
+                    [(None, self.dropped_frames)])
+        
+        if self.rtsp_handler:
+            rtsp = self.rtsp_handler.get_stats()
+            text.metric('rtsp_connected', 'gauge', 'RTSP stream connected', [(None, int(rtsp['is_connected']))])
+            text.metric('rtsp_frames_total', 'counter', 'Frames read from the RTSP stream', [(None, rtsp['frame_count'])])
+            text.metric('rtsp_read_errors_total', 'counter', 'Failed RTSP frame reads', [(None, rtsp['read_errors'])])
+            text.metric('rtsp_reconnects_total', 'counter', 'RTSP reconnections', [(None, rtsp['reconnect_count'])])
+            text.metric('rtsp_captures_created_total', 'counter', 'cv2.VideoCapture objects created',
+                        [(None, rtsp['captures_created'])])
+            text.metric('rtsp_captures_open', 'gauge', 'cv2.VideoCapture objects not yet released',
+                        [(None, rtsp['captures_open'])])
+        
+        if self.mqtt_publisher:
+            mqtt = self.mqtt_publisher.get_stats()
+            text.metric('mqtt_connected', 'gauge', 'MQTT broker connected', [(None, int(mqtt['connected']))])
+            text.metric('mqtt_queue_depth', 'gauge', 'Messages waiting in the MQTT send queue', [(None, mqtt['queue_depth'])])
+            text.metric('mqtt_spool_bytes', 'gauge', 'Size of the on-disk event spool', [(None, mqtt['spool_bytes'])])
+            text.metric('mqtt_messages_total', 'counter', 'MQTT messages by outcome',
+                        [({'outcome': key}, mqtt[key]) for key in ('sent', 'coalesced', 'dropped', 'spooled', 'replayed')])
+        
+        text.histogram('stage_latency_seconds', 'Duration of each pipeline stage', self.metrics.latency, 'stage')
+        if self.mqtt_publisher:
+            text.histogram('end_to_end_latency_seconds', 'Frame capture until handed to the MQTT client',
+                           {kind: h.total for kind, h in self.mqtt_publisher.end_to_end_latency.items()}, 'kind')
+            text.histogram('mqtt_send_queue_seconds', 'Time messages wait in the MQTT send queue',
+                           {'all': self.mqtt_publisher.send_queue_latency.total}, 'queue')
+        text.histogram('frame_age_seconds', 'Time since capture at the end of each pipeline stage', self.metrics.age, 'stage')
+        
+        text.metric('startup_phase_seconds', 'gauge', 'Duration of the initialization phases (first_frame: until the first processed frame)',
+                    [({'phase': name}, round(seconds, 3)) for name, seconds in self.startup_timings.items()])
+        
+        process = process_stats()
+        text.metric('process_resident_memory_bytes', 'gauge', 'Resident set size', [(None, process['rss_bytes'])])
+        text.metric('process_resident_memory_anon_bytes', 'gauge', 'Anonymous (heap) part of the resident set',
+                    [(None, process['rss_anon_bytes'])])
+        heap = heap_stats()
+        if heap:
+            text.metric('process_heap_bytes', 'gauge', 'glibc malloc heap (native allocations incl. inference arenas)',
+                        [({'state': 'in_use'}, heap['heap_in_use_bytes']), ({'state': 'free'}, heap['heap_free_bytes'])])
+        text.metric('process_cpu_seconds_total', 'counter', 'User and system CPU time', [(None, round(process['cpu_seconds'], 3))])
+        return text.render()
+    
+    def publish_person_states(self, exercise_type: str, **kwargs):
+        """Publish the state of every tracked person to its own sensor"""
+        if self.pose_tracker is None:
+            return
+        for track in self.pose_tracker.tracks:
+            self.mqtt_publisher.publish_state(
+                count=track.counter.counter,
+                stage=track.counter.stage,
+                angle=track.angle,
+                exercise_type=exercise_type,
+                person=track.slot,
+                **kwargs
+            )
+    
+    def handle_command(self, command: str, payload: str):
+        """Queue a command from the MQTT control channel (called on the MQTT thread)"""
+        if command not in self.COMMANDS:
+            logger.warning("⚠ Unknown command: %s (valid: %s)", command, ', '.join(self.COMMANDS))
+            return
+        self.commands.put((command, payload))
+    
+    def apply_commands(self):
+        """Apply queued commands, called between two frames (with frame_lock held)"""
+        while True:
+            try:
+                command, payload = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                message = getattr(self, f'command_{command}')(payload)
+                logger.info("🎛️  Command %s applied: %s", command, message)
+                self.mqtt_publisher.publish_status('online', message)
+            except ValueError as e:
+                logger.warning("✗ Command %s rejected: %s", command, e)
+                self.mqtt_publisher.publish_status('online', f'Command {command} rejected: {e}')
+    
+    def command_reset(self, payload: str) -> str:
+        """Reset all counts and start a new session"""
+        for counter in [self.exercise_counter, *self.exercise_counters.values()]:
+            counter.reset_counter()
+        if self.pose_tracker is not None:
+            self.pose_tracker.reset()
+        if self.keypoint_predictor is not None:
+            self.keypoint_predictor.reset()
+        self.last_counts.clear()
+        self.mqtt_publisher.reset_session()
+        return 'Counts reset'
+    
+    def command_set_exercise(self, payload: str) -> str:
+        """Switch to a fixed exercise (leaves auto detection)"""
+        exercise_type = payload.strip()
+        if exercise_type not in self.exercise_counter.exercise_configs:
+            raise ValueError(f"unknown exercise '{exercise_type}'")
+        
+        self.exercise_type = exercise_type
+        self.exercise_counter.reset_counter()
+        if self.exercise_classifier is not None:
+            # A fixed exercise is counted by the main counter
+            self.exercise_classifier = None
+            self.exercise_counters = {}
+            self.rtmpose_processor.set_exercise_router(None, {})
+            self.rtmpose_processor.exercise_counter = self.exercise_counter
+            self.rtmpose_processor.active_exercise = None
+        if self.pose_tracker is not None:
+            self.pose_tracker.reset()
+        if self.keypoint_predictor is not None:
+            self.keypoint_predictor.mark_lost()
+        self.last_counts.clear()
+        self.mqtt_publisher.add_exercise(exercise_type)
+        return f'Tracking {exercise_type}'
+    
+    def command_set_mode(self, payload: str) -> str:
+        """Load another RTMPose mode in the background, frames keep using the current model"""
+        mode = payload.strip()
+        if mode not in ('lightweight', 'balanced', 'performance'):
+            raise ValueError(f"invalid mode '{mode}'")
+        if self.model_switch_thread is not None and self.model_switch_thread.is_alive():
+            raise ValueError("a model switch is already in progress")
+        
+        self.model_switch_thread = self.rtmpose_processor.update_model(
+            mode, on_complete=self.on_model_switched
+        )
+        return f'Loading {mode} model'
+    
+    def on_model_switched(self, mode: str, error: Optional[Exception]):
+        """Report the result of a background model switch"""
+        if error is None:
+            self.rtmpose_mode = mode
+            self.mqtt_publisher.publish_status('online', f'Model mode: {mode}')
+        else:
+            self.mqtt_publisher.publish_status('online', f'Model switch to {mode} failed, keeping {self.rtmpose_mode}')
+    
+    def command_pause(self, payload: str) -> str:
+        """Stop processing frames (the stream stays connected)"""
+        self.paused = True
+        return 'Paused'
+    
+    def command_resume(self, payload: str) -> str:
+        """Resume processing frames"""
+        self.paused = False
+        if self.keypoint_predictor is not None:
+            self.keypoint_predictor.mark_lost()
+        return f'Tracking {self.exercise_type}'
+    
+    def command_set_fps(self, payload: str) -> str:
+        """Limit the processing rate (0 = every frame allowed by frame_skip)"""
+        try:
+            fps = float(payload)
+        except ValueError:
+            raise ValueError(f"invalid frame rate '{payload}'")
+        if fps < 0:
+            raise ValueError("frame rate must be >= 0")
+        self.max_fps = fps
+        return f'Processing rate limit: {fps:g} fps' if fps else 'Processing rate limit removed'
+    
+    def command_profile(self, payload: str) -> str:
+        """Profile all threads for a number of seconds (default profile_seconds)"""
+        try:
+            seconds = float(payload) if payload.strip() else self.profile_seconds
+        except ValueError:
+            raise ValueError(f"invalid duration '{payload}'")
+        seconds = self.profiler.start(seconds)
+        return f'Profiling for {seconds:g}s, results in {self.profiler.output_dir}'
+    
+    def publish_rep_events(self):
+        """Publish the reps completed by every counter since the last frame"""
+        counters = self.exercise_counters or {self.exercise_type: self.exercise_counter}
+        for exercise_type, counter in counters.items():
+            for event in counter.pop_rep_events():
+                self.mqtt_publisher.publish_rep_event(exercise_type, event)
+        if self.pose_tracker is not None:
+            for track in self.pose_tracker.tracks:
+                for event in track.counter.pop_rep_events():
+                    self.mqtt_publisher.publish_rep_event(self.exercise_type, event, person=track.slot)
+    
+    def get_active_exercise(self) -> Tuple[str, Optional[ExerciseCounter]]:
+        """
+        Get the exercise currently being counted and its counter
+        
+        Returns:
+            (exercise type, counter); counter is None while auto detection is undecided
+        """
+        if self.exercise_classifier is None:
+            return self.exercise_type, self.exercise_counter
+        active = self.rtmpose_processor.active_exercise if self.rtmpose_processor else None
+        return active, self.exercise_counters.get(active)
     
     def start(self):
         """Start the service"""
         if not self.initialize():
             print("✗ Failed to initialize service")
+            # Release what the initialization phases started (stream, broker, logging queue)
+            self.stop()
             return False
         
         print("▶️  Starting Good-GYM service...\n")
@@ -233,21 +819,46 @@ class GoodGymService:
         
         self.is_running = True
         
-        # Start RTSP capture with frame callback
-        self.rtsp_handler.start_capture(on_frame=self.process_frame)
+        # Start RTSP capture with frame callback (already running if the stream connected during initialization)
+        if not self.rtsp_handler.is_running:
+            self.rtsp_handler.start_capture(on_frame=self.process_frame)
         
         print("✅ Service started successfully!")
         print("   Press Ctrl+C to stop\n")
         
         # Keep main thread alive
         try:
+            last_tick = last_status = time.monotonic()
+            last_frames = self.frame_count
             while self.is_running:
                 time.sleep(1)
                 
+                # Processing rate over the last tick
+                now = time.monotonic()
+                self.fps = (self.frame_count - last_frames) / (now - last_tick)
+                last_tick, last_frames = now, self.frame_count
+                
+                # No frame applied the queued commands (stream down): apply them here
+                if not self.commands.empty() and now - self.last_command_check >= 1.0:
+                    if self.frame_lock.acquire(blocking=False):
+                        try:
+                            self.apply_commands()
+                        finally:
+                            self.frame_lock.release()
+                
                 # Periodic status check
-                if self.frame_count > 0 and self.frame_count % 300 == 0:
+                if now - last_status >= self.status_interval:
+                    last_status = now
                     stats = self.rtsp_handler.get_stats()
-                    print(f"📊 Status - Frames: {self.frame_count}, Count: {self.exercise_counter.counter}, RTSP: {stats}")
+                    active_exercise, counter = self.get_active_exercise()
+                    count = counter.counter if counter else 0
+                    logger.info("📊 Status - Frames: %d (%.1f fps), Count: %d (%s), RTSP: %s, MQTT: %s",
+                                self.frame_count, self.fps, count, active_exercise, stats,
+                                self.mqtt_publisher.get_stats())
+                
+                # Both keep their own interval (memory_log_interval, rate limit period)
+                self.memory_monitor.check(now)
+                flush_suppressed()
         
         except KeyboardInterrupt:
             print("\n⏹️  Received stop signal...")
@@ -256,7 +867,7 @@ class GoodGymService:
             self.stop()
     
     def stop(self):
-        """Stop the service"""
+        """Stop the service (also after a partial initialization)"""
         print("\n🛑 Stopping Good-GYM service...")
         
         self.is_running = False
@@ -264,23 +875,47 @@ class GoodGymService:
         # Stop RTSP capture
         if self.rtsp_handler:
             self.rtsp_handler.stop_capture()
+            # Connected during initialization, but the capture loop (which releases it) never started
+            if self.rtsp_handler.capture_thread is None and self.rtsp_handler.cap is not None:
+                self.rtsp_handler.disconnect()
+        
+        if self.pose_server:
+            self.pose_server.stop()
+        
+        if self.metrics_server:
+            self.metrics_server.stop()
+        
+        self.memory_monitor.stop()
         
         # Publish final state and offline status
-        if self.mqtt_publisher and self.mqtt_publisher.is_connected:
-            self.mqtt_publisher.publish_state(
-                count=self.exercise_counter.counter if self.exercise_counter else 0,
-                stage=self.exercise_counter.stage if self.exercise_counter else None,
-                angle=None
-            )
+        if self.mqtt_publisher:
+            counters = self.exercise_counters or {self.exercise_type: self.exercise_counter}
+            for exercise_type, counter in counters.items():
+                self.mqtt_publisher.publish_state(
+                    count=counter.counter if counter else 0,
+                    stage=counter.stage if counter else None,
+                    angle=None,
+                    exercise_type=exercise_type,
+                    force=True
+                )
+            self.publish_person_states(self.exercise_type, force=True)
             self.mqtt_publisher.publish_status('offline', 'Service stopped')
             self.mqtt_publisher.disconnect()
         
+        shutdown_logging()
         print("✅ Service stopped gracefully\n")
     
     def signal_handler(self, signum, frame):
         """Handle shutdown signals"""
         print(f"\n⚠️  Received signal {signum}")
         self.is_running = False
+    
+    def profile_signal_handler(self, signum, frame):
+        """Start a profile on SIGUSR1 (kill -USR1 <pid>)"""
+        try:
+            self.profiler.start(self.profile_seconds)
+        except ValueError as e:
+            logger.warning("⚠ Profile not started: %s", e)
 
 
 def main():
@@ -298,6 +933,7 @@ def main():
     # Register signal handlers
     signal.signal(signal.SIGINT, service.signal_handler)
     signal.signal(signal.SIGTERM, service.signal_handler)
+    signal.signal(signal.SIGUSR1, service.profile_signal_handler)
     
     # Start service
     service.start()
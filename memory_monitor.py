@@ -0,0 +1,214 @@
+"""
+Memory telemetry for Good-GYM Home Assistant Addon
+Periodic RSS / native heap reporting and optional tracemalloc growth diffs
+
+The add-on runs for weeks, so slow growth matters more than the absolute size.
+Every report logs RSS split into anonymous (heap) and file-backed (libraries,
+models) pages, the glibc heap where available (native allocations such as
+onnxruntime's CPU arena and OpenCV frame buffers) and the growth rate over the
+reporting history. With tracing enabled, tracemalloc snapshots are diffed
+between reports and the Python allocation sites that grew most are logged.
+"""
+import ctypes
+import ctypes.util
+import logging
+import time
+import tracemalloc
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from metrics import process_stats
+
+logger = logging.getLogger(__name__)
+
+
+class _MallInfo2(ctypes.Structure):
+    """struct mallinfo2 (glibc >= 2.33)"""
+    _fields_ = [(name, ctypes.c_size_t) for name in (
+        'arena', 'ordblks', 'smblks', 'hblks', 'hblkhd', 'usmblks', 'fsmblks', 'uordblks', 'fordblks', 'keepcost'
+    )]
+
+
+def _load_mallinfo2():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6')
+        function = libc.mallinfo2
+    except (OSError, AttributeError):
+        return None  # musl, macOS or an older glibc
+    function.restype = _MallInfo2
+    function.argtypes = []
+    return function
+
+
+_mallinfo2 = _load_mallinfo2()
+
+
+def heap_stats() -> Dict[str, int]:
+    """
+    glibc malloc statistics (bytes)
+
+    Returns:
+        heap_in_use_bytes (including mmap'd blocks), heap_free_bytes (held by malloc
+        but unused, i.e. fragmentation) and heap_mmap_bytes; empty when unavailable
+    """
+    if _mallinfo2 is None:
+        return {}
+    info = _mallinfo2()
+    return {
+        'heap_in_use_bytes': info.uordblks + info.hblkhd,
+        'heap_free_bytes': info.fordblks,
+        'heap_mmap_bytes': info.hblkhd,
+    }
+
+
+def growth_rate(samples: Sequence[Tuple[float, float]]) -> float:
+    """
+    Least-squares slope of (time seconds, bytes) samples
+
+    Returns:
+        Growth in bytes per hour (0 with fewer than two samples)
+    """
+    if len(samples) < 2:
+        return 0.0
+    count = len(samples)
+    mean_t = sum(t for t, _ in samples) / count
+    mean_v = sum(v for _, v in samples) / count
+    variance = sum((t - mean_t) ** 2 for t, _ in samples)
+    if variance == 0:
+        return 0.0
+    covariance = sum((t - mean_t) * (v - mean_v) for t, v in samples)
+    return covariance / variance * 3600.0
+
+
+class MemoryMonitor:
+    """Periodic memory reports, driven by check() from the service status loop"""
+
+    # Allocation sites that belong to the measurement itself
+    TRACE_FILTERS = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        tracemalloc.Filter(False, '<unknown>'),
+    )
+
+    def __init__(self, interval: float = 300.0, tracing: bool = False, trace_frames: int = 1,
+                 top: int = 10, history: int = 288):
+        """
+        Initialize memory monitor
+
+        Args:
+            interval: Seconds between reports (0 = off)
+            tracing: Take tracemalloc snapshots and log the top growing allocation sites
+                     (Python allocations only; slows allocation-heavy code down noticeably)
+            trace_frames: Frames stored per traced allocation
+            top: Allocation sites logged per report
+            history: Reports kept for the growth rate (288 x 5 min = 24 h)
+        """
+        self.interval = interval
+        self.tracing = tracing
+        self.trace_frames = trace_frames
+        self.top = top
+        self.samples: "deque[Tuple[float, float]]" = deque(maxlen=history)
+        self.last_report = time.monotonic()
+        self.start_time = time.monotonic()
+        self.baseline: Dict[str, int] = {}
+        self.latest: Dict[str, int] = {}
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.started_tracing = False
+
+    def start(self):
+        """Record the baseline and start tracing if enabled"""
+        if self.tracing and not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            self.started_tracing = True
+        self.baseline = self.sample()
+        self.samples.append((0.0, self.baseline['rss_bytes']))
+        if self.tracing:
+            self.snapshot = self._take_snapshot()
+        self.last_report = time.monotonic()
+
+    def stop(self):
+        """Stop tracing (if this monitor started it)"""
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        self.snapshot = None
+
+    def sample(self) -> Dict[str, int]:
+        """Current memory figures (bytes)"""
+        stats = process_stats()
+        sample = {key: value for key, value in stats.items() if key.endswith('_bytes')}
+        sample.update(heap_stats())
+        if tracemalloc.is_tracing():
+            sample['traced_bytes'] = tracemalloc.get_traced_memory()[0]
+        self.latest = sample
+        return sample
+
+    def check(self, now: Optional[float] = None):
+        """Report if the interval has passed (call regularly, e.g. every status tick)"""
+        if self.interval <= 0:
+            return
+        now = time.monotonic() if now is None else now
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report(now)
+
+    def report(self, now: Optional[float] = None):
+        """Log a memory report and, when tracing, the top growing allocation sites"""
+        now = time.monotonic() if now is None else now
+        sample = self.sample()
+        self.samples.append((now - self.start_time, sample['rss_bytes']))
+        mb = 1024 * 1024
+
+        line = (f"🧠 Memory - RSS {sample['rss_bytes'] / mb:.1f} MB "
+                f"(anon {sample['rss_anon_bytes'] / mb:.1f}, file {sample['rss_file_bytes'] / mb:.1f}, "
+                f"peak {sample['peak_rss_bytes'] / mb:.1f})")
+        if 'heap_in_use_bytes' in sample:
+            line += (f", heap {sample['heap_in_use_bytes'] / mb:.1f} MB in use / "
+                     f"{sample['heap_free_bytes'] / mb:.1f} MB free")
+        if 'traced_bytes' in sample:
+            line += f", Python {sample['traced_bytes'] / mb:.1f} MB"
+        line += (f", {(sample['rss_bytes'] - self.baseline.get('rss_bytes', 0)) / mb:+.1f} MB since start"
+                 f" ({growth_rate(self.samples) / mb:+.1f} MB/h)")
+        if self.tracing and tracemalloc.is_tracing():
+            sites = self.top_growth()
+            if sites:
+                line += "\n   Top growing allocation sites:\n   " + "\n   ".join(sites)
+        logger.info(line)
+
+    def top_growth(self) -> List[str]:
+        """Allocation sites that grew most since the previous snapshot (formatted lines)"""
+        snapshot = self._take_snapshot()
+        previous, self.snapshot = self.snapshot, snapshot
+        if previous is None:
+            return []
+        lines = []
+        for diff in snapshot.compare_to(previous, 'lineno')[:self.top]:
+            if diff.size_diff <= 0:
+                break
+            frame = diff.traceback[0]
+            lines.append(f"{diff.size_diff / 1024:+.1f} KiB ({diff.count_diff:+d} blocks, "
+                         f"{diff.size / 1024:.1f} KiB total) {frame.filename}:{frame.lineno}")
+        return lines
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(self.TRACE_FILTERS)
+
+    def get_stats(self) -> Dict[str, float]:
+        """Latest sample plus the RSS growth rate"""
+        stats = dict(self.latest or self.sample())
+        stats['rss_growth_bytes_per_hour'] = round(growth_rate(self.samples))
+        return stats
+
+
+if __name__ == "__main__":
+    # Report a growing list every second
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    monitor = MemoryMonitor(interval=1.0, tracing=True)
+    monitor.start()
+    leak = []
+    for _ in range(5):
+        leak.extend(bytearray(100_000) for _ in range(50))
+        time.sleep(1.0)
+        monitor.check()
+    monitor.stop()
@@ -0,0 +1,287 @@
+"""
+Latency metrics for Good-GYM Home Assistant Addon
+Fixed-size log-bucket histograms for the per-frame pipeline stages,
+exported in Prometheus text format (served by metrics_server.py)
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# Bucket upper bounds in nanoseconds: 1 us to ~134 s, 8 buckets per octave (~9% wide)
+BUCKETS_PER_OCTAVE = 8
+BUCKET_BOUNDS = [int(1000 * 2 ** (i / BUCKETS_PER_OCTAVE)) for i in range(27 * BUCKETS_PER_OCTAVE + 1)]
+
+
+class LatencyHistogram:
+    """Constant-memory latency histogram with percentile estimates
+
+    record() is a bisect over fixed bucket bounds plus a few integer updates, so
+    it is cheap enough for every frame. Percentiles are reported as the geometric
+    centre of the bucket, i.e. within about 5% of the true value.
+    """
+
+    __slots__ = ('counts', 'count', 'total_ns', 'max_ns')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, duration_ns: int):
+        """Add one duration in nanoseconds"""
+        self.counts[bisect_left(BUCKET_BOUNDS, duration_ns)] += 1
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+
+    def reset(self):
+        """Drop all samples"""
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def percentile(self, fraction: float) -> float:
+        """Estimated value (ns) below which fraction of the samples fall"""
+        if self.count == 0:
+            return 0.0
+        target = fraction * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target and bucket_count:
+                upper = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.max_ns
+                lower = BUCKET_BOUNDS[index - 1] if index > 0 else 0
+                return min((lower * upper) ** 0.5 if lower else upper, self.max_ns)
+        return float(self.max_ns)
+
+    def merge(self, other: 'LatencyHistogram') -> 'LatencyHistogram':
+        """New histogram holding the samples of both"""
+        merged = LatencyHistogram()
+        merged.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        merged.count = self.count + other.count
+        merged.total_ns = self.total_ns + other.total_ns
+        merged.max_ns = max(self.max_ns, other.max_ns)
+        return merged
+
+    def cumulative_buckets(self, step: int = BUCKETS_PER_OCTAVE) -> List[Tuple[float, int]]:
+        """
+        Cumulative counts at every step-th bucket bound (one per octave by default)
+
+        Returns:
+            List of (upper bound in seconds, samples <= bound), ending with (+Inf, count)
+        """
+        buckets = []
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts[:-1]):
+            cumulative += bucket_count
+            if index % step == 0:
+                buckets.append((BUCKET_BOUNDS[index] / 1e9, cumulative))
+        buckets.append((float('inf'), self.count))
+        return buckets
+
+    def snapshot(self) -> Dict[str, float]:
+        """Summary in milliseconds"""
+        ms = 1e-6
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ns / self.count * ms, 3) if self.count else 0.0,
+            'p50_ms': round(self.percentile(0.50) * ms, 3),
+            'p90_ms': round(self.percentile(0.90) * ms, 3),
+            'p99_ms': round(self.percentile(0.99) * ms, 3),
+            'max_ms': round(self.max_ns * ms, 3),
+        }
+
+
+class WindowedHistogram:
+    """Cumulative histogram plus a rolling view of the last one to two windows
+
+    Recording goes to both the cumulative histogram (for Prometheus) and the
+    current window; windows rotate on the first sample after window seconds,
+    so recent() always covers at least the last full window.
+    """
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self.total = LatencyHistogram()
+        self.current = LatencyHistogram()
+        self.previous = LatencyHistogram()
+        self.window_start = time.monotonic()
+
+    def record(self, duration_ns: int):
+        """Add one duration in nanoseconds"""
+        now = time.monotonic()
+        if now - self.window_start >= self.window:
+            # A gap longer than two windows leaves nothing recent
+            self.previous = self.current if now - self.window_start < 2 * self.window else LatencyHistogram()
+            self.current = LatencyHistogram()
+            self.window_start = now
+        self.total.record(duration_ns)
+        self.current.record(duration_ns)
+
+    def recent(self) -> LatencyHistogram:
+        """Samples of the current and the previous window"""
+        return self.current.merge(self.previous)
+
+
+class PipelineMetrics:
+    """Per-stage latency and frame-age histograms for the frame pipeline
+
+    Stage durations come from time.perf_counter_ns() boundaries taken by the
+    caller. Frame age is the time since capture at the end of each stage,
+    derived from the same boundaries plus one wall-clock reading per frame.
+    """
+
+    # queue: time from capture until processing starts (buffering, callback backlog)
+    STAGES = ('decode', 'queue', 'preprocess', 'detect', 'pose', 'count', 'publish', 'total')
+
+    def __init__(self, stages: Optional[Iterable[str]] = None):
+        self.stages = tuple(stages or self.STAGES)
+        self.latency = {stage: LatencyHistogram() for stage in self.stages}
+        self.age = {stage: LatencyHistogram() for stage in self.stages}
+        self.overhead_ns = self.measure_overhead()
+
+    def record(self, stage: str, duration_ns: int, age_ns: Optional[int] = None):
+        """Record a stage duration and optionally the frame age at its end"""
+        self.latency[stage].record(duration_ns)
+        if age_ns is not None and age_ns >= 0:
+            self.age[stage].record(age_ns)
+
+    def record_frame(self, timings: Dict[str, int], capture_age_ns: Optional[int] = None):
+        """
+        Record consecutive stages of one frame
+
+        Args:
+            timings: Stage -> duration (ns), in pipeline order
+            capture_age_ns: Age of the frame (time since capture) when the first stage started
+        """
+        elapsed = 0
+        for stage, duration_ns in timings.items():
+            elapsed += duration_ns
+            self.record(stage, duration_ns, None if capture_age_ns is None else capture_age_ns + elapsed)
+
+    def reset(self):
+        """Drop all samples"""
+        for histogram in list(self.latency.values()) + list(self.age.values()):
+            histogram.reset()
+
+    @staticmethod
+    def measure_overhead(samples: int = 20000) -> float:
+        """Cost in ns of one instrumentation point (perf_counter_ns + record)"""
+        histogram = LatencyHistogram()
+        clock = time.perf_counter_ns
+        start = clock()
+        for _ in range(samples):
+            histogram.record(clock() - start)
+        return (clock() - start) / samples
+
+    def overhead_fraction(self) -> float:
+        """Instrumentation cost per frame relative to the median frame time"""
+        frame_ns = self.latency['total'].percentile(0.5) if 'total' in self.latency else 0
+        if not frame_ns:
+            return 0.0
+        # One clock reading and two histogram updates (latency + age) per stage
+        return 2 * len(self.stages) * self.overhead_ns / frame_ns
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Summary of every stage"""
+        return {
+            'latency': {stage: h.snapshot() for stage, h in self.latency.items() if h.count},
+            'frame_age': {stage: h.snapshot() for stage, h in self.age.items() if h.count},
+            'overhead_pct': round(100 * self.overhead_fraction(), 3),
+        }
+
+    def summary_line(self) -> str:
+        """One-line p50/p99 summary for the log"""
+        parts = []
+        for stage, histogram in self.latency.items():
+            if histogram.count:
+                parts.append(f"{stage} {histogram.percentile(0.5) / 1e6:.1f}/{histogram.percentile(0.99) / 1e6:.1f}")
+        return ' | '.join(parts) + ' ms (p50/p99)'
+
+
+# /proc/self/status fields reported by process_stats (values in kB)
+PROC_MEMORY_FIELDS = {'VmRSS': 'rss_bytes', 'RssAnon': 'rss_anon_bytes', 'RssFile': 'rss_file_bytes',
+                      'VmHWM': 'peak_rss_bytes'}
+
+
+def process_stats() -> Dict[str, float]:
+    """Resident memory (bytes, from /proc) and CPU time (seconds) of this process
+
+    rss_anon_bytes is the heap part of RSS (Python objects, native allocations such
+    as inference arenas and frame buffers), rss_file_bytes the mapped libraries and
+    models, peak_rss_bytes the high-water mark.
+    """
+    times = os.times()
+    stats = {'cpu_seconds': times.user + times.system}
+    stats.update({key: 0 for key in PROC_MEMORY_FIELDS.values()})
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                field = line.split(':', 1)[0]
+                if field in PROC_MEMORY_FIELDS:
+                    stats[PROC_MEMORY_FIELDS[field]] = int(line.split()[1]) * 1024
+    except OSError:
+        pass  # Not Linux, memory is reported as 0
+    return stats
+
+
+def _format_labels(labels: Optional[Dict[str, str]]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class PrometheusText:
+    """Builder for the Prometheus text exposition format (version 0.0.4)"""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, namespace: str = 'goodgym'):
+        self.namespace = namespace
+        self.lines: List[str] = []
+
+    def metric(self, name: str, kind: str, help_text: str,
+               samples: Iterable[Tuple[Optional[Dict[str, str]], float]]):
+        """
+        Add one metric family
+
+        Args:
+            name: Metric name without the namespace
+            kind: 'gauge' or 'counter'
+            help_text: HELP line
+            samples: (labels, value) pairs
+        """
+        full_name = f'{self.namespace}_{name}'
+        self.lines.append(f'# HELP {full_name} {help_text}')
+        self.lines.append(f'# TYPE {full_name} {kind}')
+        for labels, value in samples:
+            self.lines.append(f'{full_name}{_format_labels(labels)} {_format_value(value)}')
+
+    def histogram(self, name: str, help_text: str, histograms: Dict[str, LatencyHistogram], label: str):
+        """Add a histogram family (seconds) with one label value per LatencyHistogram"""
+        full_name = f'{self.namespace}_{name}'
+        self.lines.append(f'# HELP {full_name} {help_text}')
+        self.lines.append(f'# TYPE {full_name} histogram')
+        for value, histogram in histograms.items():
+            for bound, cumulative in histogram.cumulative_buckets():
+                labels = _format_labels({label: value, 'le': _format_value(bound)})
+                self.lines.append(f'{full_name}_bucket{labels} {cumulative}')
+            labels = _format_labels({label: value})
+            self.lines.append(f'{full_name}_sum{labels} {histogram.total_ns / 1e9!r}')
+            self.lines.append(f'{full_name}_count{labels} {histogram.count}')
+
+    def render(self) -> bytes:
+        return ('\n'.join(self.lines) + '\n').encode('utf-8')
@@ -0,0 +1,71 @@
+"""
+Prometheus endpoint for Good-GYM Home Assistant Addon
+Serves the metrics rendered by the service at GET /metrics
+
+Separate from metrics.py so http.server is only imported when metrics_port is set.
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from metrics import PrometheusText
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """GET /metrics"""
+
+    server_version = 'GoodGymMetrics/1.0'
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404, 'Use /metrics')
+            return
+        try:
+            body = self.server.render()
+        except Exception as e:
+            self.send_error(500, f'Metrics collection failed: {e}')
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', PrometheusText.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the add-on log
+        pass
+
+
+class MetricsServer:
+    """HTTP server exposing /metrics for Prometheus scraping"""
+
+    def __init__(self, port: int, render: Callable[[], bytes], host: str = '0.0.0.0'):
+        """
+        Initialize metrics server
+
+        Args:
+            port: TCP port to listen on
+            render: Callable returning the exposition text, called on each scrape
+            host: Bind address (all interfaces, scrapers run on other hosts)
+        """
+        self.host = host
+        self.port = port
+        self.render = render
+        self.httpd: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start serving on a background thread"""
+        self.httpd = ThreadingHTTPServer((self.host, self.port), MetricsRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.render = self.render
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        print(f"📈 Metrics endpoint listening on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        """Stop serving"""
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
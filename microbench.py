@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for Good-GYM Home Assistant Addon
+Times the per-frame counting and publishing hot paths on synthetic keypoints
+
+Each benchmark is calibrated to run about --round-time seconds per round and
+repeated --rounds times, alternating with rounds of a fixed reference
+workload. The median ratio to the reference is compared against a stored
+baseline, so a host that is busier or clocked lower as a whole does not read
+as a regression. Baselines are still machine specific and not versioned:
+record one on the machine you compare on, from the code before the change:
+
+    git stash && python microbench.py --save-baseline && git stash pop   # microbench_baseline.json
+    python microbench.py --max-regression 15        # exit 1 if a hot path got >15% slower
+
+It also enforces the startup import budget: `import main` in a fresh
+interpreter must stay under --import-budget milliseconds and must not load
+any of DEFERRED_MODULES (they are imported by the option or phase needing them).
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from exercise_counters import ExerciseCounter
+
+
+DEFAULT_BASELINE = 'microbench_baseline.json'
+
+# Ceiling for `import main` (cv2, numpy and paho included, best of IMPORT_RUNS)
+IMPORT_BUDGET_MS = 1000.0
+IMPORT_RUNS = 3
+
+# Modules `import main` must not load: the inference stack is imported by the
+# model loading phase, the rest only by the options that use them. zipfile marks
+# the model download path (urllib.request is no marker, paho-mqtt imports it)
+DEFERRED_MODULES = (
+    'rtmlib', 'onnxruntime', 'openvino',
+    'http.server', 'pose_server', 'metrics_server', 'pstats', 'zipfile', 'calibration',
+    'core.pose_tracker', 'core.keypoint_predictor', 'core.exercise_classifier',
+)
+
+IMPORT_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({'import_ms': elapsed * 1000, 'loaded': sorted(m for m in json.loads(sys.argv[1]) if m in sys.modules)}))
+'''
+
+
+def synthetic_keypoints(frames: int, fps: float = 25.0, period: float = 2.5, low: float = 90.0,
+                        high: float = 170.0, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    COCO 17-keypoint sequence of a person whose knees (and hips) bend periodically
+
+    Both hip-knee-ankle angles follow a cosine between low and high degrees, with
+    1 px of keypoint noise, so squats count and leg exercises see both sides move.
+
+    Returns:
+        (keypoints (frames, 17, 2), timestamps (frames,))
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = np.arange(frames) / fps
+    keypoints = np.zeros((frames, 17, 2))
+    # Upper body: nose, eyes, ears, shoulders, elbows, wrists
+    upper = np.array([[320, 80], [310, 70], [330, 70], [300, 75], [340, 75], [280, 140], [360, 140],
+                      [260, 210], [380, 210], [255, 270], [385, 270]], dtype=np.float64)
+    thigh, shin = 110.0, 110.0
+    for i, t in enumerate(timestamps):
+        angle = low + (high - low) * (0.5 + 0.5 * math.cos(2 * math.pi * t / period))
+        bend = math.radians(180.0 - angle)
+        keypoints[i, :11] = upper
+        for hip_index, knee_index, ankle_index, x in ((11, 13, 15, 295), (12, 14, 16, 345)):
+            ankle = np.array([x, 520.0])
+            knee = ankle + shin * np.array([math.sin(bend / 2), -math.cos(bend / 2)])
+            hip = knee + thigh * np.array([-math.sin(bend / 2), -math.cos(bend / 2)])
+            keypoints[i, hip_index], keypoints[i, knee_index], keypoints[i, ankle_index] = hip, knee, ankle
+    keypoints += rng.normal(0.0, 1.0, keypoints.shape)
+    return keypoints, timestamps
+
+
+def cycle(sequence_length: int) -> Callable[[], int]:
+    """Index generator wrapping around a sequence (keeps the timed closures small)"""
+    state = [0]
+
+    def next_index() -> int:
+        index = state[0]
+        state[0] = index + 1 if index + 1 < sequence_length else 0
+        return index
+    return next_index
+
+
+def reference_workload() -> float:
+    """Fixed mix of small numpy calls and interpreter work, the speed yardstick"""
+    values = np.arange(8, dtype=np.float64)
+    total = 0.0
+    for i in range(8):
+        total += float(np.dot(values, values)) + i
+    return total
+
+
+def build_benchmarks(frames: int = 2000) -> Dict[str, Callable[[], Any]]:
+    """Hot path name -> zero-argument callable doing one call of it"""
+    keypoints, timestamps = synthetic_keypoints(frames)
+    counter = ExerciseCounter(smoothing_window=5)
+    leg_raise = counter.exercise_configs['leg_raise']
+    benchmarks: Dict[str, Callable[[], Any]] = {}
+
+    # The signal count_exercise computes per frame: joint angles (squat), keypoint distances (jumping_jack)
+    angle_strategy = counter.registry.strategy('squat')
+    distance_strategy = counter.registry.strategy('jumping_jack')
+    sides = [angle_strategy.compute(keypoints[i]) for i in range(frames)]
+    angles = [left for left, _ in sides]
+    right_angles = [right for _, right in sides]
+
+    next_angle = cycle(frames)
+    benchmarks['angle_strategy'] = lambda: angle_strategy.compute(keypoints[next_angle()])
+    next_distance = cycle(frames)
+    benchmarks['distance_strategy'] = lambda: distance_strategy.compute(keypoints[next_distance()])
+
+    smoother = ExerciseCounter(smoothing_window=5)
+    next_smooth = cycle(frames)
+    benchmarks['smooth_angle'] = lambda: smoother.smooth_angle(angles[next_smooth()])
+
+    squat_counter = ExerciseCounter(smoothing_window=5)
+    next_squat = cycle(frames)
+
+    def count_squat():
+        i = next_squat()
+        return squat_counter.count_exercise(keypoints[i], 'squat', timestamp=timestamps[i])
+    benchmarks['count_exercise'] = count_squat
+
+    leg_counter = ExerciseCounter(smoothing_window=5)
+    next_leg = cycle(frames)
+
+    def count_legs():
+        i = next_leg()
+        leg_counter.current_time = timestamps[i]
+        return leg_counter.count_leg_exercise(angles[i], right_angles[i], leg_raise)
+    benchmarks['count_leg_exercise'] = count_legs
+
+    # RTMPoseProcessor without a model: get_exercise_angle only needs the counter and configs
+    from core.rtmpose_processor import RTMPoseProcessor
+    processor = RTMPoseProcessor.__new__(RTMPoseProcessor)
+    processor.exercise_counter = ExerciseCounter(smoothing_window=5)
+    processor.exercise_configs = processor.exercise_counter.exercise_configs
+    next_frame = cycle(frames)
+
+    def exercise_angle():
+        i = next_frame()
+        return processor.get_exercise_angle(keypoints[i], 'squat', capture_time=timestamps[i])
+    benchmarks['get_exercise_angle'] = exercise_angle
+
+    # Publisher without a connection: messages stay in the (coalescing) queue
+    from mqtt_publisher import MQTTPublisher
+    spool_file = os.path.join(tempfile.gettempdir(), 'microbench_spool.jsonl')
+    publisher = MQTTPublisher({'host': 'localhost', 'port': 1883, 'spool_file': spool_file}, 'squat')
+    next_state = cycle(frames)
+
+    def publish_forced():
+        i = next_state()
+        return publisher.publish_state(count=i // 50, stage='up', angle=angles[i], force=True,
+                                       capture_time=timestamps[i], frame_count=i)
+    benchmarks['publish_state_payload'] = publish_forced
+
+    scheduled = MQTTPublisher({'host': 'localhost', 'port': 1883, 'spool_file': spool_file}, 'squat')
+    next_scheduled = cycle(frames)
+
+    def publish_scheduled():
+        i = next_scheduled()
+        return scheduled.publish_state(count=i // 50, stage='up', angle=angles[i],
+                                       capture_time=timestamps[i], frame_count=i)
+    benchmarks['publish_state_scheduled'] = publish_scheduled
+
+    return benchmarks
+
+
+def calibrate(function: Callable[[], Any], round_time: float) -> int:
+    """Calls per round: double the count until one round takes round_time"""
+    clock = time.perf_counter_ns
+    number = 1
+    while True:
+        start = clock()
+        for _ in range(number):
+            function()
+        if clock() - start >= round_time * 1e9 or number >= 1 << 22:
+            return number
+        number *= 2
+
+
+def time_round(function: Callable[[], Any], number: int) -> float:
+    """Mean time per call (ns) over one round"""
+    clock = time.perf_counter_ns
+    start = clock()
+    for _ in range(number):
+        function()
+    return (clock() - start) / number
+
+
+def time_benchmark(function: Callable[[], Any], rounds: int, round_time: float) -> Dict[str, float]:
+    """
+    Time a callable against the reference workload
+
+    Every round of the callable is followed by a round of reference_workload,
+    and 'relative' is the median ratio of the two, so a host-wide slowdown
+    during the run cancels out.
+
+    Returns:
+        Dict with median_ns and min_ns per call, relative, and the calls per round
+    """
+    number = calibrate(function, round_time)
+    reference_number = calibrate(reference_workload, round_time / 4)
+    per_call, ratios = [], []
+    for _ in range(rounds):
+        elapsed = time_round(function, number)
+        per_call.append(elapsed)
+        ratios.append(elapsed / time_round(reference_workload, reference_number))
+    return {'median_ns': statistics.median(per_call), 'min_ns': min(per_call),
+            'relative': statistics.median(ratios), 'number': number}
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            max_regression: float) -> List[str]:
+    """Names of the benchmarks slower than baseline by more than max_regression percent"""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        change = 100.0 * (result['relative'] / reference['relative'] - 1.0)
+        result['change_pct'] = round(change, 1)
+        if change > max_regression:
+            regressions.append(name)
+    return regressions
+
+
+def measure_import(runs: int = IMPORT_RUNS) -> Dict[str, Any]:
+    """
+    Time `import main` in fresh interpreters
+
+    Returns:
+        Dict with import_ms (best run), runs (all runs, ms) and eager (deferred
+        modules that were imported anyway); 'error' if the import failed
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    times, eager = [], set()
+    for _ in range(runs):
+        process = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT, json.dumps(DEFERRED_MODULES)],
+                                 cwd=directory, capture_output=True, text=True)
+        if process.returncode != 0:
+            return {'error': process.stderr.strip().splitlines()[-1] if process.stderr.strip() else 'import failed'}
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        times.append(round(result['import_ms'], 1))
+        eager.update(result['loaded'])
+    return {'import_ms': min(times), 'runs': times, 'eager': sorted(eager)}
+
+
+def print_report(results: Dict[str, Dict[str, float]], regressions: List[str]):
+    """Print per-benchmark timings"""
+    print("\n" + "="*70)
+    print(f"  {'Benchmark':<26}{'Median':>12}{'Min':>12}{'vs baseline':>14}")
+    print("="*70)
+    for name, result in results.items():
+        change = f"{result['change_pct']:+.1f}%" if 'change_pct' in result else '-'
+        flag = '  ✗' if name in regressions else ''
+        print(f"  {name:<26}{result['median_ns'] / 1000:>10.2f}µs{result['min_ns'] / 1000:>10.2f}µs"
+              f"{change:>14}{flag}")
+    print("="*70 + "\n")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmark the per-frame hot paths")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument('--save-baseline', action='store_true', help="Write the results as the new baseline")
+    parser.add_argument('--max-regression', type=float, default=15.0,
+                        help="Fail when a benchmark is this many percent slower than the baseline")
+    parser.add_argument('--rounds', type=int, default=7)
+    parser.add_argument('--round-time', type=float, default=0.2, help="Seconds per round")
+    parser.add_argument('--only', nargs='+', default=None, help="Run only these benchmarks")
+    parser.add_argument('--output', default=None, help="Optional JSON results file")
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET_MS,
+                        help="Fail when `import main` takes longer (ms, 0 = skip the import check)")
+    args = parser.parse_args(argv)
+
+    benchmarks = build_benchmarks()
+    if args.only:
+        unknown = set(args.only) - set(benchmarks)
+        if unknown:
+            print(f"✗ Unknown benchmarks: {', '.join(sorted(unknown))} (valid: {', '.join(benchmarks)})")
+            return 1
+        benchmarks = {name: benchmarks[name] for name in args.only}
+
+    import_result: Dict[str, Any] = {}
+    import_failed = False
+    if args.import_budget > 0:
+        print("📦 import main...")
+        import_result = measure_import()
+        if 'error' in import_result:
+            print(f"✗ import main failed: {import_result['error']}")
+            import_failed = True
+        else:
+            over = import_result['import_ms'] > args.import_budget
+            import_failed = over or bool(import_result['eager'])
+            print(f"{'✗' if over else '✓'} import main: {import_result['import_ms']:.0f} ms "
+                  f"(budget {args.import_budget:g} ms)")
+            if import_result['eager']:
+                print(f"✗ Imported at startup but should be deferred: {', '.join(import_result['eager'])}")
+
+    results = {}
+    for name, function in benchmarks.items():
+        print(f"⏱️  {name}...")
+        results[name] = time_benchmark(function, args.rounds, args.round_time)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.max_regression)
+    print_report(results, regressions)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'results': results, 'regressions': regressions, 'import': import_result}, f, indent=2)
+        print(f"📝 Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'numpy': np.__version__, 'results': results}, f, indent=2)
+        print(f"📝 Baseline written to {args.baseline}")
+        return 1 if import_failed else 0
+
+    if not baseline:
+        print(f"ℹ No baseline at {args.baseline}, nothing compared: record one on this machine from the "
+              f"code before your change with `python microbench.py --save-baseline`")
+        return 1 if import_failed else 0
+    if import_failed:
+        return 1
+    if regressions:
+        print(f"✗ {len(regressions)} hot path(s) regressed by more than {args.max_regression:g}%: "
+              f"{', '.join(regressions)}")
+        return 1
+    print(f"✓ No hot path regressed by more than {args.max_regression:g}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
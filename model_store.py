@@ -0,0 +1,426 @@
+"""
+Model store for Good-GYM Home Assistant Addon
+Verified RTMPose model files in persistent storage, described by data/models.json
+
+data/models.json lists every model (file name, OpenMMLab archive, SHA-256,
+input size) and the detector and pose model each rtmpose_mode uses. Files
+are kept in /data/models so they survive add-on updates and restarts:
+
+- Every bundled model carries its SHA-256 in the manifest and files are
+  checked against it. `python model_store.py --update-manifest` downloads
+  the models and writes their digests into data/models.json.
+
+- Downloads go to <archive>.part and are resumed with an HTTP Range request
+  after an interruption; the model is extracted to a temporary file and
+  renamed into place, so a crash never leaves a truncated model behind.
+- A file is hashed once; its SHA-256, size and mtime are recorded in
+  models.lock.json and later boots skip hashing while size and mtime are
+  unchanged. Extra models listed in /data/models/models.extra.json may
+  leave the SHA-256 out; they are trusted on first use and the lock file
+  pins the hash seen then. A bundled model without one only gets a warning,
+  or is refused with GOODGYM_MODEL_STRICT=1.
+- Missing models are fetched in parallel. Nothing touches the network when
+  the store already holds valid files.
+"""
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROOT = '/data/models'
+ROOT_ENV_VAR = 'GOODGYM_MODEL_DIR'
+BASE_URL_ENV_VAR = 'GOODGYM_MODEL_BASE_URL'
+STRICT_ENV_VAR = 'GOODGYM_MODEL_STRICT'
+LOCK_FILE = 'models.lock.json'
+EXTRA_MANIFEST = 'models.extra.json'
+CHUNK_SIZE = 1 << 20
+
+
+class ModelStoreError(RuntimeError):
+    """A model could not be found, downloaded or verified"""
+
+
+def get_manifest_path() -> str:
+    """Get models.json file path, compatible with development and packaged environments"""
+    if getattr(sys, 'frozen', False):
+        # Packaged environment, data files are in temp directory
+        return os.path.join(sys._MEIPASS, 'data', 'models.json')
+    # Development environment, data files are in project directory
+    return os.path.join('data', 'models.json')
+
+
+def sha256_file(path: Path) -> str:
+    """SHA-256 of a file (hex)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ModelStore:
+    """Model files of data/models.json, fetched once and verified"""
+
+    def __init__(self, root: Optional[str] = None, manifest_file: Optional[str] = None,
+                 base_url: Optional[str] = None, search_dirs: Sequence[str] = (),
+                 timeout: float = 30.0, retries: int = 3, workers: int = 4,
+                 strict: Optional[bool] = None):
+        """
+        Initialize model store
+
+        Args:
+            root: Writable store directory (default $GOODGYM_MODEL_DIR or /data/models)
+            manifest_file: Path to models.json (defaults to data/models.json)
+            base_url: Download location of the archives (default $GOODGYM_MODEL_BASE_URL
+                      or the manifest's base_url), e.g. a local mirror
+            search_dirs: Read-only directories checked before downloading (bundled models)
+            timeout: Socket timeout per request (seconds)
+            retries: Download attempts per model, each resuming the previous one
+            workers: Models downloaded at the same time
+            strict: Refuse bundled models without a SHA-256 in the manifest
+                    (default $GOODGYM_MODEL_STRICT)
+        """
+        self.root = Path(root or os.getenv(ROOT_ENV_VAR) or DEFAULT_ROOT)
+        self.manifest_file = manifest_file or get_manifest_path()
+        with open(self.manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.models: Dict[str, Dict[str, Any]] = manifest['models']
+        self.modes: Dict[str, Dict[str, str]] = manifest['modes']
+        self.bundled = set(self.models)
+        self.base_url = base_url or os.getenv(BASE_URL_ENV_VAR) or manifest['base_url']
+        if not self.base_url.endswith('/'):
+            self.base_url += '/'
+        self.search_dirs = [Path(d) for d in search_dirs]
+        self.timeout = timeout
+        self.retries = retries
+        self.workers = workers
+        if strict is None:
+            strict = os.getenv(STRICT_ENV_VAR, '').lower() in ('1', 'true', 'yes')
+        self.strict = strict
+        self._read_extra_manifest()
+        unpinned = sorted(name for name in self.bundled if not self.models[name].get('sha256'))
+        if unpinned:
+            message = (f"No sha256 in {self.manifest_file} for {', '.join(unpinned)} "
+                       f"(run python model_store.py --update-manifest)")
+            if self.strict:
+                raise ModelStoreError(message)
+            logger.warning("⚠ %s, trusting them on first use", message)
+
+        # Verified files: path -> {sha256, size, mtime_ns}
+        self.lock = threading.Lock()
+        self.lock_file = self.root / LOCK_FILE
+        self.pins: Dict[str, Dict[str, Any]] = self._read_pins()
+        # Files that failed verification: path -> (size, mtime_ns), not hashed again until changed
+        self.rejected: Dict[str, tuple] = {}
+        # One download per model at a time (initialization and a mode switch may overlap)
+        self.fetch_locks = {name: threading.Lock() for name in self.models}
+        self.stats = {'verified_cached': 0, 'hashed': 0, 'downloaded': 0, 'resumed': 0, 'rejected': 0}
+
+    def mode_models(self, mode: str) -> Dict[str, str]:
+        """Model names of a mode ({'det': ..., 'pose': ...})"""
+        if mode not in self.modes:
+            raise ModelStoreError(f"Unknown RTMPose mode '{mode}' (known: {', '.join(self.modes)})")
+        return self.modes[mode]
+
+    def resolve(self, mode: str, fetch: bool = True) -> Dict[str, Any]:
+        """
+        Verified model files of a mode, downloading missing ones
+
+        Args:
+            mode: RTMPose mode (lightweight, balanced, performance)
+            fetch: Download missing or invalid files (False raises instead)
+
+        Returns:
+            Keyword arguments for rtmlib Wholebody: det, det_input_size, pose, pose_input_size
+        """
+        names = self.mode_models(mode)
+        paths = self.ensure(names.values(), fetch=fetch)
+        return {
+            'det': str(paths[names['det']]),
+            'det_input_size': tuple(self.models[names['det']]['input_size']),
+            'pose': str(paths[names['pose']]),
+            'pose_input_size': tuple(self.models[names['pose']]['input_size']),
+        }
+
+    def ensure(self, names: Iterable[str], fetch: bool = True) -> Dict[str, Path]:
+        """
+        Verified paths of models, downloading missing ones in parallel
+
+        Returns:
+            Model name -> path
+        """
+        paths: Dict[str, Path] = {}
+        missing: List[str] = []
+        for name in dict.fromkeys(names):
+            path = self.find(name)
+            if path is not None:
+                paths[name] = path
+            else:
+                missing.append(name)
+        if not missing:
+            return paths
+        if not fetch:
+            raise ModelStoreError(f"Models not in {self.root}: {', '.join(missing)}")
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(missing)),
+                                thread_name_prefix='model-fetch') as pool:
+            for name, path in zip(missing, pool.map(self.fetch, missing)):
+                paths[name] = path
+        return paths
+
+    def find(self, name: str) -> Optional[Path]:
+        """Path of a valid copy of a model (store first, then search_dirs), None if there is none"""
+        entry = self._entry(name)
+        for directory in [self.root] + self.search_dirs:
+            path = directory / entry['file']
+            if path.is_file() and self.verify(name, path):
+                return path
+        return None
+
+    def verify(self, name: str, path: Path) -> bool:
+        """
+        Check a model file against the manifest hash, or its pinned hash
+
+        The file is only hashed when it is new or its size or mtime changed.
+        """
+        expected = self._entry(name).get('sha256')
+        stat = path.stat()
+        key = str(path.resolve())
+        with self.lock:
+            pin = self.pins.get(key)
+        if (pin is not None and pin['size'] == stat.st_size and pin['mtime_ns'] == stat.st_mtime_ns
+                and (expected is None or pin['sha256'] == expected)):
+            self.stats['verified_cached'] += 1
+            return True
+        if self.rejected.get(key) == (stat.st_size, stat.st_mtime_ns):
+            return False
+
+        digest = sha256_file(path)
+        self.stats['hashed'] += 1
+        reference = expected or (pin['sha256'] if pin is not None else None)
+        if reference is not None and digest != reference:
+            self.stats['rejected'] += 1
+            self.rejected[key] = (stat.st_size, stat.st_mtime_ns)
+            logger.warning("⚠ %s failed verification (sha256 %s, expected %s)", path, digest[:12], reference[:12])
+            return False
+        if reference is None:
+            logger.info("🔒 Pinned %s (sha256 %s, trusted on first use)", path.name, digest[:12])
+        self._pin(key, digest, stat)
+        return True
+
+    def fetch(self, name: str) -> Path:
+        """Download, verify and atomically install a model into the store"""
+        entry = self._entry(name)
+        with self.fetch_locks[name]:
+            # Another thread may have installed it while this one waited
+            path = self.find(name)
+            return path if path is not None else self._fetch(name, entry)
+
+    def _fetch(self, name: str, entry: Dict[str, Any]) -> Path:
+        # Only needed to download
+        import zipfile
+        source = entry.get('archive') or entry['file']
+        url = entry.get('url') or self.base_url + source
+        self.root.mkdir(parents=True, exist_ok=True)
+        part = self.root / (source + '.part')
+        target = self.root / entry['file']
+
+        start = time.monotonic()
+        for attempt in range(1, self.retries + 1):
+            try:
+                self._download(url, part)
+                break
+            except (OSError, ModelStoreError) as e:  # URLError is an OSError
+                if attempt == self.retries:
+                    raise ModelStoreError(f"Download of {name} from {url} failed: {e}") from e
+                logger.warning("⚠ Download of %s interrupted (%s), resuming (attempt %d/%d)",
+                               name, e, attempt + 1, self.retries)
+                time.sleep(min(2 ** attempt, 10))
+
+        temporary = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            if source.endswith('.zip'):
+                self._extract(part, temporary)
+            else:
+                os.replace(part, temporary)
+            digest = sha256_file(temporary)
+            expected = entry.get('sha256')
+            if expected is not None and digest != expected:
+                self.stats['rejected'] += 1
+                raise ModelStoreError(f"{name} from {url} has sha256 {digest}, expected {expected}")
+            os.replace(temporary, target)
+        except (zipfile.BadZipFile, ModelStoreError) as e:
+            # A bad archive is not resumable, the next attempt starts over
+            part.unlink(missing_ok=True)
+            if isinstance(e, ModelStoreError):
+                raise
+            raise ModelStoreError(f"Archive of {name} from {url} is corrupt: {e}") from e
+        finally:
+            temporary.unlink(missing_ok=True)
+        part.unlink(missing_ok=True)
+
+        self._pin(str(target.resolve()), digest, target.stat())
+        self.stats['downloaded'] += 1
+        logger.info("✓ %s installed in %.1fs (%.1f MB, sha256 %s)", target.name, time.monotonic() - start,
+                    target.stat().st_size / (1024 * 1024), digest[:12])
+        return target
+
+    def _download(self, url: str, part: Path):
+        """Download url into part, continuing an existing partial file"""
+        import urllib.error
+        import urllib.request
+        offset = part.stat().st_size if part.exists() else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        try:
+            response = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset:
+                return  # Range starts at the end: the previous attempt got everything
+            raise
+        with response:
+            if offset and response.status != 206:
+                offset = 0  # Server ignored the Range header, start over
+            if offset:
+                self.stats['resumed'] += 1
+            length = response.headers.get('Content-Length')
+            total = offset + int(length) if length is not None else None
+            logger.info("📥 Downloading %s%s%s", url.rsplit('/', 1)[-1],
+                        f" ({total / (1024 * 1024):.1f} MB)" if total else "",
+                        f", resuming at {offset / (1024 * 1024):.1f} MB" if offset else "")
+            with open(part, 'ab' if offset else 'wb') as f:
+                for block in iter(lambda: response.read(CHUNK_SIZE), b''):
+                    f.write(block)
+                f.flush()
+                os.fsync(f.fileno())
+        if total is not None and part.stat().st_size != total:
+            raise ModelStoreError(f"incomplete download ({part.stat().st_size} of {total} bytes)")
+
+    @staticmethod
+    def _extract(archive: Path, destination: Path):
+        """Extract the ONNX model of an OpenMMLab onnx_sdk archive (end2end.onnx) to destination"""
+        import zipfile
+        with zipfile.ZipFile(archive) as zf:
+            members = [m for m in zf.infolist() if m.filename.endswith('.onnx')]
+            if not members:
+                raise ModelStoreError(f"No .onnx file in {archive.name}")
+            member = max(members, key=lambda m: m.file_size)
+            with zf.open(member) as source, open(destination, 'wb') as f:
+                for block in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    f.write(block)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def update_manifest(self, names: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """
+        Download models and write their SHA-256 into the manifest (atomic rewrite)
+
+        Args:
+            names: Bundled models to pin (default: all of them)
+
+        Returns:
+            Model name -> sha256
+        """
+        names = sorted(self.bundled if names is None else names)
+        paths = self.ensure(names)
+        digests = {}
+        for name in names:
+            with self.lock:
+                digests[name] = self.pins[str(paths[name].resolve())]['sha256']
+            self.models[name]['sha256'] = digests[name]
+
+        with open(self.manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        for name, digest in digests.items():
+            manifest['models'][name]['sha256'] = digest
+        temporary = f"{self.manifest_file}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        os.replace(temporary, self.manifest_file)
+        return digests
+
+    def _entry(self, name: str) -> Dict[str, Any]:
+        if name not in self.models:
+            raise ModelStoreError(f"Unknown model '{name}' in {self.manifest_file}")
+        return self.models[name]
+
+    def _read_extra_manifest(self):
+        """Add the user's models and modes of <root>/models.extra.json (sha256 optional there)"""
+        path = self.root / EXTRA_MANIFEST
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                extra = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("⚠ Ignoring unreadable %s (%s)", path, e)
+            return
+        for name, entry in extra.get('models', {}).items():
+            if name in self.bundled:
+                logger.warning("⚠ %s: model '%s' is bundled, keeping the bundled entry", path, name)
+                continue
+            self.models[name] = entry
+        self.modes.update(extra.get('modes', {}))
+
+    def _read_pins(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.lock_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get('files', {})
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("⚠ Ignoring unreadable %s (%s), models will be re-hashed", self.lock_file, e)
+            return {}
+
+    def _pin(self, key: str, digest: str, stat: os.stat_result):
+        """Record a verified file and rewrite the lock file atomically"""
+        with self.lock:
+            self.pins[key] = {'sha256': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            try:
+                self.root.mkdir(parents=True, exist_ok=True)
+                temporary = self.lock_file.with_name(f"{LOCK_FILE}.{os.getpid()}.tmp")
+                with open(temporary, 'w', encoding='utf-8') as f:
+                    json.dump({'version': 1, 'files': self.pins}, f, indent=2, sort_keys=True)
+                os.replace(temporary, self.lock_file)
+            except OSError as e:
+                # Read-only store: verification still works, the next boot hashes again
+                logger.warning("⚠ Could not write %s: %s", self.lock_file, e)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Verification and download counters"""
+        return dict(self.stats)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Fetch and verify the RTMPose models of data/models.json")
+    parser.add_argument('root', nargs='?', help="Store directory (default $GOODGYM_MODEL_DIR or /data/models)")
+    parser.add_argument('modes', nargs='*', help="Modes to fetch (default: all)")
+    parser.add_argument('--update-manifest', action='store_true',
+                        help="Download all bundled models and write their sha256 into data/models.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    try:
+        # Not strict: the manifest being updated may still lack digests
+        store = ModelStore(root=args.root, strict=False if args.update_manifest else None)
+        if args.update_manifest:
+            for name, digest in store.update_manifest().items():
+                print(f"✓ {name}: {digest}")
+            print(f"📝 {store.manifest_file} updated")
+        else:
+            for mode in args.modes or list(store.modes):
+                files = store.resolve(mode)
+                print(f"✓ {mode}: {Path(files['det']).name} + {Path(files['pose']).name}")
+    except ModelStoreError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+    print(f"📊 {store.get_stats()}")
@@ -3,21 +3,74 @@ MQTT Publisher for Good-GYM Home Assistant Addon
 Publishes exercise counting data to MQTT broker with Home Assistant discovery
 """
 import json
+import logging
+import os
+import struct
+import threading
 import time
-from typing import Dict, Any, Optional
+from collections import OrderedDict, deque
+from typing import Dict, Any, Callable, List, Optional, Tuple
+import numpy as np
 import paho.mqtt.client as mqtt
 
+from exercise_registry import get_registry
+from metrics import WindowedHistogram
+
+logger = logging.getLogger(__name__)
+
+
+# Binary keypoint payload: header, then per person a uint8 slot, 17x2 little-endian
+# int16 coordinates in 1/KEYPOINT_SCALE pixel and 17 uint8 scores (score x 255)
+KEYPOINT_HEADER = struct.Struct('<2sBBIdHH')  # magic, version, persons, seq, capture time, width, height
+KEYPOINT_MAGIC = b'GK'
+KEYPOINT_VERSION = 1
+KEYPOINT_SCALE = 4
+KEYPOINT_PERSON_SIZE = 1 + 17 * 2 * 2 + 17
+
+
+def decode_keypoints(payload: bytes) -> Dict[str, Any]:
+    """
+    Decode a keypoint topic payload (reference implementation for consumers)
+    
+    Returns:
+        Dict with seq, capture_time, width, height and persons, a list of
+        {slot, keypoints (17, 2) float pixels, scores (17,) float 0-1}
+    """
+    magic, version, persons, seq, capture_time, width, height = KEYPOINT_HEADER.unpack_from(payload)
+    if magic != KEYPOINT_MAGIC or version != KEYPOINT_VERSION:
+        raise ValueError(f"Unsupported keypoint payload (magic {magic!r}, version {version})")
+    decoded = []
+    offset = KEYPOINT_HEADER.size
+    for _ in range(persons):
+        slot = payload[offset]
+        coords = np.frombuffer(payload, dtype='<i2', count=34, offset=offset + 1)
+        scores = np.frombuffer(payload, dtype=np.uint8, count=17, offset=offset + 69)
+        decoded.append({
+            'slot': slot,
+            'keypoints': coords.reshape(17, 2) / KEYPOINT_SCALE,
+            'scores': scores / 255.0,
+        })
+        offset += KEYPOINT_PERSON_SIZE
+    return {'seq': seq, 'capture_time': capture_time, 'width': width, 'height': height, 'persons': decoded}
+
 
 class MQTTPublisher:
     """Publish exercise data to MQTT with Home Assistant discovery support"""
     
-    def __init__(self, config: Dict[str, Any], exercise_type: str):
+    def __init__(self, config: Dict[str, Any], exercise_type: str,
+                 exercise_types: Optional[List[str]] = None, max_persons: int = 1):
         """
         Initialize MQTT publisher
         
         Args:
-            config: MQTT configuration dict (host, port, username, password, topic_prefix)
-            exercise_type: Type of exercise being tracked
+            config: MQTT configuration dict (host, port, username, password, topic_prefix,
+                    optional heartbeat / min_interval / angle_delta for the publish scheduler,
+                    max_queue and spool_file / max_spool_bytes for the outbound queue,
+                    keypoint_rate in Hz for the binary keypoint topic, 0 = off,
+                    publish_latency to add latency_ms to state payloads)
+            exercise_type: Type of exercise being tracked ('auto' for automatic detection)
+            exercise_types: Exercises that get their own sensor (defaults to [exercise_type])
+            max_persons: People tracked at once; above 1 every person gets an extra sensor
         """
         self.host = config['host']
         self.port = config['port']
@@ -25,9 +78,47 @@ class MQTTPublisher:
         self.password = config.get('password', '')
         self.topic_prefix = config.get('topic_prefix', 'homeassistant/sensor/good_gym')
         self.exercise_type = exercise_type
+        self.exercise_types = list(exercise_types or [exercise_type])
+        self.max_persons = max_persons
+        
+        # Publish scheduler: count/stage changes go out immediately, angle moves of at
+        # least angle_delta at most every min_interval, otherwise only a heartbeat
+        self.heartbeat = float(config.get('heartbeat', 30.0))
+        self.min_interval = float(config.get('min_interval', 0.5))
+        self.angle_delta = float(config.get('angle_delta', 5.0))
+        # topic -> ((count, stage), angle, sent_at) of the last state sent
+        self.last_states: Dict[str, Tuple[tuple, Optional[float], float]] = {}
+        # Pre-serialized JSON fragments that only change with the session
+        self._static_fragments: Dict[Tuple[str, Optional[int]], str] = {}
+        self._timestamp_second = None
+        self._timestamp_json = ''
+        
+        # Outbound queue: publish calls only enqueue, a sender thread does the network I/O.
+        # States are coalesced per topic (only the latest matters), events are kept in
+        # order and spooled to disk while the broker is unreachable.
+        self.max_queue = int(config.get('max_queue', 1000))
+        self.spool_file = config.get('spool_file', '/data/mqtt_spool.jsonl')
+        self.max_spool_bytes = int(config.get('max_spool_bytes', 5 * 1024 * 1024))
+        self.queue_lock = threading.Lock()
+        # Queued messages are (payload, qos, retain, capture_time, queued_at) per state topic
+        # and (topic, payload, qos, retain, capture_time, queued_at) for events
+        self.pending_states: 'OrderedDict[str, Tuple[str, int, bool, Optional[float], float]]' = OrderedDict()
+        self.pending_events: deque = deque()
+        self.wakeup = threading.Event()
+        self.sender_thread: Optional[threading.Thread] = None
+        self.sender_running = False
+        self.stats = {'sent': 0, 'coalesced': 0, 'dropped': 0, 'spooled': 0, 'replayed': 0}
+        self.spool_bytes = os.path.getsize(self.spool_file) if os.path.exists(self.spool_file) else 0
+        
+        # Glass-to-MQTT latency: frame capture until the message is handed to the
+        # client, measured on the sender thread (replayed spool messages excluded)
+        self.end_to_end_latency = {'state': WindowedHistogram(), 'event': WindowedHistogram()}
+        self.send_queue_latency = WindowedHistogram()
+        self.publish_latency = bool(config.get('publish_latency', False))
         
         # Initialize MQTT client
         self.client = mqtt.Client(client_id=f"good_gym_{exercise_type}")
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
         
         # Set callbacks
         self.client.on_connect = self._on_connect
@@ -42,94 +133,352 @@ class MQTTPublisher:
         self.is_connected = False
         self.session_start_time = time.time()
         
-        # Topics
-        self.state_topic = f"{self.topic_prefix}_{exercise_type}/state"
-        self.config_topic = f"{self.topic_prefix}_{exercise_type}/config"
+        # Topics (one sensor per tracked exercise)
+        self.state_topics = {ex: f"{self.topic_prefix}_{ex}/state" for ex in self.exercise_types}
+        self.config_topics = {ex: f"{self.topic_prefix}_{ex}/config" for ex in self.exercise_types}
+        self.state_topic = self.state_topics.get(exercise_type, f"{self.topic_prefix}_{exercise_type}/state")
+        self.config_topic = self.config_topics.get(exercise_type, f"{self.topic_prefix}_{exercise_type}/config")
         self.status_topic = f"{self.topic_prefix}_status/state"
+        
+        # Control channel: {prefix}_command/<command>, handled by on_command(command, payload)
+        self.command_topic = f"{self.topic_prefix}_command/+"
+        self.on_command: Optional[Callable[[str, str], None]] = None
+        
+        # Raw pose stream, rate limited independently of the state topic
+        self.keypoint_topic = f"{self.topic_prefix}_pose/keypoints"
+        self.keypoint_rate = float(config.get('keypoint_rate', 0))
+        self.keypoint_seq = 0
+        self.last_keypoint_time = 0.0
+        
+        # Rep event topics (one QoS 1 message per rep) and their sequence number. The
+        # sequence restarts every boot while the spool may still replay older events,
+        # so events carry a per-boot session id: (session, seq) identifies an event
+        self.event_topics = {ex: f"{self.topic_prefix}_{ex}/event" for ex in self.exercise_types}
+        self.event_session = os.urandom(4).hex()
+        self.event_seq = 0
+        
+        # Per-person topics (multi-person tracking), keyed by (exercise, person slot)
+        self.person_state_topics = {}
+        self.person_config_topics = {}
+        if max_persons > 1:
+            for ex in self.exercise_types:
+                for person in range(1, max_persons + 1):
+                    base = f"{self.topic_prefix}_{ex}_person{person}"
+                    self.person_state_topics[(ex, person)] = f"{base}/state"
+                    self.person_config_topics[(ex, person)] = f"{base}/config"
+                    self.event_topics[(ex, person)] = f"{base}/event"
     
     def connect(self) -> bool:
         """
-        Connect to MQTT broker
+        Start connecting to the MQTT broker in the background
+        
+        Does not wait for the broker: messages are queued (and events spooled)
+        until the connection is up, and paho keeps retrying on its own.
         
         Returns:
-            True if connection successful, False otherwise
+            True if the connection was started, False on invalid settings
         """
         try:
-            print(f"📡 Connecting to MQTT broker: {self.host}:{self.port}")
-            self.client.connect(self.host, self.port, keepalive=60)
+            logger.info("📡 Connecting to MQTT broker: %s:%s", self.host, self.port)
+            self.client.connect_async(self.host, self.port, keepalive=60)
             self.client.loop_start()
-            
-            # Wait for connection (with timeout)
-            timeout = 10
-            start_time = time.time()
-            while not self.is_connected and (time.time() - start_time) < timeout:
-                time.sleep(0.1)
-            
-            if self.is_connected:
-                print("✓ Connected to MQTT broker")
-                return True
-            else:
-                print("✗ Failed to connect to MQTT broker (timeout)")
-                return False
-                
+            self.start_sender()
+            return True
         except Exception as e:
-            print(f"✗ MQTT connection error: {e}")
+            logger.error("✗ MQTT connection error: %s", e)
             return False
     
-    def disconnect(self):
-        """Disconnect from MQTT broker"""
-        self.client.loop_stop()
+    def disconnect(self, flush_timeout: float = 2.0):
+        """Flush the outbound queue (up to flush_timeout seconds) and disconnect"""
+        deadline = time.time() + flush_timeout
+        while self.is_connected and self.queue_depth() > 0 and time.time() < deadline:
+            self.wakeup.set()
+            time.sleep(0.05)
+        self.stop_sender()
         self.client.disconnect()
-        print("📴 Disconnected from MQTT broker")
+        self.client.loop_stop()
+        logger.info("📴 Disconnected from MQTT broker")
     
     def _on_connect(self, client, userdata, flags, rc):
         """Callback when connected to MQTT broker"""
         if rc == 0:
             self.is_connected = True
-            print("✓ MQTT connection established")
+            logger.info("✓ MQTT connection established")
+            # (Re)subscribe to commands, subscriptions do not survive a reconnect
+            client.subscribe(self.command_topic, qos=1)
             # Publish discovery config on connect
             self.publish_discovery()
+            # Let the sender replay the spool and flush the queue
+            self.wakeup.set()
         else:
-            print(f"✗ MQTT connection failed with code: {rc}")
+            logger.error("✗ MQTT connection failed with code: %s", rc)
             self.is_connected = False
     
     def _on_disconnect(self, client, userdata, rc):
         """Callback when disconnected from MQTT broker"""
         self.is_connected = False
         if rc != 0:
-            print(f"⚠ Unexpected MQTT disconnection (code: {rc})")
+            logger.warning("⚠ Unexpected MQTT disconnection (code: %s), queueing until reconnected", rc)
     
-    def _on_message(self, client, userdata, msg):
-        """Callback when message received"""
-        print(f"📨 Received message on {msg.topic}: {msg.payload.decode()}")
+    def start_sender(self):
+        """Start the thread that drains the outbound queue"""
+        if self.sender_running:
+            return
+        self.sender_running = True
+        self.sender_thread = threading.Thread(target=self._sender_loop, name='mqtt-sender', daemon=True)
+        self.sender_thread.start()
     
-    def publish_discovery(self):
-        """Publish Home Assistant MQTT discovery configuration"""
-        # Exercise-specific exercise names
-        exercise_names = {
-            'squat': 'Squat',
-            'pushup': 'Push-up',
-            'situp': 'Sit-up',
-            'bicep_curl': 'Bicep Curl',
-            'lateral_raise': 'Lateral Raise',
-            'overhead_press': 'Overhead Press',
-            'leg_raise': 'Leg Raise',
-            'knee_raise': 'Knee Raise',
-            'knee_press': 'Knee Press',
-            'crunch': 'Crunch',
+    def stop_sender(self):
+        """Stop the sender thread, spooling undelivered events"""
+        self.sender_running = False
+        self.wakeup.set()
+        if self.sender_thread:
+            self.sender_thread.join(timeout=5)
+        self._spool_pending_events()
+    
+    def enqueue(self, topic: str, payload: str, qos: int = 0, retain: bool = False,
+                coalesce: bool = False, capture_time: Optional[float] = None) -> bool:
+        """
+        Queue a message for the sender thread, never blocks
+        
+        Args:
+            coalesce: Replace any queued message on the same topic (states);
+                      otherwise the message is kept in order (events)
+            capture_time: Capture time of the frame the message reports, for latency tracking
+        
+        Returns:
+            False if the message was dropped because the queue is full
+        """
+        queued_at = time.time()
+        with self.queue_lock:
+            if coalesce:
+                if topic in self.pending_states:
+                    self.stats['coalesced'] += 1
+                    del self.pending_states[topic]
+                self.pending_states[topic] = (payload, qos, retain, capture_time, queued_at)
+            elif len(self.pending_events) >= self.max_queue:
+                self.stats['dropped'] += 1
+                return False
+            else:
+                self.pending_events.append((topic, payload, qos, retain, capture_time, queued_at))
+        self.wakeup.set()
+        return True
+    
+    def queue_depth(self) -> int:
+        """Number of queued messages (not counting the spool)"""
+        return len(self.pending_states) + len(self.pending_events)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Outbound queue statistics"""
+        return {
+            'connected': self.is_connected,
+            'queue_depth': self.queue_depth(),
+            'spool_bytes': self.spool_bytes,
+            **self.stats,
+        }
+    
+    def get_latency(self) -> Dict[str, Dict[str, float]]:
+        """Rolling glass-to-MQTT and send queue latency summaries (ms)"""
+        return {
+            'end_to_end_state': self.end_to_end_latency['state'].recent().snapshot(),
+            'end_to_end_event': self.end_to_end_latency['event'].recent().snapshot(),
+            'send_queue': self.send_queue_latency.recent().snapshot(),
         }
+    
+    def _record_latency(self, kind: str, capture_time: Optional[float], queued_at: float):
+        """Record the latency of a message that was just handed to the client"""
+        now = time.time()
+        self.send_queue_latency.record(max(int((now - queued_at) * 1e9), 0))
+        if capture_time is not None:
+            self.end_to_end_latency[kind].record(max(int((now - capture_time) * 1e9), 0))
+    
+    def _sender_loop(self):
+        """Drain the queue while connected, spool events while not"""
+        while self.sender_running:
+            self.wakeup.wait(timeout=1.0)
+            self.wakeup.clear()
+            if self.is_connected:
+                if self.spool_bytes and not self._replay_spool():
+                    continue
+                self._send_pending()
+            else:
+                self._spool_pending_events()
+    
+    def _publish_now(self, topic: str, payload: str, qos: int, retain: bool) -> bool:
+        """Hand one message to paho, False if it could not be sent"""
+        try:
+            info = self.client.publish(topic, payload, qos=qos, retain=retain)
+        except Exception as e:
+            logger.error("✗ Error publishing to %s: %s", topic, e)
+            return False
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            return False
+        self.stats['sent'] += 1
+        return True
+    
+    def _send_pending(self):
+        """Send queued events in order, then the latest state of every topic"""
+        while self.is_connected:
+            with self.queue_lock:
+                if not self.pending_events:
+                    break
+                message = self.pending_events.popleft()
+            if not self._publish_now(*message[:4]):
+                with self.queue_lock:
+                    self.pending_events.appendleft(message)
+                return
+            self._record_latency('event', *message[4:])
         
-        exercise_name = exercise_names.get(self.exercise_type, self.exercise_type.title())
+        with self.queue_lock:
+            states = list(self.pending_states.items())
+            self.pending_states.clear()
+        for topic, message in states:
+            payload, qos, retain, capture_time, queued_at = message
+            if not self.is_connected or not self._publish_now(topic, payload, qos, retain):
+                # Keep it unless a newer state was queued meanwhile
+                with self.queue_lock:
+                    self.pending_states.setdefault(topic, message)
+                continue
+            if topic != self.keypoint_topic:
+                self._record_latency('state', capture_time, queued_at)
+    
+    def _spool_pending_events(self):
+        """Append queued events to the spool file (states are not spooled)"""
+        with self.queue_lock:
+            events = list(self.pending_events)
+            self.pending_events.clear()
+        if not events:
+            return
+        lines = []
+        for topic, payload, qos, retain, _, _ in events:
+            line = json.dumps({'topic': topic, 'payload': payload, 'qos': qos, 'retain': retain}) + '\n'
+            if self.spool_bytes + len(line) > self.max_spool_bytes:
+                self.stats['dropped'] += 1
+                continue
+            lines.append(line)
+            self.spool_bytes += len(line)
+        try:
+            with open(self.spool_file, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+            self.stats['spooled'] += len(lines)
+        except OSError as e:
+            logger.error("✗ Error writing MQTT spool %s: %s", self.spool_file, e)
+            self.stats['dropped'] += len(lines)
+            self.spool_bytes = os.path.getsize(self.spool_file) if os.path.exists(self.spool_file) else 0
+    
+    def _replay_spool(self) -> bool:
+        """
+        Publish spooled events in order and truncate the spool
+        
+        Returns:
+            True if the whole spool was sent
+        """
+        try:
+            with open(self.spool_file, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            self.spool_bytes = 0
+            return True
+        
+        logger.info("📤 Replaying %d spooled MQTT messages", len(lines))
+        sent = 0
+        for line in lines:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                sent += 1  # Skip a torn last line
+                continue
+            if not self.is_connected or not self._publish_now(
+                    message['topic'], message['payload'], message['qos'], message['retain']):
+                break
+            sent += 1
+        self.stats['replayed'] += sent
+        
+        # Keep the unsent tail (atomic replace so a crash never loses the spool)
+        remaining = lines[sent:]
+        temp_file = self.spool_file + '.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                f.writelines(remaining)
+            os.replace(temp_file, self.spool_file)
+        except OSError as e:
+            # The spool is still complete, the sent part goes out again (at least once)
+            logger.error("✗ Error rewriting MQTT spool %s: %s", self.spool_file, e)
+            return False
+        self.spool_bytes = sum(len(line) for line in remaining)
+        if not remaining:
+            os.remove(self.spool_file)
+        return not remaining
+    
+    def _on_message(self, client, userdata, msg):
+        """Callback when message received, forwards commands to on_command"""
+        payload = msg.payload.decode(errors='replace').strip()
+        logger.info("📨 Received message on %s: %s", msg.topic, payload)
+        command = msg.topic.rsplit('/', 1)[-1]
+        if self.on_command is None:
+            return
+        try:
+            self.on_command(command, payload)
+        except Exception as e:
+            logger.error("✗ Error handling command %s: %s", command, e)
+    
+    def set_command_handler(self, handler: Optional[Callable[[str, str], None]]):
+        """Set the callback receiving (command, payload) from the command topics"""
+        self.on_command = handler
+    
+    def add_exercise(self, exercise_type: str):
+        """Track a new exercise (e.g. set_exercise command): topics and discovery"""
+        self.exercise_type = exercise_type
+        if exercise_type in self.state_topics:
+            return
+        self.exercise_types.append(exercise_type)
+        self.state_topics[exercise_type] = f"{self.topic_prefix}_{exercise_type}/state"
+        self.config_topics[exercise_type] = f"{self.topic_prefix}_{exercise_type}/config"
+        self.event_topics[exercise_type] = f"{self.topic_prefix}_{exercise_type}/event"
+        if self.max_persons > 1:
+            for person in range(1, self.max_persons + 1):
+                base = f"{self.topic_prefix}_{exercise_type}_person{person}"
+                self.person_state_topics[(exercise_type, person)] = f"{base}/state"
+                self.person_config_topics[(exercise_type, person)] = f"{base}/config"
+                self.event_topics[(exercise_type, person)] = f"{base}/event"
+        if self.is_connected:
+            self.publish_exercise_discovery(exercise_type)
+            for person in range(1, self.max_persons + 1):
+                if (exercise_type, person) in self.person_config_topics:
+                    self.publish_exercise_discovery(exercise_type, person)
+    
+    def publish_discovery(self):
+        """Publish Home Assistant MQTT discovery configuration for every tracked exercise"""
+        for exercise_type in self.exercise_types:
+            self.publish_exercise_discovery(exercise_type)
+            for person in range(1, self.max_persons + 1):
+                if (exercise_type, person) in self.person_config_topics:
+                    self.publish_exercise_discovery(exercise_type, person)
+    
+    def publish_exercise_discovery(self, exercise_type: str, person: Optional[int] = None):
+        """Publish Home Assistant MQTT discovery configuration for one exercise (and person)"""
+        # Display name from exercises.json
+        exercise_name = get_registry().display_name(exercise_type)
+        if person is None:
+            name = f"Good-GYM {exercise_name} Counter"
+            unique_id = f"good_gym_{exercise_type}_counter"
+            state_topic = self.state_topics[exercise_type]
+            config_topic = self.config_topics[exercise_type]
+        else:
+            name = f"Good-GYM {exercise_name} Counter (Person {person})"
+            unique_id = f"good_gym_{exercise_type}_person{person}_counter"
+            state_topic = self.person_state_topics[(exercise_type, person)]
+            config_topic = self.person_config_topics[(exercise_type, person)]
         
         # Discovery configuration for count sensor
         discovery_config = {
-            "name": f"Good-GYM {exercise_name} Counter",
-            "state_topic": self.state_topic,
+            "name": name,
+            "state_topic": state_topic,
             "value_template": "{{ value_json.count }}",
             "unit_of_measurement": "reps",
             "icon": "mdi:run",
-            "json_attributes_topic": self.state_topic,
-            "unique_id": f"good_gym_{self.exercise_type}_counter",
+            "json_attributes_topic": state_topic,
+            "unique_id": unique_id,
             "device": {
                 "identifiers": ["good_gym_addon"],
                 "name": "Good-GYM Exercise Tracker",
@@ -141,51 +490,199 @@ class MQTTPublisher:
         
         # Publish discovery message
         self.client.publish(
-            self.config_topic,
+            config_topic,
             json.dumps(discovery_config),
             qos=1,
             retain=True
         )
         
-        print(f"📢 Published MQTT discovery for {exercise_name}")
+        logger.info("📢 Published MQTT discovery for %s", name)
+        
+        # Latency sensor on the same state topic, so Home Assistant can graph it
+        if self.publish_latency and person is None:
+            latency_config = {
+                "name": f"Good-GYM {exercise_name} Latency",
+                "state_topic": state_topic,
+                "value_template": "{{ value_json.latency_ms }}",
+                "unit_of_measurement": "ms",
+                "state_class": "measurement",
+                "icon": "mdi:timer-outline",
+                "entity_category": "diagnostic",
+                "unique_id": f"good_gym_{exercise_type}_latency",
+                "device": discovery_config["device"],
+            }
+            self.client.publish(
+                f"{self.topic_prefix}_{exercise_type}_latency/config",
+                json.dumps(latency_config),
+                qos=1,
+                retain=True
+            )
+    
+    def _timestamp(self) -> str:
+        """Current UTC timestamp as a JSON string, formatted once per second"""
+        now = int(time.time())
+        if now != self._timestamp_second:
+            self._timestamp_second = now
+            self._timestamp_json = json.dumps(time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)))
+        return self._timestamp_json
     
-    def publish_state(self, count: int, stage: Optional[str], angle: Optional[float], **kwargs):
+    def _static_fragment(self, exercise_type: str, person: Optional[int]) -> str:
+        """JSON members of a state payload that do not change within a session"""
+        key = (exercise_type, person)
+        fragment = self._static_fragments.get(key)
+        if fragment is None:
+            session_start = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.session_start_time))
+            fragment = f'"exercise_type": {json.dumps(exercise_type)}, "session_start": {json.dumps(session_start)}'
+            if person is not None:
+                fragment += f', "person": {int(person)}'
+            self._static_fragments[key] = fragment
+        return fragment
+    
+    def should_publish(self, topic: str, key: tuple, angle: Optional[float], now: float) -> bool:
+        """Decide whether a state is worth sending on a topic"""
+        last = self.last_states.get(topic)
+        if last is None:
+            return True
+        last_key, last_angle, sent_at = last
+        elapsed = now - sent_at
+        if key != last_key or elapsed >= self.heartbeat:
+            return True
+        if elapsed < self.min_interval:
+            return False
+        if (angle is None) != (last_angle is None):
+            return True
+        return angle is not None and abs(angle - last_angle) >= self.angle_delta
+    
+    def publish_state(self, count: int, stage: Optional[str], angle: Optional[float],
+                      exercise_type: Optional[str] = None, person: Optional[int] = None,
+                      force: bool = False, capture_time: Optional[float] = None, **kwargs) -> bool:
         """
-        Publish current exercise state
+        Publish current exercise state if it changed significantly
+        
+        Count and stage changes are sent immediately, angle changes are rate limited
+        and an unchanged state is only repeated every heartbeat seconds.
         
         Args:
             count: Current repetition count
             stage: Current stage (up/down)
             angle: Current angle measurement
+            exercise_type: Exercise the state belongs to (defaults to the tracked exercise)
+            person: Person slot for the per-person sensor (None for the main sensor)
+            force: Send even if nothing changed (e.g. final state on shutdown)
+            capture_time: Capture time of the frame the state comes from (latency tracking)
             **kwargs: Additional attributes to publish
+        
+        Returns:
+            True if the state was queued for sending
         """
-        if not self.is_connected:
-            print("⚠ Not connected to MQTT broker, skipping publish")
-            return
+        exercise_type = exercise_type or self.exercise_type
+        if person is not None:
+            topic = self.person_state_topics.get((exercise_type, person))
+            if topic is None:
+                return False
+        else:
+            topic = self.state_topics.get(exercise_type, self.state_topic)
+        
+        stage = stage or "unknown"
+        angle = round(angle, 2) if angle is not None else None
+        key = (count, stage)
+        now = time.time()
+        if not force and not self.should_publish(topic, key, angle, now):
+            return False
+        
+        # Build state message from the cached fragments
+        parts = [
+            '{"count": ', json.dumps(count),
+            ', "stage": ', json.dumps(stage),
+            ', "angle": ', json.dumps(angle),
+            ', ', self._static_fragment(exercise_type, person),
+            ', "timestamp": ', self._timestamp(),
+        ]
+        if self.publish_latency and capture_time is not None:
+            # Capture until queued; the send queue wait is tracked separately
+            parts += [', "latency_ms": ', json.dumps(round((now - capture_time) * 1000, 1))]
+        for name, value in kwargs.items():
+            parts += [', ', json.dumps(name), ': ', json.dumps(value)]
+        parts.append('}')
+        
+        # Queue state, superseding any unsent state of the same topic
+        self.enqueue(topic, ''.join(parts), qos=0, retain=False, coalesce=True, capture_time=capture_time)
+        self.last_states[topic] = (key, angle, now)
+        return True
+    
+    def publish_rep_event(self, exercise_type: str, event: Dict[str, Any],
+                          person: Optional[int] = None) -> bool:
+        """
+        Publish one completed rep on the event topic (QoS 1, spooled while offline)
         
-        # Build state message
-        state_data = {
-            "count": count,
-            "stage": stage or "unknown",
-            "angle": round(angle, 2) if angle is not None else None,
-            "exercise_type": self.exercise_type,
-            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            "session_start": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.session_start_time)),
+        Args:
+            exercise_type: Exercise the rep belongs to
+            event: Rep event from ExerciseCounter.pop_rep_events
+            person: Person slot for multi-person tracking
+        
+        Returns:
+            True if the event was queued
+        """
+        topic = self.event_topics.get(exercise_type if person is None else (exercise_type, person))
+        if topic is None:
+            return False
+        
+        self.event_seq += 1
+        event_data = {
+            "session": self.event_session,
+            "seq": self.event_seq,
+            "exercise_type": exercise_type,
+            "count": event['count'],
+            "ts": round(event['timestamp'], 3),
+            "duration": round(event['duration'], 2),
+            "min_angle": round(event['min_angle'], 1) if event['min_angle'] is not None else None,
+            "max_angle": round(event['max_angle'], 1) if event['max_angle'] is not None else None,
         }
+        if person is not None:
+            event_data["person"] = person
+        
+        return self.enqueue(topic, json.dumps(event_data, separators=(',', ':')), qos=1, retain=False,
+                            capture_time=event['timestamp'])
+    
+    def publish_keypoints(self, pose: List[Tuple[int, Any, Any]], frame_size: Tuple[int, int],
+                          capture_time: float) -> bool:
+        """
+        Publish the raw pose as a compact binary payload (see decode_keypoints)
         
-        # Add additional attributes
-        state_data.update(kwargs)
+        86 bytes per person plus a 20 byte header, several times smaller than JSON
+        and encoded with a few numpy calls.
         
-        # Publish state
-        try:
-            self.client.publish(
-                self.state_topic,
-                json.dumps(state_data),
-                qos=0,
-                retain=False
-            )
-        except Exception as e:
-            print(f"✗ Error publishing state: {e}")
+        Args:
+            pose: List of (person slot, keypoints (17, 2), scores (17,) or None)
+            frame_size: (width, height) of the frame the coordinates refer to
+            capture_time: Wall-clock capture time of the frame
+        
+        Returns:
+            True if a message was queued (False when disabled or rate limited)
+        """
+        if self.keypoint_rate <= 0:
+            return False
+        now = time.time()
+        if now - self.last_keypoint_time < 1.0 / self.keypoint_rate:
+            return False
+        self.last_keypoint_time = now
+        self.keypoint_seq = (self.keypoint_seq + 1) & 0xFFFFFFFF
+        
+        width, height = frame_size
+        parts = [KEYPOINT_HEADER.pack(KEYPOINT_MAGIC, KEYPOINT_VERSION, len(pose), self.keypoint_seq,
+                                      capture_time, min(int(width), 0xFFFF), min(int(height), 0xFFFF))]
+        for slot, keypoints, scores in pose:
+            coords = np.rint(np.asarray(keypoints, dtype=np.float64)[:17] * KEYPOINT_SCALE)
+            parts.append(bytes((slot & 0xFF,)))
+            parts.append(np.clip(coords, -32768, 32767).astype('<i2').tobytes())
+            if scores is None:
+                parts.append(bytes(17))
+            else:
+                parts.append(np.clip(np.asarray(scores, dtype=np.float64)[:17] * 255, 0, 255)
+                             .astype(np.uint8).tobytes())
+        
+        # Only the latest pose matters, superseded ones are dropped, never spooled
+        return self.enqueue(self.keypoint_topic, b''.join(parts), qos=0, retain=False, coalesce=True)
     
     def publish_status(self, status: str, message: str = ""):
         """
@@ -195,41 +692,32 @@ class MQTTPublisher:
             status: Status string (online, offline, error)
             message: Optional status message
         """
-        if not self.is_connected:
-            return
-        
         status_data = {
             "status": status,
             "message": message,
-            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "timestamp": json.loads(self._timestamp()),
         }
         
-        try:
-            self.client.publish(
-                self.status_topic,
-                json.dumps(status_data),
-                qos=1,
-                retain=True
-            )
-        except Exception as e:
-            print(f"✗ Error publishing status: {e}")
+        # Retained, only the latest status matters
+        self.enqueue(self.status_topic, json.dumps(status_data), qos=1, retain=True, coalesce=True)
     
     def reset_session(self):
         """Reset session start time"""
         self.session_start_time = time.time()
-        print(f"🔄 Session reset at {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        self._static_fragments.clear()
+        self.last_states.clear()
+        logger.info("🔄 Session reset at %s", time.strftime('%Y-%m-%d %H:%M:%S'))
 
 
 if __name__ == "__main__":
     # Test MQTT publisher
-    import os
-    
     config = {
         'host': os.getenv('MQTT_HOST', 'localhost'),
         'port': int(os.getenv('MQTT_PORT', '1883')),
         'username': os.getenv('MQTT_USER', ''),
         'password': os.getenv('MQTT_PASSWORD', ''),
         'topic_prefix': 'homeassistant/sensor/good_gym',
+        'spool_file': 'mqtt_spool.jsonl',
     }
     
     publisher = MQTTPublisher(config, 'squat')
@@ -245,5 +733,5 @@ if __name__ == "__main__":
             time.sleep(1)
         
         publisher.publish_status('online', 'Test completed')
-        time.sleep(1)
+        print(f"Queue stats: {publisher.get_stats()}")
         publisher.disconnect()
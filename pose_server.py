@@ -0,0 +1,197 @@
+"""
+Local pose server for Good-GYM Home Assistant Addon
+Shares the latest pose result with co-located processes over localhost HTTP
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+
+class PoseSnapshot:
+    """Immutable pose result of one frame, serialized on first read"""
+
+    __slots__ = ('seq', 'data', '_json')
+
+    def __init__(self, seq: int, data: Dict[str, Any]):
+        self.seq = seq
+        self.data = data
+        self._json = None
+
+    def to_json(self) -> bytes:
+        """JSON encoding, cached (concurrent readers may both encode, which is harmless)"""
+        if self._json is None:
+            self._json = json.dumps({'seq': self.seq, **self.data}, default=_to_builtin).encode('utf-8')
+        return self._json
+
+
+def _to_builtin(value):
+    """json.dumps fallback for numpy arrays and scalars"""
+    if isinstance(value, np.ndarray):
+        return np.round(value, 2).tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class PoseSnapshotStore:
+    """Latest pose snapshot with lock-free reads
+
+    The frame thread replaces the snapshot reference (an atomic assignment), then
+    swaps in a fresh Event and sets the old one, waking every waiting reader.
+    Readers take the event before reading the snapshot, so an update between the
+    two reads is either visible in the snapshot or wakes them.
+    """
+
+    def __init__(self):
+        self.snapshot: Optional[PoseSnapshot] = None
+        self.changed = threading.Event()
+        self.seq = 0
+
+    def update(self, data: Dict[str, Any]):
+        """Publish a new snapshot (frame thread only, never blocks)"""
+        self.seq += 1
+        self.snapshot = PoseSnapshot(self.seq, data)
+        changed, self.changed = self.changed, threading.Event()
+        changed.set()
+
+    def wait_newer(self, since: int, timeout: float) -> Optional[PoseSnapshot]:
+        """
+        Wait for a snapshot newer than since
+
+        Returns:
+            The snapshot, or None if none arrived within timeout
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            changed = self.changed
+            snapshot = self.snapshot
+            if snapshot is not None and snapshot.seq > since:
+                return snapshot
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not changed.wait(remaining):
+                return None
+
+
+class PoseRequestHandler(BaseHTTPRequestHandler):
+    """GET /pose (optionally long-polling with ?since=&timeout=) and GET /stream (NDJSON)"""
+
+    server_version = 'GoodGymPose/1.0'
+    max_timeout = 30.0
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        store = self.server.store
+        try:
+            since = int(query.get('since', ['-1'])[0])
+            timeout = min(float(query.get('timeout', ['0'])[0]), self.max_timeout)
+            max_rate = float(query.get('max_rate', ['0'])[0])
+        except ValueError:
+            self.send_error(400, 'Invalid query parameter')
+            return
+
+        if url.path == '/pose':
+            snapshot = store.wait_newer(since, timeout) if timeout > 0 else store.snapshot
+            if snapshot is None or snapshot.seq <= since:
+                self.send_response(204)
+                self.end_headers()
+                return
+            body = snapshot.to_json()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif url.path == '/stream':
+            self.stream(store, since, max_rate)
+        else:
+            self.send_error(404, 'Use /pose or /stream')
+
+    def stream(self, store: PoseSnapshotStore, since: int, max_rate: float):
+        """Write every new snapshot as one JSON line until the client disconnects"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        try:
+            while self.server.running:
+                snapshot = store.wait_newer(since, 1.0)
+                if snapshot is None:
+                    continue
+                since = snapshot.seq
+                self.wfile.write(snapshot.to_json() + b'\n')
+                self.wfile.flush()
+                if min_interval:
+                    time.sleep(min_interval)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        # Requests can arrive at frame rate, keep them out of the add-on log
+        pass
+
+
+class PoseServer:
+    """Localhost HTTP server exposing the latest pose result"""
+
+    def __init__(self, port: int, host: str = '127.0.0.1'):
+        """
+        Initialize pose server
+
+        Args:
+            port: TCP port to listen on
+            host: Bind address (localhost only by default)
+        """
+        self.host = host
+        self.port = port
+        self.store = PoseSnapshotStore()
+        self.httpd: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start serving on a background thread"""
+        self.httpd = ThreadingHTTPServer((self.host, self.port), PoseRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.store = self.store
+        self.httpd.running = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        print(f"🛰️  Pose server listening on http://{self.host}:{self.port} (/pose, /stream)")
+
+    def stop(self):
+        """Stop serving"""
+        if self.httpd is not None:
+            self.httpd.running = False
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def update(self, data: Dict[str, Any]):
+        """Publish the result of a frame (called once per processed frame)"""
+        self.store.update(data)
+
+
+if __name__ == "__main__":
+    # Test pose server with synthetic data
+    server = PoseServer(port=8765)
+    server.start()
+    try:
+        count = 0
+        while True:
+            count += 1
+            server.update({
+                'capture_time': time.time(),
+                'count': count // 25,
+                'stage': 'up',
+                'angle': 150.0,
+                'persons': [{'slot': 1, 'keypoints': np.random.rand(17, 2) * 640, 'scores': np.random.rand(17)}],
+            })
+            time.sleep(0.04)
+    except KeyboardInterrupt:
+        server.stop()
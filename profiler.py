@@ -0,0 +1,244 @@
+"""
+On-demand profiler for Good-GYM Home Assistant Addon
+Samples every thread's stack and runs cProfile on the capture thread for a fixed window
+
+Started at runtime (SIGUSR1 or the MQTT 'profile' command), so a slow node can be
+inspected without restarting it. Writes to the output directory:
+
+    profile-<time>.collapsed   Collapsed stacks ("thread;outer;...;inner count"),
+                               input for flamegraph.pl, speedscope or inferno
+    profile-<time>.txt         Hottest functions from the samples and the cProfile summary
+    profile-<time>.prof        Raw cProfile data for pstats / snakeviz
+"""
+import cProfile
+import io
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """Stack sampler plus per-thread cProfile, bounded in duration and CPU overhead"""
+
+    def __init__(self, output_dir: str = '/data/profiles', interval: float = 0.01,
+                 max_duration: float = 300.0, max_overhead: float = 0.02, keep: int = 10):
+        """
+        Initialize profiler
+
+        Args:
+            output_dir: Where profiles are written
+            interval: Seconds between stack samples
+            max_duration: Upper bound for a profiling window (seconds)
+            max_overhead: Fraction of one core the sampler may use; the interval
+                          is widened when sampling gets more expensive than that
+            keep: Number of profiles kept on disk (older ones are deleted)
+        """
+        self.output_dir = output_dir
+        self.interval = interval
+        self.max_duration = max_duration
+        self.max_overhead = max_overhead
+        self.keep = keep
+
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.active = False
+        self.deadline = 0.0
+        # cProfile only sees the thread that enables it, so the capture thread
+        # enables it from on_frame: idle -> pending -> running -> done (or failed)
+        self.cprofile: Optional[cProfile.Profile] = None
+        self.cprofile_state = 'idle'
+        self.last_output: Optional[str] = None
+
+    def start(self, duration: float = 30.0, with_cprofile: bool = True) -> float:
+        """
+        Start a profiling window in the background
+
+        Returns:
+            The duration actually used (clamped to 1..max_duration)
+
+        Raises:
+            ValueError: If a profile is already running, or the capture thread has not
+                        disabled the cProfile of the previous one yet
+        """
+        duration = min(max(float(duration), 1.0), self.max_duration)
+        with self.lock:
+            if self.active:
+                raise ValueError("a profile is already running")
+            if self.cprofile_state == 'running':
+                raise ValueError("the previous cProfile is still enabled, no frame processed since")
+            self.active = True
+            self.deadline = time.monotonic() + duration
+            self.cprofile = cProfile.Profile() if with_cprofile else None
+            self.cprofile_state = 'pending' if with_cprofile else 'idle'
+        self.thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self.thread.start()
+        logger.info("🔬 Profiling for %gs (output: %s)", duration, self.output_dir)
+        return duration
+
+    def on_frame(self):
+        """
+        Enable/disable cProfile on the calling (capture) thread
+
+        Call once per frame while cprofile_state is not 'idle', also after the
+        window ended: a cProfile left running by a stalled frame is disabled here.
+        """
+        with self.lock:
+            if self.cprofile_state == 'pending':
+                try:
+                    self.cprofile.enable()
+                    self.cprofile_state = 'running'
+                except ValueError:
+                    # Another profiler (e.g. a debugger) owns this thread
+                    self.cprofile_state = 'failed'
+            elif self.cprofile_state == 'running' and time.monotonic() >= self.deadline:
+                self.cprofile.disable()
+                # After the window the profile is already written, the result is discarded
+                self.cprofile_state = 'done' if self.active else 'idle'
+
+    def _run(self):
+        """Sampling loop (profiler thread)"""
+        own_ident = threading.get_ident()
+        samples: Counter = Counter()
+        stack_cache: Dict[Tuple, str] = {}
+        names: Dict[int, str] = {}
+        interval = self.interval
+        sample_count = 0
+        sampling_time = 0.0
+        start = time.monotonic()
+        next_sample = start
+        next_names = start
+
+        while True:
+            now = time.monotonic()
+            if now >= self.deadline:
+                break
+            if now >= next_names:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                next_names = now + 1.0
+
+            sample_start = time.perf_counter()
+            for ident, frame in sys._current_frames().items():
+                if ident != own_ident:
+                    samples[self._collapse(names.get(ident, f'thread-{ident}'), frame, stack_cache)] += 1
+            frame = None  # do not keep the sampled stacks alive between samples
+            cost = time.perf_counter() - sample_start
+            sampling_time += cost
+            sample_count += 1
+
+            # Keep the sampler within its CPU budget
+            if cost > interval * self.max_overhead:
+                interval = min(interval * 2, 1.0)
+            next_sample += interval
+            time.sleep(max(next_sample - time.monotonic(), 0.0))
+
+        elapsed = time.monotonic() - start
+        # cProfile is switched off by the next frame after the deadline
+        wait_until = time.monotonic() + 5.0
+        while self.cprofile_state in ('pending', 'running') and time.monotonic() < wait_until:
+            time.sleep(0.05)
+
+        try:
+            self.last_output = self._write(samples, sample_count, elapsed, sampling_time, interval)
+            logger.info("🔬 Profile written to %s.* (%d samples, sampler overhead %.2f%%)",
+                        self.last_output, sample_count, 100 * sampling_time / max(elapsed, 1e-9))
+        except OSError as e:
+            logger.error("✗ Error writing profile: %s", e)
+        finally:
+            with self.lock:
+                if self.cprofile_state == 'running':
+                    # The capture thread stalled; it still owns the profiler and disables it
+                    # on its next frame (start() refuses until then), the result is discarded
+                    self.deadline = 0.0
+                else:
+                    self.cprofile_state = 'idle'
+                self.active = False
+
+    @staticmethod
+    def _collapse(thread_name: str, frame, cache: Dict[Tuple, str]) -> str:
+        """Collapsed stack of a frame, outermost first, cached by code objects"""
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        key = (thread_name, *codes)
+        stack = cache.get(key)
+        if stack is None:
+            names = [f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                     for code in reversed(codes)]
+            stack = ';'.join([thread_name.replace(';', ':')] + [name.replace(';', ':') for name in names])
+            cache[key] = stack
+        return stack
+
+    def _write(self, samples: Counter, sample_count: int, elapsed: float, sampling_time: float,
+               final_interval: float) -> str:
+        """Write the collapsed stacks, summary and cProfile data, return the path prefix"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = os.path.join(self.output_dir, time.strftime('profile-%Y%m%d-%H%M%S'))
+
+        with open(prefix + '.collapsed', 'w', encoding='utf-8') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+        # Self time per function: the innermost frame of each sample
+        leaf_counts: Counter = Counter()
+        thread_counts: Counter = Counter()
+        for stack, count in samples.items():
+            parts = stack.split(';')
+            thread_counts[parts[0]] += count
+            leaf_counts[f"{parts[-1]}  [{parts[0]}]"] += count
+
+        lines = [
+            f"Good-GYM profile {time.strftime('%Y-%m-%d %H:%M:%S')}",
+            f"Duration: {elapsed:.1f}s, samples: {sample_count}, final interval: {final_interval * 1000:.0f}ms, "
+            f"sampler overhead: {sampling_time / max(elapsed, 1e-9):.2%}",
+            "",
+            "Samples per thread:",
+        ]
+        lines += [f"  {count:>7}  {name}" for name, count in thread_counts.most_common()]
+        lines += ["", "Hottest functions (self samples):"]
+        lines += [f"  {count:>7}  {name}" for name, count in leaf_counts.most_common(30)]
+        lines.append("")
+
+        if self.cprofile is not None and self.cprofile_state == 'done':
+            import pstats  # only needed once a profile is written
+            self.cprofile.dump_stats(prefix + '.prof')
+            stream = io.StringIO()
+            pstats.Stats(self.cprofile, stream=stream).sort_stats('cumulative').print_stats(40)
+            lines += ["cProfile (capture thread, sorted by cumulative time):", stream.getvalue()]
+        elif self.cprofile is not None:
+            lines.append(f"cProfile: not available ({self.cprofile_state}, no frames processed in the window?)")
+
+        with open(prefix + '.txt', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        self._prune()
+        return prefix
+
+    def _prune(self):
+        """Delete all but the newest keep profiles"""
+        prefixes = sorted({name.rsplit('.', 1)[0] for name in os.listdir(self.output_dir)
+                           if name.startswith('profile-')})
+        for prefix in prefixes[:-self.keep]:
+            for extension in ('.collapsed', '.txt', '.prof'):
+                path = os.path.join(self.output_dir, prefix + extension)
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+if __name__ == "__main__":
+    # Profile a busy thread for 3 seconds
+    def busy():
+        while True:
+            sum(i * i for i in range(10000))
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    threading.Thread(target=busy, name='busy', daemon=True).start()
+    profiler = SamplingProfiler(output_dir=sys.argv[1] if len(sys.argv) > 1 else './profiles')
+    profiler.start(3.0, with_cprofile=False)
+    profiler.thread.join()
@@ -3,15 +3,21 @@ RTSP Stream Handler for Good-GYM Home Assistant Addon
 Manages RTSP camera connection and frame capture
 """
 import cv2
+import logging
 import time
 import threading
 from typing import Optional, Callable
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
 
 class RTSPHandler:
     """Handle RTSP stream connection and frame capture with automatic reconnection"""
     
+    # Seconds per second the PTS anchor may drift upward (camera clock faster than ours)
+    PTS_DRIFT = 0.001
+    
     def __init__(self, rtsp_url: str, reconnect_interval: int = 5):
         """
         Initialize RTSP handler
@@ -29,6 +35,19 @@ class RTSPHandler:
         self.last_frame: Optional[np.ndarray] = None
         self.frame_count = 0
         self.error_count = 0
+        self.last_decode_ns = 0  # Duration of the last cap.read() (grab + decode)
+        self.connect_count = 0  # Successful connections (the first one is not a reconnect)
+        self.read_errors = 0  # Failed reads since start (error_count resets on success)
+        # cv2.VideoCapture objects created/released by connect()/disconnect(); a gap that
+        # keeps growing means captures (and their FFmpeg buffers) are leaking
+        self.captures_created = 0
+        self.captures_released = 0
+        
+        # Capture clock: stream PTS (CAP_PROP_POS_MSEC) mapped to wall-clock time when the
+        # stream provides it, otherwise the time cap.read() returned
+        self.pts_offset: Optional[float] = None
+        self.last_pts: Optional[float] = None
+        self.timestamp_source = 'read'
         
         # Threading
         self.lock = threading.Lock()
@@ -46,14 +65,14 @@ class RTSPHandler:
             True if connection successful, False otherwise
         """
         try:
-            print(f"🎥 Connecting to RTSP stream: {self.rtsp_url}")
+            logger.info("🎥 Connecting to RTSP stream: %s", self.rtsp_url)
             
             # Release existing connection if any
-            if self.cap is not None:
-                self.cap.release()
+            self._release_capture()
             
             # Create new connection with optimized settings
             self.cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG)
+            self.captures_created += 1
             
             # Force TCP transport (fixes "406 Not Acceptable" errors)
             # CAP_PROP_RTSP_TRANSPORT: 0 = UDP, 1 = TCP, 2 = HTTP
@@ -70,65 +89,74 @@ class RTSPHandler:
             except:
                 pass  # Ignore if not supported
             
+            # New stream, new PTS timeline
+            self.pts_offset = None
+            self.last_pts = None
+            
             # Test connection
             ret, frame = self.cap.read()
             if ret and frame is not None:
                 self.is_connected = True
                 self.error_count = 0
+                self.connect_count += 1
                 
                 # Get stream info
                 width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
                 height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
                 fps = self.cap.get(cv2.CAP_PROP_FPS)
                 
-                print(f"✓ Connected to RTSP stream")
-                print(f"  Resolution: {width}x{height}")
-                print(f"  FPS: {fps}")
+                logger.info("✓ Connected to RTSP stream (resolution: %dx%d, FPS: %s)", width, height, fps)
                 
                 return True
             else:
-                print(f"✗ Failed to read frame from RTSP stream")
+                logger.warning("✗ Failed to read frame from RTSP stream")
                 self.is_connected = False
                 return False
                 
         except Exception as e:
-            print(f"✗ RTSP connection error: {e}")
+            logger.error("✗ RTSP connection error: %s", e)
             self.is_connected = False
             return False
     
     def disconnect(self):
         """Disconnect from RTSP stream"""
+        self._release_capture()
+        self.is_connected = False
+        logger.info("📴 Disconnected from RTSP stream")
+    
+    def _release_capture(self):
+        """Release and drop the current capture object"""
         if self.cap is not None:
             self.cap.release()
             self.cap = None
-        self.is_connected = False
-        print("📴 Disconnected from RTSP stream")
+            self.captures_released += 1
     
     def start_capture(self, on_frame: Optional[Callable] = None):
         """
         Start capturing frames in a separate thread
         
         Args:
-            on_frame: Callback function called for each frame (frame, frame_count)
+            on_frame: Callback function called for each frame (frame, frame_count, capture_time),
+                      capture_time being the wall-clock time the frame was read
         """
         if self.is_running:
-            print("⚠ Capture already running")
+            logger.warning("⚠ Capture already running")
             return
         
         self.on_frame_callback = on_frame
         self.is_running = True
         
-        self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.capture_thread = threading.Thread(target=self._capture_loop, name='rtsp-capture', daemon=True)
         self.capture_thread.start()
         
-        print("▶ Started frame capture thread")
+        logger.info("▶ Started frame capture thread")
     
     def stop_capture(self):
         """Stop capturing frames"""
         self.is_running = False
         if self.capture_thread is not None:
             self.capture_thread.join(timeout=5)
-        print("⏹ Stopped frame capture")
+        logger.info("⏹ Stopped frame capture")
     
     def _capture_loop(self):
         """Main capture loop (runs in separate thread)"""
@@ -139,7 +167,7 @@ class RTSPHandler:
             # Connect if not connected
             if not self.is_connected:
                 if reconnect_attempts < max_reconnect_attempts:
-                    print(f"🔄 Attempting to reconnect... (attempt {reconnect_attempts + 1}/{max_reconnect_attempts})")
+                    logger.info("🔄 Attempting to reconnect... (attempt %d/%d)", reconnect_attempts + 1, max_reconnect_attempts)
                     if self.connect():
                         reconnect_attempts = 0
                     else:
@@ -147,25 +175,29 @@ class RTSPHandler:
                         time.sleep(self.reconnect_interval)
                         continue
                 else:
-                    print(f"✗ Max reconnection attempts reached. Stopping.")
+                    logger.error("✗ Max reconnection attempts reached. Stopping.")
                     if self.on_error_callback:
                         self.on_error_callback("Max reconnection attempts reached")
                     break
             
             # Read frame
             try:
+                read_start = time.perf_counter_ns()
                 ret, frame = self.cap.read()
+                self.last_decode_ns = time.perf_counter_ns() - read_start
+                capture_time = self.capture_timestamp(time.time())
                 
                 if ret and frame is not None:
                     self.frame_count += 1
                     
-                    # Store frame (thread-safe)
+                    # Store frame (thread-safe); cap.read() returns a new array every time
+                    # and nothing writes into it, get_latest_frame() copies on demand
                     with self.lock:
-                        self.last_frame = frame.copy()
+                        self.last_frame = frame
                     
                     # Call callback if provided
                     if self.on_frame_callback:
-                        self.on_frame_callback(frame, self.frame_count)
+                        self.on_frame_callback(frame, self.frame_count, capture_time)
                     
                     # Reset error count on successful read
                     self.error_count = 0
@@ -173,17 +205,18 @@ class RTSPHandler:
                 else:
                     # Frame read failed
                     self.error_count += 1
-                    print(f"⚠ Failed to read frame (error count: {self.error_count})")
+                    self.read_errors += 1
+                    logger.warning("⚠ Failed to read frame (error count: %d)", self.error_count)
                     
                     # Reconnect after multiple errors
                     if self.error_count > 10:
-                        print("🔄 Too many errors, reconnecting...")
+                        logger.warning("🔄 Too many errors, reconnecting...")
                         self.is_connected = False
                         self.disconnect()
                         time.sleep(1)
                     
             except Exception as e:
-                print(f"✗ Error in capture loop: {e}")
+                logger.error("✗ Error in capture loop: %s", e)
                 self.is_connected = False
                 self.disconnect()
                 time.sleep(self.reconnect_interval)
@@ -191,6 +224,38 @@ class RTSPHandler:
         # Cleanup
         self.disconnect()
     
+    def capture_timestamp(self, read_time: float) -> float:
+        """
+        Wall-clock capture time of the frame just read
+        
+        The PTS offset is anchored at the frame that arrived with the least delay,
+        so frames that waited in network or decoder buffers get an earlier capture
+        time than their read time. The anchor may rise by PTS_DRIFT per second to
+        follow camera clock drift.
+        
+        Args:
+            read_time: Wall-clock time cap.read() returned
+        
+        Returns:
+            Capture time (read_time when the stream has no usable PTS)
+        """
+        pts = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        if pts <= 0 or (self.last_pts is not None and pts < self.last_pts):
+            # No PTS, or the timeline restarted: anchor again from the next frame
+            self.pts_offset = None
+            self.last_pts = pts if pts > 0 else None
+            self.timestamp_source = 'read'
+            return read_time
+        
+        offset = read_time - pts
+        if self.pts_offset is None or self.last_pts is None:
+            self.pts_offset = offset
+        else:
+            self.pts_offset = min(offset, self.pts_offset + self.PTS_DRIFT * (pts - self.last_pts))
+        self.last_pts = pts
+        self.timestamp_source = 'pts'
+        return self.pts_offset + pts
+    
     def get_latest_frame(self) -> Optional[np.ndarray]:
         """
         Get the latest captured frame (thread-safe)
@@ -207,6 +272,11 @@ class RTSPHandler:
             'is_connected': self.is_connected,
             'frame_count': self.frame_count,
             'error_count': self.error_count,
+            'read_errors': self.read_errors,
+            'reconnect_count': max(self.connect_count - 1, 0),
+            'timestamp_source': self.timestamp_source,
+            'captures_created': self.captures_created,
+            'captures_open': self.captures_created - self.captures_released,
         }
     
     def __del__(self):
@@ -225,7 +295,7 @@ if __name__ == "__main__":
     
     rtsp_url = sys.argv[1]
     
-    def on_frame(frame, count):
+    def on_frame(frame, count, capture_time):
         if count % 30 == 0:  # Print every 30 frames
             print(f"📸 Frame {count}: {frame.shape}")
     
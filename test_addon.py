@@ -76,7 +76,7 @@ def test_rtsp_handler(rtsp_url):
             print("  Capturing test frames...")
             frame_count = 0
             
-            def on_frame(frame, count):
+            def on_frame(frame, count, capture_time):
                 nonlocal frame_count
                 frame_count = count
                 if count <= 5:
@@ -0,0 +1,8 @@
+"""
+Shared pytest setup for Good-GYM Home Assistant Addon
+The service modules live at the repository root (flat layout)
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,143 @@
+"""
+Calibrator candidate selection, fallback, cache re-evaluation and background CPU subtraction
+"""
+import time
+
+import pytest
+
+pytest.importorskip('cv2')
+
+import calibration  # noqa: E402
+from calibration import Calibrator  # noqa: E402
+
+# Seconds per frame at 320 px, growing with the pixel count
+COST = {'performance': 0.12, 'balanced': 0.04, 'lightweight': 0.01}
+FINGERPRINT = {'cpu': 'test', 'cpus': 4.0, 'backend': 'onnxruntime'}
+
+
+class FakeClock:
+    """Replaces calibration.time: wall and process CPU time only advance when told to"""
+
+    def __init__(self, background=0.0):
+        self.wall = 0.0
+        self.cpu = 0.0
+        # CPU seconds per second used by other threads (the capture thread)
+        self.background = background
+
+    def advance(self, seconds, cpu=0.0):
+        self.wall += seconds
+        self.cpu += cpu + self.background * seconds
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def perf_counter(self):
+        return self.wall
+
+    monotonic = perf_counter
+
+    def process_time(self):
+        return self.cpu
+
+    @staticmethod
+    def strftime(fmt):
+        return time.strftime(fmt)
+
+
+class FakeModel:
+    """Detector and pose model taking COST seconds per frame, on `threads` CPUs"""
+
+    def __init__(self, clock, mode, threads=1.0):
+        self.clock = clock
+        self.cost = COST[mode]
+        self.threads = threads
+
+    def frame_cost(self, frame):
+        return self.cost * (frame.shape[1] / 320) ** 2 / 2
+
+    def det_model(self, frame):
+        cost = self.frame_cost(frame)
+        self.clock.advance(cost, cost * self.threads)
+
+    def pose_model(self, frame, bboxes):
+        cost = self.frame_cost(frame)
+        self.clock.advance(cost, cost * self.threads)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(calibration, 'time', fake)
+    return fake
+
+
+@pytest.fixture
+def calibrator(tmp_path, clock):
+    built = []
+
+    def make(target_fps=10.0, threads=1.0):
+        def build_model(mode):
+            built.append(mode)
+            return FakeModel(clock, mode, threads)
+        return Calibrator(build_model, FINGERPRINT, target_fps=target_fps, max_cpu_share=0.5,
+                          max_resolution=960, cache_file=str(tmp_path / 'calibration.json'), seconds=1.0)
+    make.built = built
+    return make
+
+
+def test_picks_most_accurate_candidate_meeting_target(calibrator):
+    result = calibrator().calibrate()
+
+    # performance misses 10 fps even at 320 px; balanced reaches it up to 480 px
+    assert (result['mode'], result['max_resolution']) == ('balanced', 480)
+    assert result['meets_target'] is True
+    assert result['fps'] == pytest.approx(1 / (0.04 * 1.5 ** 2), abs=0.1)
+    assert result['frame'] == 'synthetic'
+    assert calibrator.built == ['performance', 'balanced']
+
+
+def test_falls_back_to_fastest_when_nothing_meets_target(calibrator):
+    result = calibrator(target_fps=200.0).calibrate()
+
+    assert (result['mode'], result['max_resolution']) == ('lightweight', 320)
+    assert result['meets_target'] is False
+    assert result['fps'] == pytest.approx(100.0, abs=0.1)
+
+
+def test_cpu_limit_rejects_fast_but_heavy_candidates(calibrator):
+    # Four inference threads: balanced@480 keeps up but needs 90% of the 4 CPUs at 10 fps
+    calibrator_ = calibrator(threads=4.0)
+    result = calibrator_.calibrate()
+
+    assert (result['mode'], result['max_resolution']) == ('balanced', 320)
+    assert result['cpu_share'] == pytest.approx(0.4)
+    assert not calibrator_.meets(calibrator_.measurements['balanced@480'])
+
+
+def test_reevaluates_changed_target_from_cache(calibrator):
+    first = calibrator().calibrate()
+    assert first['measured'] == 5
+    calibrator.built.clear()
+
+    again = calibrator().calibrate()
+    assert again['measured'] == 0
+    assert again['frame'] == 'cached'
+    assert (again['mode'], again['max_resolution']) == (first['mode'], first['max_resolution'])
+    assert calibrator.built == []
+
+    # 5 fps: performance@320 (cached) now qualifies, only its larger sizes are timed
+    relaxed = calibrator(target_fps=5.0).calibrate()
+    assert (relaxed['mode'], relaxed['max_resolution']) == ('performance', 320)
+    assert relaxed['measured'] == 3
+    assert calibrator.built == ['performance']
+
+
+def test_subtracts_background_cpu(calibrator, clock):
+    clock.background = 1.5
+    calibrator_ = calibrator()
+    calibrator_.calibrate()
+
+    assert calibrator_.background_cpu == pytest.approx(1.5)
+    for name, result in calibrator_.measurements.items():
+        mode, resolution = name.split('@')
+        assert result['cpu_per_frame'] == pytest.approx(COST[mode] * (int(resolution) / 320) ** 2)
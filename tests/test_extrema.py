@@ -0,0 +1,87 @@
+"""
+ExtremaRepDetector on synthetic sine signals
+"""
+import numpy as np
+import pytest
+
+from exercise_counters import ExtremaRepDetector
+
+
+def sine(periods, period=2.0, rate=10.0, amplitude=50.0, center=120.0, noise=0.0, seed=0):
+    """Angle signal starting at a peak, with a quarter period tail so the last valley is confirmed"""
+    timestamps = np.arange(0.0, (periods + 0.25) * period, 1.0 / rate)
+    angles = center + amplitude * np.cos(2 * np.pi * timestamps / period)
+    if noise:
+        angles += np.random.default_rng(seed).uniform(-noise, noise, len(angles))
+    return angles, timestamps
+
+
+def count_reps(detector, angles, timestamps):
+    events = [detector.update(a, t) for a, t in zip(angles.tolist(), timestamps.tolist())]
+    return events.count('rep'), events
+
+
+@pytest.mark.parametrize('periods', [1, 5, 12])
+def test_counts_one_rep_per_period(periods):
+    angles, timestamps = sine(periods)
+    reps, events = count_reps(ExtremaRepDetector(min_prominence=60), angles, timestamps)
+    assert reps == periods
+    assert events.count('peak') == periods
+
+
+@pytest.mark.parametrize('period, rate', [(4.0, 2.0), (3.0, 2.0), (2.0, 3.0)])
+def test_low_sample_rate(period, rate):
+    # A few samples per rep: threshold crossings would be missed, extrema are not
+    angles, timestamps = sine(8, period=period, rate=rate)
+    reps, _ = count_reps(ExtremaRepDetector(min_prominence=60), angles, timestamps)
+    assert reps == 8
+
+
+def test_noise_below_prominence_is_ignored():
+    angles, timestamps = sine(10, rate=30.0, noise=12.0)
+    reps, _ = count_reps(ExtremaRepDetector(min_prominence=60), angles, timestamps)
+    assert reps == 10
+
+
+def test_small_motion_is_not_a_rep():
+    angles, timestamps = sine(10, amplitude=20.0)
+    reps, events = count_reps(ExtremaRepDetector(min_prominence=60), angles, timestamps)
+    assert reps == 0
+    assert events.count(None) == len(events)
+
+
+def test_min_rep_time():
+    # Valleys every 0.3 s, reps must be 0.5 s apart: every other valley counts
+    angles, timestamps = sine(10, period=0.3, rate=200.0)
+    reps, _ = count_reps(ExtremaRepDetector(min_prominence=60, min_rep_time=0.5), angles, timestamps)
+    assert reps == 5
+
+
+def test_max_rep_time():
+    # 10 s from peak to valley: a drift, not a rep
+    angles, timestamps = sine(3, period=20.0)
+    reps, events = count_reps(ExtremaRepDetector(min_prominence=60, max_rep_time=8.0), angles, timestamps)
+    assert reps == 0
+    assert events.count('valley') == 3
+
+
+def test_last_rep_extrema():
+    period = 2.0
+    angles, timestamps = sine(3, period=period, rate=50.0)
+    detector = ExtremaRepDetector(min_prominence=60)
+    count_reps(detector, angles, timestamps)
+    peak_time, valley_time, peak_angle, valley_angle = detector.last_rep
+    assert peak_angle == pytest.approx(170.0, abs=0.5)
+    assert valley_angle == pytest.approx(70.0, abs=0.5)
+    assert valley_time == pytest.approx(2.5 * period, abs=0.05)
+    assert peak_time == pytest.approx(2.0 * period, abs=0.05)
+
+
+def test_reset():
+    angles, timestamps = sine(2)
+    detector = ExtremaRepDetector(min_prominence=60)
+    count_reps(detector, angles, timestamps)
+    detector.reset()
+    assert detector.last_rep is None
+    reps, _ = count_reps(detector, angles, timestamps)
+    assert reps == 2
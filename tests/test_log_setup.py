@@ -0,0 +1,85 @@
+"""
+log_setup: records are formatted on the listener thread, tracebacks survive the queue
+"""
+import io
+import json
+import logging
+import queue
+import sys
+
+import pytest
+
+import log_setup
+from log_setup import DroppingQueueHandler, JsonFormatter, RateLimitFilter
+
+
+@pytest.fixture
+def json_logging(monkeypatch):
+    """setup_logging with JSON output captured in a buffer"""
+    stream = io.StringIO()
+    monkeypatch.setattr(log_setup.sys, 'stdout', stream)
+    log_setup.setup_logging(fmt='json', burst=2, period=60.0)
+    yield stream
+    log_setup.shutdown_logging()
+
+
+def records(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_prepare_keeps_record_unformatted():
+    handler = DroppingQueueHandler(queue.Queue())
+    record = logging.LogRecord('test', logging.INFO, __file__, 1, "count %d of %s", (3, 'squat'), None)
+    handler.handle(record)
+    queued = handler.queue.get_nowait()
+    assert queued.msg == "count %d of %s"
+    assert queued.args == (3, 'squat')
+    assert queued.getMessage() == "count 3 of squat"
+
+
+def test_exception_field_in_json(json_logging):
+    logger = logging.getLogger('test.exception')
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError:
+        logger.error("✗ Error processing frame: %s", "boom", exc_info=True)
+    log_setup.shutdown_logging()
+
+    entry = records(json_logging)[-1]
+    assert entry['message'] == "✗ Error processing frame: boom"
+    assert 'Traceback' in entry['exception'] and 'RuntimeError: boom' in entry['exception']
+    assert 'Traceback' not in entry['message']
+
+
+def test_queued_record_drops_traceback():
+    handler = DroppingQueueHandler(queue.Queue())
+    try:
+        raise ValueError("bad")
+    except ValueError:
+        record = logging.LogRecord('test', logging.ERROR, __file__, 1, "failed", (), sys.exc_info())
+    handler.handle(record)
+    queued = handler.queue.get_nowait()
+    assert queued.exc_info is None
+    assert 'ValueError: bad' in queued.exc_text
+    assert 'ValueError: bad' in JsonFormatter().format(queued)
+
+
+def test_rate_limit_summarizes_repeats(json_logging):
+    logger = logging.getLogger('test.flapping')
+    for i in range(10):
+        logger.warning("⚠ Failed to read frame (error count: %d)", i)
+    log_setup.shutdown_logging()
+    assert len(records(json_logging)) == 2
+
+
+def test_rate_limit_passes_info():
+    limit = RateLimitFilter(burst=1, period=60.0)
+    record = logging.LogRecord('test', logging.INFO, __file__, 1, "✓ Count updated", (), None)
+    assert all(limit.filter(record) for _ in range(5))
+
+
+def test_full_queue_drops_without_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    for _ in range(3):
+        handler.handle(logging.LogRecord('test', logging.INFO, __file__, 1, "x", (), None))
+    assert handler.dropped == 2
@@ -0,0 +1,252 @@
+"""
+ModelStore against a local HTTP server: Range resume, atomic install, hash checks and offline boots
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import model_store
+from model_store import LOCK_FILE, ModelStore, ModelStoreError
+
+DET = os.urandom(3 * model_store.CHUNK_SIZE + 123)
+POSE = os.urandom(model_store.CHUNK_SIZE // 2)
+
+
+class ArchiveServer(ThreadingHTTPServer):
+    """Serves archives by name, honouring Range; can cut the first response short"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), ArchiveHandler)
+        self.archives = {}
+        self.requests = []
+        # Archive name -> bytes sent before dropping the connection (once)
+        self.cut = {}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        name = self.path.lstrip('/')
+        self.server.requests.append((name, self.headers.get('Range')))
+        data = self.server.archives.get(name)
+        if data is None:
+            self.send_error(404)
+            return
+        start = 0
+        if self.headers.get('Range'):
+            start = int(self.headers['Range'].split('=')[1].split('-')[0])
+            if start >= len(data):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.end_headers()
+        cut = self.server.cut.pop(name, None)
+        self.wfile.write(data[start:cut] if cut is not None else data[start:])
+        if cut is not None:
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+def archive(content):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        zf.writestr('rtmpose/end2end.onnx', content)
+        zf.writestr('rtmpose/pipeline.json', '{}')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def server():
+    srv = ArchiveServer()
+    srv.archives = {'det.zip': archive(DET), 'pose.zip': archive(POSE)}
+    thread = threading.Thread(target=srv.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def manifest(tmp_path, server):
+    def write(det_sha=None, pose_sha=None):
+        path = tmp_path / 'models.json'
+        path.write_text(json.dumps({
+            'version': 1,
+            'base_url': server.url,
+            'models': {
+                'det': {'task': 'det', 'file': 'det.onnx', 'archive': 'det.zip',
+                        'sha256': det_sha or hashlib.sha256(DET).hexdigest(), 'input_size': [416, 416]},
+                'pose': {'task': 'pose', 'file': 'pose.onnx', 'archive': 'pose.zip',
+                         'sha256': pose_sha or hashlib.sha256(POSE).hexdigest(), 'input_size': [192, 256]},
+            },
+            'modes': {'lightweight': {'det': 'det', 'pose': 'pose'}},
+        }), encoding='utf-8')
+        return str(path)
+    return write
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(model_store.time, 'sleep', lambda seconds: None)
+
+
+def make_store(tmp_path, manifest_file, **kwargs):
+    return ModelStore(root=str(tmp_path / 'store'), manifest_file=manifest_file, **kwargs)
+
+
+def test_downloads_and_installs(tmp_path, server, manifest):
+    store = make_store(tmp_path, manifest())
+    files = store.resolve('lightweight')
+
+    assert open(files['det'], 'rb').read() == DET
+    assert open(files['pose'], 'rb').read() == POSE
+    assert files['pose_input_size'] == (192, 256)
+    assert sorted(os.listdir(store.root)) == ['det.onnx', LOCK_FILE, 'pose.onnx']
+    pins = json.loads((store.root / LOCK_FILE).read_text())['files']
+    assert {pin['sha256'] for pin in pins.values()} == {hashlib.sha256(DET).hexdigest(),
+                                                        hashlib.sha256(POSE).hexdigest()}
+    assert store.get_stats()['downloaded'] == 2
+
+
+def test_resumes_part_file_with_range(tmp_path, server, manifest):
+    store = make_store(tmp_path, manifest())
+    store.root.mkdir()
+    offset = len(server.archives['det.zip']) // 2
+    (store.root / 'det.zip.part').write_bytes(server.archives['det.zip'][:offset])
+
+    store.ensure(['det'])
+
+    assert server.requests == [('det.zip', f'bytes={offset}-')]
+    assert (store.root / 'det.onnx').read_bytes() == DET
+    assert not (store.root / 'det.zip.part').exists()
+    assert store.get_stats()['resumed'] == 1
+
+
+def test_resumes_after_interrupted_response(tmp_path, server, manifest):
+    cut = model_store.CHUNK_SIZE + 1000
+    server.cut['det.zip'] = cut
+    store = make_store(tmp_path, manifest())
+
+    store.ensure(['det'])
+
+    assert server.requests == [('det.zip', None), ('det.zip', f'bytes={cut}-')]
+    assert (store.root / 'det.onnx').read_bytes() == DET
+
+
+def test_rejects_hash_mismatch_and_deletes_part(tmp_path, server, manifest):
+    store = make_store(tmp_path, manifest(det_sha='0' * 64), retries=1)
+
+    with pytest.raises(ModelStoreError, match='expected 0000'):
+        store.ensure(['det'])
+
+    assert os.listdir(store.root) == []
+    assert store.get_stats()['rejected'] == 1
+
+
+def test_installs_with_atomic_rename(tmp_path, server, manifest, monkeypatch):
+    renames = []
+    replace = os.replace
+
+    def spy(source, destination):
+        # The target only ever appears complete, renamed from a temporary file of the same directory
+        if str(destination).endswith('.onnx'):
+            assert not os.path.exists(destination)
+            assert os.path.dirname(source) == os.path.dirname(destination)
+            assert open(source, 'rb').read() == DET
+        renames.append((os.path.basename(source), os.path.basename(destination)))
+        replace(source, destination)
+
+    monkeypatch.setattr(model_store.os, 'replace', spy)
+    store = make_store(tmp_path, manifest())
+    store.ensure(['det'])
+
+    installs = [(source, destination) for source, destination in renames if destination == 'det.onnx']
+    assert len(installs) == 1
+    assert installs[0][0].startswith('det.onnx.') and installs[0][0].endswith('.tmp')
+
+
+def test_boots_without_network_when_files_are_valid(tmp_path, server, manifest):
+    manifest_file = manifest()
+    make_store(tmp_path, manifest_file).resolve('lightweight')
+    requests = len(server.requests)
+
+    store = make_store(tmp_path, manifest_file, base_url='http://127.0.0.1:9/')
+    store.resolve('lightweight', fetch=False)
+    store.resolve('lightweight')
+
+    assert len(server.requests) == requests
+    assert store.get_stats()['hashed'] == 0
+    assert store.get_stats()['verified_cached'] == 4
+
+
+def test_refetches_tampered_file(tmp_path, server, manifest):
+    manifest_file = manifest()
+    make_store(tmp_path, manifest_file).ensure(['pose'])
+    path = tmp_path / 'store' / 'pose.onnx'
+    path.write_bytes(b'tampered')
+
+    store = make_store(tmp_path, manifest_file)
+    assert store.find('pose') is None
+    store.ensure(['pose'])
+
+    assert path.read_bytes() == POSE
+    assert store.get_stats()['rejected'] == 1
+
+
+def test_pin_does_not_override_manifest(tmp_path, server, manifest):
+    # A file pinned on first use is still checked against a digest added to the manifest later
+    make_store(tmp_path, manifest()).ensure(['pose'])
+    store = make_store(tmp_path, manifest(pose_sha='f' * 64))
+
+    assert store.find('pose') is None
+    assert store.get_stats()['rejected'] == 1
+
+
+def test_bundled_model_without_digest(tmp_path, server, manifest):
+    manifest_file = manifest()
+    data = json.loads(open(manifest_file).read())
+    data['models']['pose']['sha256'] = None
+    open(manifest_file, 'w').write(json.dumps(data))
+
+    with pytest.raises(ModelStoreError, match='pose'):
+        make_store(tmp_path, manifest_file, strict=True)
+
+    store = make_store(tmp_path, manifest_file, strict=False)
+    assert store.update_manifest() == {'det': hashlib.sha256(DET).hexdigest(),
+                                       'pose': hashlib.sha256(POSE).hexdigest()}
+    assert json.loads(open(manifest_file).read())['models']['pose']['sha256'] == hashlib.sha256(POSE).hexdigest()
+    make_store(tmp_path, manifest_file, strict=True)
+
+
+def test_extra_models_are_trusted_on_first_use(tmp_path, server, manifest):
+    server.archives['custom.zip'] = archive(b'custom model')
+    (tmp_path / 'store').mkdir()
+    (tmp_path / 'store' / model_store.EXTRA_MANIFEST).write_text(json.dumps({
+        'models': {'custom': {'task': 'pose', 'file': 'custom.onnx', 'archive': 'custom.zip',
+                              'sha256': None, 'input_size': [192, 256]}},
+        'modes': {'custom': {'det': 'det', 'pose': 'custom'}},
+    }), encoding='utf-8')
+
+    store = make_store(tmp_path, manifest(), strict=True)
+    files = store.resolve('custom')
+
+    assert open(files['pose'], 'rb').read() == b'custom model'
+    (tmp_path / 'store' / 'custom.onnx').write_bytes(b'changed')
+    assert make_store(tmp_path, manifest()).find('custom') is None
@@ -0,0 +1,44 @@
+"""
+Rep events stay unique across restarts: (session, seq) is the dedupe key
+"""
+import json
+
+import pytest
+
+pytest.importorskip('paho.mqtt.client')
+
+from mqtt_publisher import MQTTPublisher  # noqa: E402
+
+
+def make_publisher(tmp_path):
+    return MQTTPublisher({'host': 'localhost', 'port': 1883, 'spool_file': str(tmp_path / 'spool.jsonl')}, 'squat')
+
+
+def rep(count):
+    return {'count': count, 'timestamp': 1000.0 + count, 'duration': 2.0, 'min_angle': 80.0, 'max_angle': 170.0}
+
+
+def test_events_carry_session_and_seq(tmp_path):
+    pub = make_publisher(tmp_path)
+    for count in (1, 2):
+        assert pub.publish_rep_event('squat', rep(count))
+    events = [json.loads(message[1]) for message in pub.pending_events]
+    assert [e['seq'] for e in events] == [1, 2]
+    assert {e['session'] for e in events} == {pub.event_session}
+
+
+def test_spooled_events_keep_their_session(tmp_path):
+    # First boot: broker down, events go to the spool
+    first = make_publisher(tmp_path)
+    first.publish_rep_event('squat', rep(1))
+    first._spool_pending_events()
+
+    # Second boot: seq restarts, the session tells the events apart
+    second = make_publisher(tmp_path)
+    second.publish_rep_event('squat', rep(1))
+    with open(tmp_path / 'spool.jsonl', encoding='utf-8') as f:
+        spooled = json.loads(json.loads(f.readline())['payload'])
+    fresh = json.loads(second.pending_events[0][1])
+
+    assert spooled['seq'] == fresh['seq'] == 1
+    assert spooled['session'] != fresh['session']
@@ -0,0 +1,47 @@
+"""
+linear_assignment against a brute-force search
+"""
+import itertools
+
+import numpy as np
+import pytest
+
+from core.pose_tracker import linear_assignment
+
+
+def brute_force_cost(cost):
+    """Lowest total cost over every assignment of min(rows, cols) pairs"""
+    rows, cols = cost.shape
+    if rows <= cols:
+        return min(cost[np.arange(rows), list(p)].sum() for p in itertools.permutations(range(cols), rows))
+    return min(cost[list(p), np.arange(cols)].sum() for p in itertools.permutations(range(rows), cols))
+
+
+@pytest.mark.parametrize('seed', range(60))
+def test_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    rows, cols = rng.integers(1, 7, size=2)
+    cost = rng.random((rows, cols))
+    if seed % 3 == 0:
+        # Ties and repeated values
+        cost = np.round(cost * 4) / 4
+
+    row_ind, col_ind = linear_assignment(cost)
+
+    assert len(row_ind) == len(col_ind) == min(rows, cols)
+    assert len(set(row_ind.tolist())) == len(row_ind)
+    assert len(set(col_ind.tolist())) == len(col_ind)
+    assert list(row_ind) == sorted(row_ind)
+    assert cost[row_ind, col_ind].sum() == pytest.approx(brute_force_cost(cost))
+
+
+def test_empty():
+    for shape in [(0, 0), (0, 3), (3, 0)]:
+        row_ind, col_ind = linear_assignment(np.zeros(shape))
+        assert len(row_ind) == len(col_ind) == 0
+
+
+def test_identity_preference():
+    cost = np.ones((4, 4)) - np.eye(4)
+    row_ind, col_ind = linear_assignment(cost)
+    assert row_ind.tolist() == col_ind.tolist() == [0, 1, 2, 3]
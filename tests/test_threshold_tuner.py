@@ -0,0 +1,88 @@
+"""
+threshold_tuner replays must count exactly like the live ExerciseCounter
+"""
+import numpy as np
+import pytest
+
+from exercise_counters import ExerciseCounter
+from exercise_registry import get_registry
+from threshold_tuner import count_leg_reps, count_threshold_reps, smooth_series
+
+
+def angle_keypoints(triplets, left_angle, right_angle):
+    """(17, 2) keypoints whose triplets form the given joint angles"""
+    keypoints = np.zeros((17, 2))
+    for offset, (a, b, c), angle in zip((0.0, 10.0), triplets, (left_angle, right_angle)):
+        theta = np.radians(angle)
+        keypoints[b] = (offset, 0.0)
+        keypoints[a] = (offset + 1.0, 0.0)
+        keypoints[c] = (offset + np.cos(theta), np.sin(theta))
+    return keypoints
+
+
+def random_trace(rng, frames=400):
+    """Noisy reps of random depth and pace, with outliers and pauses"""
+    timestamps = 1000.0 + np.cumsum(rng.uniform(0.03, 0.12, frames))
+    phase = np.cumsum(rng.uniform(0.05, 0.35, frames))
+    left = 120 + 50 * np.cos(phase) + rng.normal(0, 6, frames)
+    right = left + rng.normal(0, 8, frames)
+    spikes = rng.random(frames) < 0.03
+    left[spikes] += rng.normal(0, 60, spikes.sum())
+    return np.clip(left, 5, 175), np.clip(right, 5, 175), timestamps
+
+
+def live_count(exercise_type, left, right, timestamps, smoothing_window=5):
+    """Count a trace frame by frame through count_exercise"""
+    registry = get_registry()
+    kp = registry.configs[exercise_type]['keypoints']
+    triplets = (kp['left'], kp['right'])
+    counter = ExerciseCounter(smoothing_window=smoothing_window, registry=registry)
+    signal = []
+    for l_angle, r_angle, t in zip(left, right, timestamps):
+        keypoints = angle_keypoints(triplets, l_angle, r_angle)
+        sides = registry.strategy(exercise_type).compute(keypoints)
+        signal.append(sides)
+        counter.count_exercise(keypoints, exercise_type, timestamp=t)
+    # The angles the live counter saw (after the keypoint round trip)
+    return counter.counter, np.array(signal)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_threshold_replay_matches_live_counter(seed):
+    rng = np.random.default_rng(seed)
+    left, right, timestamps = random_trace(rng)
+    config = get_registry().configs['squat']
+    assert config['counting_method'] == 'threshold' and not config['is_leg_exercise']
+
+    live, sides = live_count('squat', left, right, timestamps)
+    window = config['smoothing_window'] or 5
+    min_rep_time = config['min_rep_time'] if config['min_rep_time'] is not None else 0.5
+    signal = smooth_series((sides[:, 0] + sides[:, 1]) / 2, window)
+    replay = count_threshold_reps(signal, timestamps, config['down_angle'], config['up_angle'], min_rep_time)
+
+    assert live > 0
+    assert replay == live
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_leg_replay_matches_live_counter(seed):
+    rng = np.random.default_rng(100 + seed)
+    left, right, timestamps = random_trace(rng)
+    config = get_registry().configs['knee_raise']
+    assert config['counting_method'] == 'threshold' and config['is_leg_exercise']
+
+    live, sides = live_count('knee_raise', left, right, timestamps)
+    min_rep_time = config['min_rep_time'] if config['min_rep_time'] is not None else 0.5
+    replay = count_leg_reps(sides[:, 0], sides[:, 1], timestamps,
+                            config['down_angle'], config['up_angle'], min_rep_time)
+
+    assert replay == live
+
+
+@pytest.mark.parametrize('window', [3, 5, 8])
+def test_smooth_series_matches_smooth_angle(window):
+    rng = np.random.default_rng(window)
+    values = rng.normal(100, 30, 200)
+    counter = ExerciseCounter(smoothing_window=window)
+    expected = [counter.smooth_angle(v) for v in values]
+    np.testing.assert_allclose(smooth_series(values, window), expected, rtol=1e-9)
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""
+Threshold auto-tuner for Good-GYM Home Assistant Addon
+Searches angle thresholds, smoothing and rep timing against labeled traces
+
+A trace file is a JSON document recorded from a real session:
+
+    {
+      "exercise_type": "squat",
+      "true_count": 12,
+      "timestamps": [0.0, 0.04, ...],        # seconds, one per frame
+      "keypoints": [[[x, y], ... 17], ...]   # COCO 17 keypoints per frame
+    }
+
+"fps" may be given instead of "timestamps". Every trace is reduced once to
+its left/right joint angles, then each parameter combination is replayed
+with the same rules as ExerciseCounter.count_exercise, using the trace
+timestamps instead of the wall clock. Exercises using the 'extrema'
+counting method are tuned over min_prominence instead of the thresholds.
+"""
+import argparse
+import copy
+import glob
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from exercise_counters import ExtremaRepDetector
+from exercise_registry import ExerciseRegistry
+
+
+# Worker-side state, filled by _init_worker so traces are pickled once per process
+_WORKER_TRACES: Dict[str, List[Dict[str, Any]]] = {}
+_WORKER_SMOOTHED: Dict[Tuple[str, int], List[Tuple[np.ndarray, np.ndarray]]] = {}
+
+
+def load_exercises(exercises_file: str) -> Dict[str, Any]:
+    """Load the raw exercises.json document"""
+    with open(exercises_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_trace(path: str, registry: ExerciseRegistry) -> Optional[Dict[str, Any]]:
+    """
+    Load a labeled trace and reduce it to the per-frame counting signal
+
+    Args:
+        path: Trace JSON file
+        registry: Exercise registry built from the exercises.json being tuned
+
+    Returns:
+        Dict with exercise_type, true_count, timestamps, left and right angles
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    exercise_type = data.get('exercise_type')
+    strategy = registry.strategy(exercise_type)
+    if strategy is None:
+        print(f"⚠ Skipping {path}: unknown exercise type {exercise_type!r}")
+        return None
+
+    points = np.asarray(data['keypoints'], dtype=np.float64)
+    if points.ndim != 3 or points.shape[1] < 17 or len(points) == 0:
+        print(f"⚠ Skipping {path}: keypoints must have shape (frames, 17, 2)")
+        return None
+
+    if 'timestamps' in data:
+        timestamps = np.asarray(data['timestamps'], dtype=np.float64)
+    else:
+        timestamps = np.arange(len(points), dtype=np.float64) / float(data.get('fps', 25))
+
+    # Same strategy code as the live counter, over the whole trace at once
+    left, right = strategy.compute_batch(points)
+
+    # count_exercise bails out before smoothing when either side is missing
+    valid = ~(np.isnan(left) | np.isnan(right))
+    return {
+        'path': path,
+        'exercise_type': exercise_type,
+        'true_count': int(data['true_count']),
+        'timestamps': timestamps[valid],
+        'left': left[valid],
+        'right': right[valid],
+    }
+
+
+def smooth_series(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Vectorized equivalent of ExerciseCounter.smooth_angle over a whole series
+
+    Args:
+        values: Raw (averaged) angles
+        window: Smoothing window length
+
+    Returns:
+        Smoothed angles, one per input value
+    """
+    n = len(values)
+    smoothed = values.astype(np.float64).copy()
+    if n < 3:
+        return smoothed
+
+    # Warm-up: history shorter than the window
+    for i in range(2, min(window - 1, n)):
+        history = values[:i + 1]
+        median = np.median(history)
+        kept = history[np.abs(history - median) <= 2 * np.std(history)]
+        if len(kept) > 0:
+            smoothed[i] = kept.mean()
+
+    if n >= window and window >= 3:
+        windows = np.lib.stride_tricks.sliding_window_view(values, window)
+        median = np.median(windows, axis=1, keepdims=True)
+        std = np.std(windows, axis=1, keepdims=True)
+        mask = np.abs(windows - median) <= 2 * std
+        kept_count = mask.sum(axis=1)
+        sums = np.where(mask, windows, 0.0).sum(axis=1)
+        full = np.where(kept_count > 0, sums / np.maximum(kept_count, 1), values[window - 1:])
+        smoothed[window - 1:] = full
+
+    return smoothed
+
+
+def count_threshold_reps(signal: np.ndarray, timestamps: np.ndarray,
+                         down_angle: float, up_angle: float, min_rep_time: float) -> int:
+    """
+    Replay the up/down state machine of count_exercise
+
+    Jumps between threshold events with searchsorted, so the cost is per
+    rep rather than per frame.
+    """
+    above = np.flatnonzero(signal > up_angle)
+    below = np.flatnonzero((signal < down_angle) & ~(signal > up_angle))
+    if len(above) == 0 or len(below) == 0:
+        return 0
+
+    count = 0
+    position = 0
+    last_count_time = -np.inf
+    while True:
+        # Next frame that puts the counter in the "up" stage
+        a = np.searchsorted(above, position)
+        if a >= len(above):
+            break
+        up_index = above[a]
+
+        # First "down" frame after it that also passes the rep timing check
+        earliest = max(up_index + 1, np.searchsorted(timestamps, last_count_time + min_rep_time))
+        b = np.searchsorted(below, earliest)
+        if b >= len(below):
+            break
+        down_index = below[b]
+
+        count += 1
+        last_count_time = timestamps[down_index]
+        position = down_index + 1
+
+    return count
+
+
+def count_leg_reps(left: np.ndarray, right: np.ndarray, timestamps: np.ndarray,
+                   down_angle: float, up_angle: float, min_rep_time: float) -> int:
+    """Replay count_leg_exercise (independent legs, shared rep timing)"""
+    count = 0
+    last_count_time = -np.inf
+    left_stage = None
+    right_stage = None
+
+    for t, l_angle, r_angle in zip(timestamps.tolist(), left.tolist(), right.tolist()):
+        if t - last_count_time < min_rep_time:
+            continue
+        if l_angle > up_angle:
+            left_stage = 'up'
+        elif l_angle < down_angle and left_stage == 'up':
+            count += 1
+            last_count_time = t
+            left_stage = 'down'
+        if r_angle > up_angle:
+            right_stage = 'up'
+        elif r_angle < down_angle and right_stage == 'up':
+            count += 1
+            last_count_time = t
+            right_stage = 'down'
+
+    return count
+
+
+def count_extrema_reps(signals: List[np.ndarray], timestamps: np.ndarray, min_prominence: float,
+                       min_rep_time: float, max_rep_time: float) -> int:
+    """Replay count_extrema with one detector per signal (one per side for leg exercises)"""
+    count = 0
+    for signal in signals:
+        detector = ExtremaRepDetector(min_prominence, min_rep_time, max_rep_time)
+        for t, angle in zip(timestamps.tolist(), signal.tolist()):
+            if detector.update(angle, t) == 'rep':
+                count += 1
+    return count
+
+
+def _init_worker(traces: Dict[str, List[Dict[str, Any]]]):
+    """Process pool initializer"""
+    _WORKER_TRACES.clear()
+    _WORKER_TRACES.update(traces)
+    _WORKER_SMOOTHED.clear()
+
+
+def _smoothed_traces(exercise_type: str, window: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Smoothed signals per trace, cached per worker"""
+    key = (exercise_type, window)
+    if key not in _WORKER_SMOOTHED:
+        _WORKER_SMOOTHED[key] = [
+            (smooth_series((trace['left'] + trace['right']) / 2, window), trace['timestamps'])
+            for trace in _WORKER_TRACES[exercise_type]
+        ]
+    return _WORKER_SMOOTHED[key]
+
+
+def evaluate_params(exercise_type: str, is_leg_exercise: bool,
+                    params: Dict[str, Any]) -> Tuple[List[int], List[int]]:
+    """
+    Count every trace of an exercise with one parameter combination
+
+    Returns:
+        Tuple of (predicted counts, true counts)
+    """
+    traces = _WORKER_TRACES[exercise_type]
+    truth = [trace['true_count'] for trace in traces]
+
+    if 'min_prominence' in params:
+        if is_leg_exercise:
+            series = [([trace['left'], trace['right']], trace['timestamps']) for trace in traces]
+        else:
+            series = [([signal], timestamps) for signal, timestamps
+                      in _smoothed_traces(exercise_type, params['smoothing_window'])]
+        predicted = [
+            count_extrema_reps(signals, timestamps, params['min_prominence'],
+                               params['min_rep_time'], params['max_rep_time'])
+            for signals, timestamps in series
+        ]
+    elif is_leg_exercise:
+        predicted = [
+            count_leg_reps(trace['left'], trace['right'], trace['timestamps'],
+                           params['down_angle'], params['up_angle'], params['min_rep_time'])
+            for trace in traces
+        ]
+    else:
+        predicted = [
+            count_threshold_reps(signal, timestamps, params['down_angle'],
+                                 params['up_angle'], params['min_rep_time'])
+            for signal, timestamps in _smoothed_traces(exercise_type, params['smoothing_window'])
+        ]
+
+    return predicted, truth
+
+
+def score_counts(predicted: List[int], truth: List[int]) -> Dict[str, float]:
+    """Accuracy metrics for one parameter combination"""
+    predicted_arr = np.asarray(predicted)
+    truth_arr = np.asarray(truth)
+    errors = np.abs(predicted_arr - truth_arr)
+    return {
+        'total_error': int(errors.sum()),
+        'mae': float(errors.mean()),
+        'exact_rate': float((errors == 0).mean()),
+        'count_accuracy': float(1.0 - errors.sum() / max(truth_arr.sum(), 1)),
+    }
+
+
+def _evaluate_chunk(exercise_type: str, is_leg_exercise: bool,
+                    chunk: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """Evaluate a chunk of combinations and return the best one"""
+    best_params = None
+    best_score = None
+    for params in chunk:
+        score = score_counts(*evaluate_params(exercise_type, is_leg_exercise, params))
+        if best_score is None or score['total_error'] < best_score['total_error']:
+            best_params, best_score = params, score
+            if score['total_error'] == 0:
+                break
+    return best_params, best_score
+
+
+def build_grid(config: Dict[str, Any], args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """
+    Build the search space around the current thresholds
+
+    Combinations that flip the up/down ordering of the original
+    configuration are dropped (bicep_curl uses up_angle < down_angle).
+    """
+    down = config['down_angle']
+    up = config['up_angle']
+    span, step = args.angle_span, args.angle_step
+
+    if config.get('counting_method') == 'extrema':
+        windows = args.windows if not config.get('is_leg_exercise', False) else [None]
+        range_of_motion = abs(up - down)
+        return [
+            {
+                'min_prominence': round(float(range_of_motion * fraction), 1),
+                'smoothing_window': w,
+                'min_rep_time': float(mrt),
+                'max_rep_time': config.get('max_rep_time', 8.0),
+            }
+            for fraction, w, mrt in itertools.product(args.prominence_fractions, windows,
+                                                      args.min_rep_times)
+        ]
+
+    down_values = np.arange(down - span, down + span + step / 2, step)
+    up_values = np.arange(up - span, up + span + step / 2, step)
+    windows = args.windows if not config.get('is_leg_exercise', False) else [None]
+
+    grid = []
+    max_value = 180 if config.get('feature', 'angle') == 'angle' else np.inf
+    for d, u, w, mrt in itertools.product(down_values, up_values, windows, args.min_rep_times):
+        if not (0 <= d <= max_value and 0 <= u <= max_value):
+            continue
+        if (u > d) != (up > down) or u == d:
+            continue
+        grid.append({
+            'down_angle': round(float(d), 1),
+            'up_angle': round(float(u), 1),
+            'smoothing_window': w,
+            'min_rep_time': float(mrt),
+        })
+    return grid
+
+
+def tune_exercise(executor: ProcessPoolExecutor, exercise_type: str, config: Dict[str, Any],
+                  args: argparse.Namespace) -> Dict[str, Any]:
+    """Search the grid for one exercise and compare with the current thresholds"""
+    is_leg = config.get('is_leg_exercise', False)
+    grid = build_grid(config, args)
+
+    if config.get('counting_method') == 'extrema':
+        baseline_params = {
+            'min_prominence': config.get('min_prominence')
+                              or 0.6 * abs(config['up_angle'] - config['down_angle']),
+            'smoothing_window': config.get('smoothing_window') or 2,
+            'min_rep_time': config.get('min_rep_time') or 0.5,
+            'max_rep_time': config.get('max_rep_time', 8.0),
+        }
+    else:
+        baseline_params = {
+            'down_angle': config['down_angle'],
+            'up_angle': config['up_angle'],
+            'smoothing_window': config.get('smoothing_window') or 5,
+            'min_rep_time': config.get('min_rep_time') or 0.5,
+        }
+    baseline_future = executor.submit(_evaluate_chunk, exercise_type, is_leg, [baseline_params])
+
+    # Keep one smoothing window per chunk so each worker reuses its cache
+    grid.sort(key=lambda p: (p['smoothing_window'] or 0))
+    chunk_size = max(1, args.chunk_size)
+    futures = [
+        executor.submit(_evaluate_chunk, exercise_type, is_leg, grid[i:i + chunk_size])
+        for i in range(0, len(grid), chunk_size)
+    ]
+
+    best_params, best_score = None, None
+    for future in as_completed(futures):
+        params, score = future.result()
+        if params is None:
+            continue
+        if best_score is None or _is_better(params, score, best_params, best_score, baseline_params):
+            best_params, best_score = params, score
+
+    _, baseline_score = baseline_future.result()
+    return {
+        'exercise_type': exercise_type,
+        'combinations': len(grid),
+        'baseline': {'params': baseline_params, **baseline_score},
+        'best': {'params': best_params, **best_score},
+    }
+
+
+def _is_better(params, score, best_params, best_score, baseline_params) -> bool:
+    """Lower error wins; ties go to the combination closest to the current config"""
+    if score['total_error'] != best_score['total_error']:
+        return score['total_error'] < best_score['total_error']
+    return _distance(params, baseline_params) < _distance(best_params, baseline_params)
+
+
+def _distance(params: Dict[str, Any], baseline: Dict[str, Any]) -> float:
+    if 'min_prominence' in params:
+        return abs(params['min_prominence'] - baseline['min_prominence'])
+    return (abs(params['down_angle'] - baseline['down_angle'])
+            + abs(params['up_angle'] - baseline['up_angle']))
+
+
+def print_report(results: List[Dict[str, Any]]):
+    """Print per-exercise accuracy table"""
+    print("\n" + "="*78)
+    print(f"  {'Exercise':<16}{'Combos':>8}{'Base MAE':>10}{'Base exact':>12}"
+          f"{'Best MAE':>10}{'Best exact':>12}")
+    print("="*78)
+    for result in results:
+        base, best = result['baseline'], result['best']
+        print(f"  {result['exercise_type']:<16}{result['combinations']:>8}"
+              f"{base['mae']:>10.2f}{base['exact_rate']:>11.0%} "
+              f"{best['mae']:>10.2f}{best['exact_rate']:>11.0%}")
+        p = best['params']
+        tuned = ' '.join(f"{key}={value}" for key, value in p.items() if key != 'max_rep_time')
+        print(f"    → {tuned}")
+    print("="*78 + "\n")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Tune exercises.json thresholds against labeled traces")
+    parser.add_argument('traces', nargs='+', help="Trace JSON files or glob patterns")
+    parser.add_argument('--exercises', default=os.path.join('data', 'exercises.json'),
+                        help="Current exercises.json")
+    parser.add_argument('--output', default='exercises.proposed.json',
+                        help="Where to write the proposed exercises.json")
+    parser.add_argument('--report', default=None, help="Optional JSON accuracy report")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=64)
+    parser.add_argument('--angle-span', type=float, default=30.0,
+                        help="Search +/- this many degrees around each threshold")
+    parser.add_argument('--angle-step', type=float, default=5.0)
+    parser.add_argument('--windows', type=int, nargs='+', default=[2, 3, 5, 7, 9])
+    parser.add_argument('--min-rep-times', type=float, nargs='+', default=[0.3, 0.5, 0.8, 1.0])
+    parser.add_argument('--prominence-fractions', type=float, nargs='+',
+                        default=[0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0],
+                        help="min_prominence candidates as fractions of |up_angle - down_angle| "
+                             "(extrema counting only)")
+    args = parser.parse_args(argv)
+
+    document = load_exercises(args.exercises)
+    registry = ExerciseRegistry(args.exercises)
+    exercises = registry.configs
+
+    paths = sorted({p for pattern in args.traces for p in glob.glob(pattern)})
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    for path in paths:
+        trace = load_trace(path, registry)
+        if trace is not None:
+            traces.setdefault(trace['exercise_type'], []).append(trace)
+
+    if not traces:
+        print("✗ No usable traces found")
+        return 1
+
+    print(f"📂 Loaded {sum(len(t) for t in traces.values())} traces "
+          f"for {len(traces)} exercise(s)")
+
+    start = time.time()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(traces,)) as executor:
+        for exercise_type in sorted(traces):
+            print(f"🔍 Tuning {exercise_type} ({len(traces[exercise_type])} traces)...")
+            results.append(tune_exercise(executor, exercise_type, exercises[exercise_type], args))
+    print(f"✓ Search finished in {time.time() - start:.1f}s")
+
+    print_report(results)
+
+    # Only adopt a proposal when it beats the current configuration
+    proposed = copy.deepcopy(document)
+    for result in results:
+        if result['best']['total_error'] >= result['baseline']['total_error']:
+            continue
+        params = result['best']['params']
+        entry = proposed['exercises'][result['exercise_type']]
+        if 'min_prominence' in params:
+            entry['min_prominence'] = params['min_prominence']
+        else:
+            # Distance exercises name their thresholds down_threshold/up_threshold
+            prefix = 'threshold' if 'down_threshold' in entry else 'angle'
+            entry[f'down_{prefix}'] = params['down_angle']
+            entry[f'up_{prefix}'] = params['up_angle']
+        entry['min_rep_time'] = params['min_rep_time']
+        if params['smoothing_window'] is not None:
+            entry['smoothing_window'] = params['smoothing_window']
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(proposed, f, ensure_ascii=False, indent=2)
+    print(f"📝 Proposed exercises written to {args.output}")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"📝 Accuracy report written to {args.report}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())